@@ -0,0 +1,18 @@
+from enum import Enum
+
+
+# static value
+RESULT_CODE_NAME = "result_code"
+RESULT_DETAIL_NAME = "result_detail"
+RESULT_TIME_NAME = "result_time"
+RESULT_FACE_NAME = "result_face_name"
+RESULT_DETECTIONS_NAME = "result_detections"
+
+
+# result code
+class ResultCode(Enum):
+    OK = 0
+    NotInitialized = 1
+    ServerBusy = 2
+    InvalidRequest = 3
+    UnknownError = 99
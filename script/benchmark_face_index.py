@@ -0,0 +1,99 @@
+import argparse
+import json
+import time
+import numpy as np
+from face_index import FaceIndexType, FaceIndexFactory
+
+
+# dimension of face encoding of face_recognition
+ENCODING_DIMENSION = 128
+
+
+def create_argument_parser():
+    parser = argparse.ArgumentParser(description="recall/latency benchmark of face index with synthetic encodings.")
+    parser.add_argument("--gallery_sizes", default="1000,10000,50000",
+                        help="set comma separated gallery sizes. default value is '1000,10000,50000'")
+    parser.add_argument("--query_count", type=int, default=200, help="set query count.")
+    parser.add_argument("--probe_counts", default="1,4,8,16",
+                        help="set comma separated probe counts of IVF index. default value is '1,4,8,16'")
+    parser.add_argument("--seed", type=int, default=0, help="set random seed.")
+    parser.add_argument("--output_json", default=None, help="set file path to save result as json.")
+    return parser
+
+
+def create_synthetic_encodings(gallery_size, query_count, seed):
+    """
+    create synthetic gallery and queries.
+    distance between different people is around 1.3 and distance of the same person is around 0.2,
+    which is similar to encodings of face_recognition.
+    :return: tuple
+        (gallery, queries, answer indices of queries)
+    """
+    rng = np.random.RandomState(seed)
+    gallery = rng.normal(0, 0.08, (gallery_size, ENCODING_DIMENSION)).astype(np.float32)
+    answers = rng.randint(0, gallery_size, query_count)
+    queries = gallery[answers] + rng.normal(0, 0.02, (query_count, ENCODING_DIMENSION)).astype(np.float32)
+    return gallery, queries, answers
+
+
+def measure(face_index, queries, answers):
+    # search one query at a time because frame has only a few faces in real use
+    start_time = time.perf_counter()
+    indices = np.array([face_index.search(queries[i:i + 1])[0][0] for i in range(len(queries))])
+    latency = (time.perf_counter() - start_time) / len(queries)
+    recall = float(np.mean(indices == answers))
+    return recall, latency
+
+
+def main():
+    # get argument from parser
+    args = create_argument_parser().parse_args()
+    gallery_sizes = [int(value) for value in args.gallery_sizes.split(",")]
+    probe_counts = [int(value) for value in args.probe_counts.split(",")]
+
+    results = []
+    print("{:>10} {:>12} {:>6} {:>8} {:>12} {:>10}".format(
+        "gallery", "index", "probe", "recall", "latency[ms]", "build[s]"))
+    for gallery_size in gallery_sizes:
+        gallery, queries, answers = create_synthetic_encodings(gallery_size, args.query_count, args.seed)
+
+        # exact index is the baseline
+        settings = [(FaceIndexType.BRUTE_FORCE, None)] + [(FaceIndexType.IVF, count) for count in probe_counts]
+        ivf_index = None
+        ivf_build_time = None
+        for index_type, probe_count in settings:
+            build_start_time = time.perf_counter()
+            if index_type == FaceIndexType.IVF:
+                # clusters are created once and only probe count is changed
+                if ivf_index is None:
+                    ivf_index = FaceIndexFactory.create(index_type, gallery, seed=args.seed)
+                    ivf_build_time = time.perf_counter() - build_start_time
+                ivf_index.set_probe_count(probe_count)
+                face_index = ivf_index
+                build_time = ivf_build_time
+            else:
+                face_index = FaceIndexFactory.create(index_type, gallery)
+                build_time = time.perf_counter() - build_start_time
+
+            recall, latency = measure(face_index, queries, answers)
+            result = {
+                "gallery_size": gallery_size,
+                "index_type": index_type.name,
+                "probe_count": probe_count,
+                "recall": recall,
+                "latency_ms": latency * 1000,
+                "build_time_sec": build_time
+            }
+            results.append(result)
+            print("{:>10} {:>12} {:>6} {:>8.3f} {:>12.3f} {:>10.3f}".format(
+                gallery_size, index_type.name, "-" if probe_count is None else probe_count,
+                recall, latency * 1000, build_time))
+
+    # save result
+    if args.output_json is not None:
+        with open(args.output_json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
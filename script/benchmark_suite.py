@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import cv2
+from multiprocessing import cpu_count
+from argument_parser_util import convert_model_define
+from neo_wrapper import SageMakerNeoWrapper, NeoParameters
+from stub_dlr_model import StubDLRModel
+from face_matcher import FaceMatcher
+from benchmark_face_index import create_synthetic_encodings
+
+
+# version of result format. it is changed when keys of result are changed
+RESULT_FORMAT_VERSION = 2
+
+
+def create_argument_parser():
+    parser = argparse.ArgumentParser(description="benchmark of detection and face pipelines.")
+    parser.add_argument("--model_types", default="tf_ssd,mx_ssd",
+                        help="set comma separated model types. default value is 'tf_ssd,mx_ssd'")
+    parser.add_argument("--batch_sizes", default="1,4,8", help="set comma separated batch sizes.")
+    parser.add_argument("--input_sizes", default="640x480,1280x720",
+                        help="set comma separated input image sizes(width x height).")
+    parser.add_argument("--gallery_sizes", default="100,1000,10000",
+                        help="set comma separated gallery sizes of face matcher.")
+    parser.add_argument("--face_counts", default="1,4", help="set comma separated face counts of one frame.")
+    parser.add_argument("--import_modules", default="util,model_loader,neo_wrapper,bulk_infer,demo_stream_display",
+                        help="set comma separated modules whose import time is measured in new processes.")
+    parser.add_argument("--import_iterations", type=int, default=5,
+                        help="set count of new processes to measure import time.")
+    parser.add_argument("--iterations", type=int, default=20, help="set iteration count of each measurement.")
+    parser.add_argument("--warmup", type=int, default=3, help="set iteration count before measurement.")
+    parser.add_argument("--real_model", action="store_true",
+                        help="use real DLR model instead of stub (model data is downloaded).")
+    parser.add_argument("--model_root_path", default="model", help="set model root path.")
+    parser.add_argument("--target_device", default="cpu", help="set target device.")
+    parser.add_argument("--stub_run_time", type=float, default=0.0,
+                        help="set time[sec] of stub model per image. default value is 0 (only overhead).")
+    parser.add_argument("--seed", type=int, default=0, help="set random seed.")
+    parser.add_argument("--output_json", default=None, help="set file path to save result as json.")
+    parser.add_argument("--baseline_json", default=None,
+                        help="set result json of previous release to print ratio of latency.")
+    return parser
+
+
+def measure(func, iterations, warmup):
+    """
+    measure latency of func.
+    :return: dict
+        statistics of latency[ms].
+    """
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return get_statistics(latencies)
+
+
+def get_statistics(latencies):
+    """
+    :param latencies: list
+        latency[ms] of each iteration.
+    :return: dict
+    """
+    latencies = np.array(latencies)
+    return {
+        "mean_ms": float(np.mean(latencies)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "min_ms": float(np.min(latencies))
+    }
+
+
+def create_wrapper(args, model_type, is_draw_box):
+    model_define = convert_model_define(model_type)
+    param = NeoParameters(model_define=model_define,
+                          model_root_path=args.model_root_path,
+                          target_device=args.target_device,
+                          is_draw_box=is_draw_box,
+                          warm_up_count=0)
+    wrapper = SageMakerNeoWrapper(param)
+    if args.real_model:
+        wrapper.load()
+    else:
+        wrapper.load(StubDLRModel(model_define.value, run_time_per_image=args.stub_run_time, seed=args.seed))
+    return wrapper
+
+
+def create_images(batch_size, input_size, seed):
+    rng = np.random.RandomState(seed)
+    width, height = input_size
+    return [rng.randint(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(batch_size)]
+
+
+def benchmark_detection(args, model_type, batch_size, input_size):
+    wrapper = create_wrapper(args, model_type, is_draw_box=False)
+    draw_wrapper = create_wrapper(args, model_type, is_draw_box=True)
+    images = create_images(batch_size, input_size, args.seed)
+
+    # the first inference on fresh runtime is measured before other stages
+    warm_up_result = wrapper.warm_up(args.warmup + 1, batch_size)
+
+    # each stage is measured separately with the same input
+    input_tensor = wrapper.preprocess(images)
+    model_output = wrapper.infer(input_tensor)
+    stages = [
+        ("preprocess", lambda: wrapper.preprocess(images)),
+        ("infer", lambda: wrapper.infer(input_tensor)),
+        ("decode", lambda: wrapper.create_result(images, model_output, input_size)),
+        # boxes are drawn into copies not to draw many boxes into the same images
+        ("copy", lambda: [image.copy() for image in images]),
+        ("decode_and_draw", lambda: draw_wrapper.create_result([image.copy() for image in images],
+                                                               model_output, input_size)),
+        ("end_to_end", lambda: wrapper.run(images, input_size)),
+    ]
+    stage_results = {name: measure(func, args.iterations, args.warmup) for name, func in stages}
+
+    # drawing time is estimated from difference of medians
+    draw_ms = stage_results["decode_and_draw"]["p50_ms"] - stage_results["decode"]["p50_ms"] \
+        - stage_results["copy"]["p50_ms"]
+    stage_results["draw"] = {"p50_ms": max(draw_ms, 0.0)}
+    del stage_results["copy"], stage_results["decode_and_draw"]
+
+    end_to_end_ms = stage_results["end_to_end"]["p50_ms"]
+    return {
+        "benchmark": "detection",
+        "model_type": model_type,
+        "batch_size": batch_size,
+        "input_size": "{}x{}".format(*input_size),
+        "stages": stage_results,
+        "warm_up": {"cold_ms": warm_up_result.cold_latency * 1000,
+                    "warm_ms": warm_up_result.get_warm_latency() * 1000},
+        "throughput_images_per_sec": batch_size * 1000 / end_to_end_ms if end_to_end_ms > 0 else None
+    }
+
+
+def benchmark_face_matcher(args, gallery_size, face_count):
+    gallery, queries, _ = create_synthetic_encodings(gallery_size, face_count, args.seed)
+    matcher = FaceMatcher(gallery, ["person{}".format(i) for i in range(gallery_size)])
+    return {
+        "benchmark": "face_matcher",
+        "gallery_size": gallery_size,
+        "face_count": face_count,
+        "stages": {"match": measure(lambda: matcher.match(queries), args.iterations, args.warmup)}
+    }
+
+
+def benchmark_import(args, module_name):
+    """
+    measure import time of module in new processes by "python -X importtime",
+    so modules which are already imported by this script are also measured.
+    :return: dict
+        None if module can't be imported (ex. optional dependency is not installed).
+    """
+    import_times = []
+    module_times = {}
+    for _ in range(args.import_iterations):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module_name)],
+                                 cwd=os.path.dirname(os.path.abspath(__file__)),
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            print("import of {} is failed, skip. {}".format(module_name, process.stderr.strip().splitlines()[-1]))
+            return None
+
+        # line format is "import time: <self[us]> | <cumulative[us]> | <indent><module name>"
+        module_times = {}
+        for line in process.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            self_time, cumulative_time, name = line[len("import time:"):].split("|")
+            if not self_time.strip().isdigit():
+                continue
+            module_times[name.strip()] = int(self_time) / 1000
+            if name == " " + module_name:
+                import_times.append(int(cumulative_time) / 1000)
+
+    # heaviest modules are useful to find modules which should be imported lazily
+    heaviest_modules = sorted(module_times.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        "benchmark": "import",
+        "module": module_name,
+        "stages": {"import": get_statistics(import_times)},
+        "heaviest_modules": [[name, self_ms] for name, self_ms in heaviest_modules]
+    }
+
+
+def get_result_key(result):
+    # key to find the same measurement in baseline
+    keys = [key for key in ("benchmark", "model_type", "batch_size", "input_size", "gallery_size", "face_count",
+                            "module")
+            if key in result]
+    return tuple((key, result[key]) for key in keys)
+
+
+def print_comparison(results, baseline_results):
+    baseline_map = {get_result_key(result): result for result in baseline_results}
+    print("comparison with baseline (ratio of p50 latency. > 1.0 means slower):")
+    for result in results:
+        baseline = baseline_map.get(get_result_key(result))
+        if baseline is None:
+            continue
+        for stage, stats in result["stages"].items():
+            baseline_stats = baseline["stages"].get(stage)
+            if baseline_stats is None or baseline_stats["p50_ms"] <= 0:
+                continue
+            ratio = stats["p50_ms"] / baseline_stats["p50_ms"]
+            print("  {} {} : {:.3f}".format(dict(get_result_key(result)), stage, ratio))
+
+
+def get_environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def main():
+    # get argument from parser
+    args = create_argument_parser().parse_args()
+    model_types = args.model_types.split(",") if args.model_types else []
+    batch_sizes = [int(value) for value in args.batch_sizes.split(",")]
+    input_sizes = [tuple(int(v) for v in value.split("x")) for value in args.input_sizes.split(",")]
+    gallery_sizes = [int(value) for value in args.gallery_sizes.split(",")] if args.gallery_sizes else []
+    face_counts = [int(value) for value in args.face_counts.split(",")]
+    import_modules = args.import_modules.split(",") if args.import_modules else []
+
+    results = []
+    for module_name in import_modules:
+        result = benchmark_import(args, module_name)
+        if result is None:
+            continue
+        results.append(result)
+        print("import {:>20} : {:8.3f}ms (heaviest: {})".format(
+            module_name, result["stages"]["import"]["p50_ms"],
+            ", ".join("{} {:.1f}ms".format(name, self_ms) for name, self_ms in result["heaviest_modules"])))
+
+    for model_type in model_types:
+        for input_size in input_sizes:
+            for batch_size in batch_sizes:
+                result = benchmark_detection(args, model_type, batch_size, input_size)
+                results.append(result)
+                stages = result["stages"]
+                print("{:>7} {:>10} batch {:>3} : preprocess {:8.3f}ms, infer {:8.3f}ms, decode {:8.3f}ms, "
+                      "draw {:8.3f}ms, end to end {:8.3f}ms, {:8.1f} images/sec, cold start {:8.3f}ms".format(
+                        model_type, result["input_size"], batch_size, stages["preprocess"]["p50_ms"],
+                        stages["infer"]["p50_ms"], stages["decode"]["p50_ms"], stages["draw"]["p50_ms"],
+                        stages["end_to_end"]["p50_ms"], result["throughput_images_per_sec"],
+                        result["warm_up"]["cold_ms"]))
+
+    for gallery_size in gallery_sizes:
+        for face_count in face_counts:
+            result = benchmark_face_matcher(args, gallery_size, face_count)
+            results.append(result)
+            print("face matcher gallery {:>7} faces {:>2} : match {:8.3f}ms".format(
+                gallery_size, face_count, result["stages"]["match"]["p50_ms"]))
+
+    output = {
+        "format_version": RESULT_FORMAT_VERSION,
+        "model": "real" if args.real_model else "stub",
+        "iterations": args.iterations,
+        "environment": get_environment(),
+        "results": results
+    }
+
+    # save result
+    if args.output_json is not None:
+        with open(args.output_json, "w") as f:
+            json.dump(output, f, indent=2)
+
+    # compare with result of previous release
+    if args.baseline_json is not None and os.path.exists(args.baseline_json):
+        with open(args.baseline_json, "r") as f:
+            print_comparison(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import os
+import csv
+import json
+import time
+import threading
+import collections
+import cv2
+from multiprocessing import cpu_count
+from concurrent.futures import ThreadPoolExecutor
+from argument_parser_util import create_argument_parser, convert_model_define
+from neo_wrapper import SageMakerNeoWrapper, NeoParameters
+from frame_source import VideoFileFrameSource, list_image_files, IMAGE_EXTENSIONS
+from threaded_capture import ThreadedVideoCapture, CaptureMode
+
+
+def create_bulk_argument_parser():
+    parser = create_argument_parser()
+    parser.description = "run object detection for many images or frames of video in one process."
+    parser.add_argument("--input", required=True, help="set image directory, glob pattern(ex. 'data/**/*.jpg') "
+                                                       "or video file.")
+    parser.add_argument("--output", default="result.jsonl",
+                        help="set output file. format is csv if extension is '.csv', otherwise json lines.")
+    parser.add_argument("--batch_size", type=int, default=8, help="set batch size of inference.")
+    parser.add_argument("--decode_thread_count", type=int, default=cpu_count(), help="set count of decode threads.")
+    parser.add_argument("--threshold", type=float, default=0.5, help="set score threshold.")
+    parser.add_argument("--annotated_image_dir", default=None,
+                        help="set directory to save images with boxes. images are not saved if it is not set.")
+    parser.add_argument("--progress_interval", type=int, default=1000, help="set image count to print progress.")
+    return parser
+
+
+class AsyncImageWriter:
+    def __init__(self, output_dir, thread_count=2, max_pending_count=64):
+        """
+        initialize writer which encodes and saves images on other threads.
+        :param output_dir: str
+        :param thread_count: int
+        :param max_pending_count: int
+            "write" blocks while this count of images are not saved yet not to use too much memory.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self.__output_dir = output_dir
+        self.__executor = ThreadPoolExecutor(max_workers=thread_count)
+        self.__semaphore = threading.BoundedSemaphore(max_pending_count)
+        self.__failed_count = 0
+        self.__failed_count_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, file_name, image):
+        """
+        :param file_name: str
+            relative path from output directory. its directory is created if it doesn't exist.
+        :param image: numpy.ndarray
+        """
+        self.__semaphore.acquire()
+        future = self.__executor.submit(self.__write, os.path.join(self.__output_dir, file_name), image)
+        future.add_done_callback(lambda f: self.__semaphore.release())
+
+    def close(self):
+        """
+        wait until all images are saved.
+        """
+        self.__executor.shutdown()
+
+    def get_failed_count(self):
+        return self.__failed_count
+
+    def __write(self, file_path, image):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if not cv2.imwrite(file_path, image):
+            # images are written on several threads
+            with self.__failed_count_lock:
+                self.__failed_count += 1
+            print("failed to save {}!".format(file_path))
+
+
+class JsonLinesResultWriter:
+    def __init__(self, output_path, classes):
+        """
+        write one line per image. format is
+        {"name": name, "width": width, "height": height,
+         "detections": [{"class_id": id, "class_name": name, "score": score, "box": [bottom, left, top, right]}]}
+        image which can't be decoded has "error" instead of "detections".
+        """
+        self.__file = open(output_path, "w")
+        self.__classes = classes
+
+    def write(self, name, image_size, detections):
+        record = {"name": name, "width": image_size[0], "height": image_size[1], "detections": [
+            {"class_id": int(cid), "class_name": self.__classes[cid], "score": round(float(score), 4),
+             "box": [round(float(value), 1) for value in box]}
+            for cid, score, box in zip(*detections)
+        ]}
+        self.__file.write(json.dumps(record) + "\n")
+
+    def write_error(self, name, error):
+        self.__file.write(json.dumps({"name": name, "error": error}) + "\n")
+
+    def close(self):
+        self.__file.close()
+
+
+class CsvResultWriter:
+    HEADER = ["name", "class_id", "class_name", "score", "bottom", "left", "top", "right", "error"]
+
+    def __init__(self, output_path, classes):
+        """
+        write one row per detection. image without detection has no row.
+        image which can't be decoded or inferred has one row with empty detection columns and "error".
+        """
+        self.__file = open(output_path, "w", newline="")
+        self.__writer = csv.writer(self.__file)
+        self.__writer.writerow(self.HEADER)
+        self.__classes = classes
+
+    def write(self, name, image_size, detections):
+        for cid, score, box in zip(*detections):
+            self.__writer.writerow([name, int(cid), self.__classes[cid], round(float(score), 4)] +
+                                   [round(float(value), 1) for value in box] + [""])
+
+    def write_error(self, name, error):
+        self.__writer.writerow([name] + [""] * (len(self.HEADER) - 2) + [error])
+
+    def close(self):
+        self.__file.close()
+
+
+def create_result_writer(output_path, classes):
+    if os.path.splitext(output_path)[1].lower() == ".csv":
+        return CsvResultWriter(output_path, classes)
+    return JsonLinesResultWriter(output_path, classes)
+
+
+def decode_image_files(file_paths, thread_count, max_in_flight_count):
+    """
+    decode images on thread pool. cv2 releases GIL while decoding.
+    :return: generator of tuple
+        (file path, image) in order of file paths. image is None if it can't be decoded.
+    """
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        pending = collections.deque()
+        for file_path in file_paths:
+            pending.append((file_path, executor.submit(cv2.imread, file_path)))
+
+            # decode only a limited count of images ahead not to use too much memory
+            if len(pending) >= max_in_flight_count:
+                file_path, future = pending.popleft()
+                yield file_path, future.result()
+
+        while pending:
+            file_path, future = pending.popleft()
+            yield file_path, future.result()
+
+
+def read_video_frames(file_path, buffer_size):
+    """
+    decode frames of video on capture thread.
+    :return: generator of tuple
+        (name of frame, frame)
+    """
+    base_name = os.path.basename(file_path)
+    with ThreadedVideoCapture(VideoFileFrameSource(file_path), CaptureMode.EVERY, buffer_size) as cap:
+        while True:
+            captured_frame = cap.read_frame()
+            if captured_frame is None:
+                return
+            yield "{}#{:08d}".format(base_name, captured_frame.index), captured_frame.frame
+
+
+def get_image_base_dir(file_paths):
+    """
+    get the deepest directory which has all images.
+    :param file_paths: list
+    :return: str
+        None if file_paths is empty.
+    """
+    if not file_paths:
+        return None
+    return os.path.commonpath([os.path.dirname(os.path.abspath(file_path)) for file_path in file_paths])
+
+
+def get_annotated_file_name(name, base_dir=None):
+    """
+    get file name of annotated image.
+    :param name: str
+        image file path or name of video frame.
+    :param base_dir: str
+        relative path of image from it is kept, so images which have the same name in other directories
+        don't overwrite each other.
+    :return: str
+    """
+    # name of video frame is "video file name#frame index"
+    base_name = os.path.basename(name)
+    if "#" in base_name:
+        video_name, frame_index = base_name.rsplit("#", 1)
+        stem = "{}_{}".format(os.path.splitext(video_name)[0], frame_index)
+    elif base_dir is not None:
+        stem = os.path.splitext(os.path.relpath(os.path.abspath(name), base_dir))[0]
+    else:
+        stem = os.path.splitext(base_name)[0]
+    return stem + "_with_boxes.jpg"
+
+
+def create_batches(named_images, batch_size, result_writer):
+    batch = []
+    for name, image in named_images:
+        if image is None:
+            result_writer.write_error(name, "image can't be decoded!")
+            continue
+
+        batch.append((name, image))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    # get argument from parser
+    args = create_bulk_argument_parser().parse_args()
+
+    # load model only once for all images
+    param = NeoParameters(model_define=convert_model_define(args.model_type),
+                          model_root_path=args.model_root_path,
+                          target_device=args.target_device,
+                          threshold=args.threshold,
+                          is_draw_box=args.annotated_image_dir is not None,
+                          max_batch_size=args.batch_size)
+    wrapper = SageMakerNeoWrapper(param)
+    wrapper.load()
+
+    # get input images
+    base_dir = None
+    if os.path.isfile(args.input) and os.path.splitext(args.input)[1].lower() not in IMAGE_EXTENSIONS:
+        named_images = read_video_frames(args.input, args.batch_size * 2)
+    else:
+        file_paths = list_image_files(args.input) if not os.path.isfile(args.input) else [args.input]
+        print("{} images are found.".format(len(file_paths)))
+        named_images = decode_image_files(file_paths, args.decode_thread_count, args.batch_size * 4)
+        base_dir = get_image_base_dir(file_paths)
+
+    result_writer = create_result_writer(args.output, wrapper.get_classes())
+    image_writer = AsyncImageWriter(args.annotated_image_dir) if args.annotated_image_dir is not None else None
+
+    # decoding of next images is overlapped with inference of current batch
+    image_count = 0
+    failed_count = 0
+    next_progress_count = args.progress_interval
+    start_time = time.time()
+    try:
+        for batch in create_batches(named_images, args.batch_size, result_writer):
+            names, images = map(list, zip(*batch))
+            output_sizes = [(image.shape[1], image.shape[0]) for image in images]
+            image_count += len(images)
+            try:
+                result = wrapper.run(images, output_sizes)
+            except Exception as e:
+                # failed batch is recorded and other batches are continued
+                print("failed to run batch of {} images! {}".format(len(images), e))
+                failed_count += len(images)
+                for name in names:
+                    result_writer.write_error(name, "failed to run inference! {}".format(e))
+                continue
+
+            detections = result.get_detections()
+            for i, name in enumerate(names):
+                result_writer.write(name, output_sizes[i], detections.get_image_detections(i))
+                if image_writer is not None:
+                    image_writer.write(get_annotated_file_name(name, base_dir), images[i])
+
+            if image_count >= next_progress_count:
+                next_progress_count += args.progress_interval
+                print("{} images are processed. {:.2f} images/sec".format(
+                    image_count, image_count / (time.time() - start_time)))
+    finally:
+        result_writer.close()
+        if image_writer is not None:
+            image_writer.close()
+
+    process_time = time.time() - start_time
+    print("{} images are processed in {:.2f} sec. {:.2f} images/sec".format(
+        image_count, process_time, image_count / process_time if process_time > 0 else 0))
+    if failed_count > 0:
+        print("inference of {} images is failed.".format(failed_count))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
 import cv2
+import time
 from argument_parser_util import create_argument_parser, convert_model_define
 from neo_wrapper import SageMakerNeoWrapper, NeoParameters
+from neo_pipeline import NeoInferencePipeline
+from threaded_capture import ThreadedVideoCapture
+from frame_source import FrameSourceFactory
 from enum import Enum
 
 
@@ -38,39 +42,71 @@ def prepare_neo_wrapper(args):
     return wrapper
 
 
+def read_frames(cap, display_size, max_read_failure_count=30):
+    failure_count = 0
+    while True:
+        # read the newest frame of video capture
+        ret, capture_image = cap.read()
+        if (ret == False):
+            # dropped frame of camera is retried, and stream is ended only after continuous failures (ex. end of file)
+            failure_count += 1
+            if failure_count >= max_read_failure_count:
+                return
+            continue
+        failure_count = 0
+
+        # boxes are scaled to display size, so frame of file source is resized to it
+        if (capture_image.shape[1], capture_image.shape[0]) != display_size:
+            capture_image = cv2.resize(capture_image, display_size)
+        yield capture_image
+
+
 def main():
     # get argument from parser
     parser = create_argument_parser()
     parser.add_argument("--display_type", default="vga")
+    parser.add_argument(
+        "--source",
+        default="0",
+        help="set frame source. camera index(ex. '0'), video file, image directory(or glob pattern) "
+             "or 'synthetic'(ex. 'synthetic:300'). default value is '0'"
+    )
+    parser.add_argument("--headless", action="store_true", help="don't display frames (ex. benchmark on server).")
     args = parser.parse_args()
 
     # get neo wrapper
     wrapper = prepare_neo_wrapper(args)
 
     # get capture
-    cap = cv2.VideoCapture(0)
     display_size = convert_display_type(args.display_type)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, display_size[0])
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, display_size[1])
+    source = FrameSourceFactory.create_from_argument(args.source, size=display_size)
 
     # start loop
-    while True:
-        # read video capture
-        ret, capture_image = cap.read()
-        if (ret == False):
-            continue
-
-        # get result
-        out = wrapper.run(original_images=[capture_image], output_size=display_size)
-
-        # display image with bounding boxes
-        out_frame = out.get_images()[0]
-        cv2.imshow('Single-Threaded Detection', out_frame)
-        if cv2.waitKey(10) & 0xFF == ord('q'):
-            break
-
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+    # (frames are read on capture thread, and stale frames of live source are dropped while inference is running)
+    # (frames of file source are not dropped and they are read as fast as possible)
+    # (preprocessing, inference and drawing of continuous frames are overlapped by pipeline)
+    frame_count = 0
+    start_time = time.time()
+    with ThreadedVideoCapture(source) as threaded_cap, \
+            NeoInferencePipeline(wrapper, output_size=display_size) as pipeline:
+        for out in pipeline.stream(read_frames(threaded_cap, display_size)):
+            frame_count += 1
+            if args.headless:
+                continue
+
+            # display image with bounding boxes
+            out_frame = out.get_images()[0]
+            cv2.imshow('Pipelined Detection', out_frame)
+            if cv2.waitKey(10) & 0xFF == ord('q'):
+                break
+        process_time = time.time() - start_time
+        print("processed frame count is {}, fps is {:.2f}".format(frame_count, frame_count / process_time))
+        print("captured frame count is {}, dropped frame count is {}".format(
+            threaded_cap.get_captured_count(), threaded_cap.get_dropped_count()))
+
+    if not args.headless:
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,433 @@
+import os
+import time
+import json
+import shutil
+import hashlib
+import argparse
+import util
+
+# network and archive modules are imported only when files are downloaded,
+# because model loaders check downloaded files on every start
+
+
+# suffix of file which is being downloaded
+PART_FILE_SUFFIX = ".part"
+
+# suffix of file which has size and sha256 of downloaded file.
+# file is trusted only if it has this file, so broken file of interrupted download is not used
+VERIFIED_FILE_SUFFIX = ".verified"
+
+
+class DownloadArtifact:
+    def __init__(self, url, path, size=None, sha256=None):
+        """
+        file to download.
+        :param url: str
+        :param path: str
+            file path to save.
+        :param size: int
+            expected byte size. it is checked if it is not None.
+        :param sha256: str
+            expected hex digest of SHA-256. it is checked if it is not None.
+        """
+        self.url = url
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    @classmethod
+    def from_manifest(cls, url, path, manifest):
+        """
+        create artifact with expected size and hash in manifest.
+        :param url: str
+        :param path: str
+        :param manifest: dict
+            {file name: {"size": size, "sha256": hex digest}}. file name is basename of url.
+        :return: DownloadArtifact
+        """
+        entry = (manifest or {}).get(os.path.basename(url), {})
+        return cls(url, path, entry.get("size"), entry.get("sha256"))
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ChecksumError(DownloadError):
+    pass
+
+
+class IncompleteDownloadError(OSError):
+    pass
+
+
+class ArchiveMemberError(DownloadError):
+    pass
+
+
+class DownloadManager:
+    def __init__(self, max_workers=4, chunk_size=1 << 20, retry_count=3, timeout=30, cache=None, debug_mode=True):
+        """
+        initialize manager which downloads files concurrently.
+        file is written into "<path>.part" and renamed after it is verified,
+        so the path never has a broken file. interrupted download is resumed by HTTP range request.
+        :param max_workers: int
+            count of concurrent downloads.
+        :param chunk_size: int
+            byte size of each read.
+        :param retry_count: int
+            count of retry for network error. download is resumed from the received bytes.
+        :param timeout: float
+            timeout[sec] of connection and each read.
+        :param cache: ModelCache
+            if it is set, each file is downloaded only once into cache and linked from it.
+        :param debug_mode: bool
+        """
+        self.__max_workers = max_workers
+        self.__chunk_size = chunk_size
+        self.__retry_count = retry_count
+        self.__timeout = timeout
+        self.__cache = cache
+        self.__debug_mode = debug_mode
+
+    def download_all(self, artifacts):
+        """
+        download all artifacts. artifacts which are already downloaded are skipped.
+        :param artifacts: list of DownloadArtifact
+        :return: list
+            paths of artifacts.
+        """
+        if not artifacts:
+            return []
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(self.__max_workers, len(artifacts))) as executor:
+            futures = [executor.submit(self.download, artifact) for artifact in artifacts]
+
+            # wait all downloads to raise error after other downloads are finished
+            errors = []
+            for artifact, future in zip(artifacts, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append("{} : {}".format(artifact.url, e))
+        if errors:
+            raise DownloadError("failed to download {} files!\n{}".format(len(errors), "\n".join(errors)))
+        return [artifact.path for artifact in artifacts]
+
+    def download(self, artifact):
+        """
+        download one artifact.
+        :param artifact: DownloadArtifact
+        :return: str
+            path of artifact.
+        """
+        if is_downloaded(artifact):
+            if self.__debug_mode:
+                print("File {} existed, skip.".format(artifact.path))
+            return artifact.path
+
+        if self.__cache is None:
+            self.__download_file(artifact)
+            write_verified_info(artifact.path, artifact.sha256)
+            return artifact.path
+
+        # other processes wait until file is downloaded into cache
+        is_cached = self.__cache.get_file(
+            artifact.url, artifact.path,
+            lambda temp_path: self.__download_file(
+                DownloadArtifact(artifact.url, temp_path, artifact.size, artifact.sha256)),
+            artifact.sha256)
+        write_verified_info(artifact.path, artifact.sha256)
+        if is_cached and self.__debug_mode:
+            print("File {} is linked from model cache.".format(artifact.path))
+        return artifact.path
+
+    def __download_file(self, artifact):
+        dir_path = os.path.dirname(artifact.path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        part_path = artifact.path + PART_FILE_SUFFIX
+
+        total_size = self.__run_with_retry(artifact.url, lambda: self.__download_to_part_file(artifact, part_path))
+
+        # verify before rename. broken file is removed not to resume from it
+        try:
+            verify_file(part_path, artifact.size if artifact.size is not None else total_size, artifact.sha256)
+        except ChecksumError:
+            os.remove(part_path)
+            raise
+        os.replace(part_path, artifact.path)
+        if self.__debug_mode:
+            print("Downloaded from url {} to {}".format(artifact.url, artifact.path))
+        return artifact.path
+
+    def download_and_extract(self, url, member_paths, manifest=None):
+        """
+        extract files from tar archive while it is downloaded. archive is not written into disk,
+        and download is finished as soon as all files are extracted.
+        stream of compressed archive can't be resumed, so it is restarted on network error.
+        :param url: str
+            url of tar archive (it can be compressed).
+        :param member_paths: dict
+            {member name in archive: file path to save}. other members are skipped.
+        :param manifest: dict
+            {file name: {"size": size, "sha256": hex digest}}. file name is basename of member.
+        :return: list
+            paths of extracted files.
+        """
+        remaining_paths = {self.__normalize_member_name(name): path for name, path in member_paths.items()
+                           if not is_extracted(name, path, manifest)}
+        if not remaining_paths:
+            return list(member_paths.values())
+
+        if self.__cache is None:
+            self.__run_with_retry(url, lambda: self.__extract_from_stream(url, dict(remaining_paths), manifest))
+            self.__write_extracted_info(remaining_paths, manifest)
+            return list(member_paths.values())
+
+        # archive is extracted only once into cache, and each member is cached by url and member name
+        with self.__cache.lock(url):
+            keys = {name: "{}!{}".format(url, name) for name in remaining_paths}
+            hashes = {name: (manifest or {}).get(os.path.basename(name), {}).get("sha256") for name in remaining_paths}
+            missing_paths = {name: path for name, path in remaining_paths.items()
+                             if not self.__cache.link(keys[name], path, hashes[name])}
+            temp_paths = {name: self.__cache.get_temp_path(keys[name]) for name in missing_paths}
+            if temp_paths:
+                remaining_temp_paths = dict(temp_paths)
+                self.__run_with_retry(url, lambda: self.__extract_from_stream(url, remaining_temp_paths, manifest))
+            for name, path in missing_paths.items():
+                self.__cache.put(keys[name], temp_paths[name], hashes[name])
+                if not self.__cache.link(keys[name], path, hashes[name]):
+                    raise DownloadError("{} is evicted from cache while it is linked!".format(keys[name]))
+        self.__write_extracted_info(remaining_paths, manifest)
+        self.__cache.evict()
+        return list(member_paths.values())
+
+    @staticmethod
+    def __write_extracted_info(member_paths, manifest):
+        for name, path in member_paths.items():
+            write_verified_info(path, (manifest or {}).get(os.path.basename(name), {}).get("sha256"))
+
+    def __extract_from_stream(self, url, remaining_paths, manifest):
+        import tarfile
+        import urllib.request
+        with urllib.request.urlopen(url, timeout=self.__timeout) as response:
+            # "r|*" reads archive sequentially, so each member is extracted while bytes arrive
+            with tarfile.open(fileobj=response, mode="r|*") as tar:
+                for member in tar:
+                    name = self.__normalize_member_name(member.name)
+                    path = remaining_paths.get(name)
+                    if path is None:
+                        continue
+                    if not util.is_safe_tar_member(member) or not member.isfile():
+                        raise ArchiveMemberError("{} in {} is not regular file!".format(member.name, url))
+
+                    self.__extract_member(tar, member, path, manifest)
+                    del remaining_paths[name]
+                    if not remaining_paths:
+                        # rest of archive is not needed
+                        return
+
+        raise ArchiveMemberError("{} are not found in {}!".format(list(remaining_paths.keys()), url))
+
+    def __extract_member(self, tar, member, path, manifest):
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+
+        # write into part file and rename it after it is verified like download
+        part_path = path + PART_FILE_SUFFIX
+        with tar.extractfile(member) as src, open(part_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, self.__chunk_size)
+        entry = (manifest or {}).get(os.path.basename(member.name), {})
+        try:
+            verify_file(part_path, entry.get("size", member.size), entry.get("sha256"))
+        except ChecksumError:
+            os.remove(part_path)
+            raise
+        os.replace(part_path, path)
+        if self.__debug_mode:
+            print("Extracted {} to {}".format(member.name, path))
+
+    def __run_with_retry(self, url, func):
+        import tarfile
+        import urllib.error
+        for retry in range(self.__retry_count + 1):
+            try:
+                return func()
+            except (urllib.error.URLError, OSError, EOFError, tarfile.ReadError) as e:
+                if isinstance(e, urllib.error.HTTPError) and e.code != 416 and e.code < 500:
+                    raise DownloadError("HTTP error {} : {}".format(e.code, url))
+                if retry == self.__retry_count:
+                    raise DownloadError("download is failed after {} retries. {}".format(retry, e))
+                print("download of {} is interrupted and it is retried. {}".format(url, e))
+                time.sleep(min(2 ** retry, 10))
+
+    @staticmethod
+    def __normalize_member_name(name):
+        name = name.replace("\\", "/")
+        while name.startswith("./"):
+            name = name[2:]
+        return name
+
+    def __download_to_part_file(self, artifact, part_path):
+        # resume from the received bytes
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if artifact.size is not None and offset == artifact.size:
+            return artifact.size
+        if artifact.size is not None and offset > artifact.size:
+            offset = 0
+
+        import urllib.request
+        import urllib.error
+        request = urllib.request.Request(artifact.url)
+        if offset > 0:
+            request.add_header("Range", "bytes={}-".format(offset))
+        try:
+            response = urllib.request.urlopen(request, timeout=self.__timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset > 0:
+                # range is not satisfiable if part file is already complete (it is verified later)
+                return None
+            raise
+
+        with response:
+            if offset > 0 and response.status != 206:
+                # server doesn't support range request, so download is restarted
+                offset = 0
+            total_size = get_total_size(response, offset)
+
+            with open(part_path, "ab" if offset > 0 else "wb") as f:
+                while True:
+                    chunk = response.read(self.__chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+
+        # connection is closed before all bytes are received
+        received_size = os.path.getsize(part_path)
+        if total_size is not None and received_size < total_size:
+            raise IncompleteDownloadError("{} / {} bytes are received.".format(received_size, total_size))
+        return total_size
+
+
+def get_total_size(response, offset):
+    """
+    get byte size of whole file from headers of response.
+    :return: int
+        None if server doesn't send it.
+    """
+    content_range = response.headers.get("Content-Range")
+    if content_range is not None and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+
+    content_length = response.headers.get("Content-Length")
+    if content_length is None:
+        return None
+    return int(content_length) + (offset if response.status == 206 else 0)
+
+
+def is_downloaded(artifact):
+    # sha256 is calculated only when file is downloaded, and it is compared with the recorded one for existing file
+    return is_verified(artifact.path, artifact.size, artifact.sha256)
+
+
+def is_extracted(member_name, path, manifest=None):
+    """
+    check whether member of archive is already extracted and verified.
+    :param member_name: str
+    :param path: str
+    :param manifest: dict
+        {file name: {"size": size, "sha256": hex digest}}. file name is basename of member.
+    :return: bool
+    """
+    entry = (manifest or {}).get(os.path.basename(member_name), {})
+    return is_verified(path, entry.get("size"), entry.get("sha256"))
+
+
+def write_verified_info(file_path, sha256=None):
+    """
+    record size and sha256 of file which is verified after download.
+    :param file_path: str
+    :param sha256: str
+        hex digest of file. it is calculated if it is None.
+    """
+    info = {"size": os.path.getsize(file_path), "sha256": sha256 if sha256 is not None else get_sha256(file_path)}
+
+    # write atomically not to be read while writing
+    info_path = file_path + VERIFIED_FILE_SUFFIX
+    temp_path = "{}.{}".format(info_path, os.getpid())
+    with open(temp_path, "w") as f:
+        json.dump(info, f)
+    os.replace(temp_path, info_path)
+
+
+def is_verified(file_path, size=None, sha256=None):
+    """
+    check whether file was verified after download and it is not changed.
+    file which exists without record (ex. broken file of old download function) is not trusted.
+    :param file_path: str
+    :param size: int
+        expected byte size. it is checked if it is not None.
+    :param sha256: str
+        expected hex digest. it is compared with recorded one if it is not None.
+    :return: bool
+    """
+    if not os.path.exists(file_path):
+        return False
+    try:
+        with open(file_path + VERIFIED_FILE_SUFFIX, "r") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    actual_size = os.path.getsize(file_path)
+    if info.get("size") != actual_size or (size is not None and actual_size != size):
+        return False
+    return sha256 is None or info.get("sha256") == sha256
+
+
+def verify_file(file_path, size=None, sha256=None):
+    """
+    verify size and SHA-256 of file.
+    :raise ChecksumError: if file is different from expected one.
+    """
+    actual_size = os.path.getsize(file_path)
+    if size is not None and actual_size != size:
+        raise ChecksumError("size of {} is {}, but {} is expected!".format(file_path, actual_size, size))
+    if sha256 is not None:
+        actual_sha256 = get_sha256(file_path)
+        if actual_sha256 != sha256:
+            raise ChecksumError("sha256 of {} is {}, but {} is expected!".format(file_path, actual_sha256, sha256))
+
+
+def get_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def create_manifest(file_paths):
+    """
+    create manifest of files to add it to "manifest" of ModelDefine.
+    :param file_paths: list
+    :return: dict
+        {file name: {"size": size, "sha256": hex digest}}
+    """
+    return {os.path.basename(path): {"size": os.path.getsize(path), "sha256": get_sha256(path)}
+            for path in file_paths}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="print manifest of downloaded model files for ModelDefine.")
+    parser.add_argument("files", nargs="+", help="set files which are verified.")
+    args = parser.parse_args()
+    print(json.dumps(create_manifest(args.files), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from urllib.parse import urlparse
+import numpy as np
+
+
+def create_argument_parser():
+    parser = argparse.ArgumentParser(description="synthetic load test of face recognition api.")
+    parser.add_argument("--url", default=None,
+                        help="set url of api (ex. 'http://127.0.0.1:5000/face'). "
+                             "async app with fake service is run in this process if it is not set.")
+    parser.add_argument("--concurrency", type=int, default=32, help="set count of concurrent clients.")
+    parser.add_argument("--request_count", type=int, default=256, help="set total request count.")
+    parser.add_argument("--fake_run_time", type=float, default=0.5,
+                        help="set time[sec] of one recognition run of fake service (only in-process mode).")
+    parser.add_argument("--coalesce_window", type=float, default=0.05)
+    parser.add_argument("--max_waiters", type=int, default=64)
+    parser.add_argument("--output_json", default=None, help="set file path to save result as json.")
+    return parser
+
+
+async def request_with_http(url):
+    # minimal HTTP/1.0 client not to depend on other packages
+    parsed = urlparse(url)
+    reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+    try:
+        writer.write("GET {} HTTP/1.0\r\nHost: {}\r\n\r\n".format(parsed.path or "/", parsed.netloc).encode("ascii"))
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    status = int(response.split(b" ", 2)[1])
+    body = response.split(b"\r\n\r\n", 1)[1]
+    return status, json.loads(body.decode("utf-8"))
+
+
+def create_in_process_request(app):
+    async def request():
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await app({"type": "http", "method": "GET", "path": "/face", "headers": []}, receive, send)
+        return messages[0]["status"], json.loads(messages[1]["body"].decode("utf-8"))
+    return request
+
+
+async def run_load(request, concurrency, request_count):
+    latencies = []
+    status_counter = Counter()
+    result_code_counter = Counter()
+    remaining = [request_count]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start_time = time.perf_counter()
+            try:
+                status, res = await request()
+                result_code_counter[res.get("result_code")] += 1
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start_time)
+            status_counter[status] += 1
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    total_time = time.perf_counter() - start_time
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "request_count": request_count,
+        "concurrency": concurrency,
+        "total_time_sec": total_time,
+        "throughput_rps": request_count / total_time,
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50)),
+            "p90": float(np.percentile(latencies, 90)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(np.max(latencies))
+        },
+        "status_counts": {str(key): value for key, value in status_counter.items()},
+        "result_code_counts": {str(key): value for key, value in result_code_counter.items()}
+    }
+
+
+async def run_in_process(args):
+    from web_api_async import create_app
+    from face_recognition_service import FakeFaceRecognitionService
+
+    services = []
+
+    def service_factory():
+        services.append(FakeFaceRecognitionService(run_time=args.fake_run_time))
+        return services[0]
+
+    app = create_app(service_factory, args.coalesce_window, args.max_waiters)
+    result = await run_load(create_in_process_request(app), args.concurrency, args.request_count)
+    result["recognition_run_count"] = services[0].get_run_count()
+    services[0].stop()
+    return result
+
+
+def main():
+    # get argument from parser
+    args = create_argument_parser().parse_args()
+
+    if args.url is None:
+        result = asyncio.run(run_in_process(args))
+    else:
+        result = asyncio.run(run_load(lambda: request_with_http(args.url), args.concurrency, args.request_count))
+    print(json.dumps(result, indent=2))
+
+    # save result
+    if args.output_json is not None:
+        with open(args.output_json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
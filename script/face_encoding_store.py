@@ -0,0 +1,258 @@
+import os
+import json
+import uuid
+import hashlib
+import numpy as np
+
+
+# dimension of face encoding of face_recognition
+DEFAULT_DIMENSION = 128
+
+
+class FaceEncodingStore:
+    # index file has a header line and one line per encoding
+    INDEX_FILE_NAME = "index.jsonl"
+
+    def __init__(self, store_dir, dimension=DEFAULT_DIMENSION, max_stale_ratio=0.25):
+        """
+        initialize store which keeps all face encodings in one memory-mapped float32 matrix.
+        encodings are appended to the matrix file and each entry is recorded in index file,
+        so encodings which are written before interruption are not lost.
+        entry is invalidated when mtime or size of its image is changed (and the hash is also changed).
+        image which has no encoding (ex. no face) is also recorded, so it is not processed again until it is changed.
+        only one process should write into the store at the same time.
+        :param store_dir: str
+        :param dimension: int
+        :param max_stale_ratio: float
+            matrix file is rewritten only if ratio of rows which are not used is over it.
+        """
+        self.__store_dir = store_dir
+        self.__dimension = dimension
+        self.__max_stale_ratio = max_stale_ratio
+        self.__row_bytes = dimension * np.dtype(np.float32).itemsize
+        self.__encodings_file_name = None
+        self.__entries = {}
+        self.__row_count = 0
+
+    def open(self):
+        """
+        read index file. store is created if it doesn't exist.
+        """
+        os.makedirs(self.__store_dir, exist_ok=True)
+        self.__entries = {}
+        self.__row_count = 0
+
+        index_path = self.__get_index_path()
+        if not os.path.exists(index_path):
+            self.__encodings_file_name = self.__create_encodings_file_name()
+            self.__write_index([], self.__encodings_file_name)
+        else:
+            with open(index_path, "r") as f:
+                lines = f.readlines()
+            self.__encodings_file_name = json.loads(lines[0])["encodings_file"]
+            valid_length = len(lines[0])
+            for line in lines[1:]:
+                # last line may be broken if writing is interrupted
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith("\n"):
+                    break
+                valid_length += len(line)
+                self.__entries[entry["key"]] = entry
+                if entry["row"] is not None:
+                    self.__row_count = max(self.__row_count, entry["row"] + 1)
+
+            # drop broken line not to append entry after it
+            with open(index_path, "a") as f:
+                f.truncate(valid_length)
+
+        # drop encodings which are written without index entry
+        encodings_path = self.__get_encodings_path()
+        with open(encodings_path, "ab") as f:
+            f.truncate(self.__row_count * self.__row_bytes)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def is_valid(self, key, image_path):
+        """
+        check whether entry of the key is created from current image.
+        entry may not have encoding, so "has_encoding" should be also checked to use encoding.
+        :param key: str
+        :param image_path: str
+        :return: bool
+        """
+        entry = self.__entries.get(key)
+        if entry is None or not os.path.exists(image_path):
+            return False
+
+        stat = os.stat(image_path)
+        if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return True
+
+        # check the hash only if mtime is changed but size is not changed (ex. file is copied)
+        return entry["size"] == stat.st_size and entry["sha1"] == get_file_digest(image_path)
+
+    def has_encoding(self, key):
+        """
+        check whether entry of the key has encoding.
+        :param key: str
+        :return: bool
+        """
+        entry = self.__entries.get(key)
+        return entry is not None and entry["row"] is not None
+
+    def get_status(self, key):
+        """
+        get status which is recorded with entry of the key.
+        :param key: str
+        :return: str
+            None if entry doesn't exist or status is not recorded.
+        """
+        entry = self.__entries.get(key)
+        return None if entry is None else entry.get("status")
+
+    def append(self, key, image_path, encoding):
+        """
+        append encoding of image. previous encoding of the same key is invalidated.
+        :param key: str
+        :param image_path: str
+        :param encoding: numpy.ndarray
+            shape is (dimension,).
+        """
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(-1)
+        if len(encoding) != self.__dimension:
+            raise FaceEncodingStoreError("dimension of encoding is {}, but {} is expected!".format(
+                len(encoding), self.__dimension))
+
+        # write encoding before index entry
+        with open(self.__get_encodings_path(), "ab") as f:
+            f.write(encoding.tobytes())
+
+        self.__append_entry(key, image_path, self.__row_count)
+        self.__row_count += 1
+
+    def append_no_encoding(self, key, image_path, status):
+        """
+        record image which has no encoding (ex. no face is found). previous encoding of the same key is invalidated.
+        :param key: str
+        :param image_path: str
+        :param status: str
+            reason why encoding is not created.
+        """
+        self.__append_entry(key, image_path, None, status)
+
+    def __append_entry(self, key, image_path, row, status=None):
+        stat = os.stat(image_path)
+        entry = {
+            "key": key,
+            "row": row,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": get_file_digest(image_path)
+        }
+        if status is not None:
+            entry["status"] = status
+        with open(self.__get_index_path(), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.__entries[key] = entry
+
+    def get_encodings(self, keys):
+        """
+        get encodings of keys. i-th row is encoding of i-th key.
+        store is rewritten in order of keys when too many rows are stale (ex. images are changed or removed),
+        and read-only memory-mapped matrix is returned if its rows are the same as keys.
+        otherwise (ex. a few images are changed or keys are duplicated) rows of keys are copied from the matrix.
+        :param keys: list
+        :return: numpy.ndarray
+            shape is (len(keys), dimension).
+        """
+        # duplicated keys (ex. the same image in csv twice) use the same row
+        unique_keys = list(dict.fromkeys(keys))
+        stale_count = self.__row_count - len(unique_keys)
+        if stale_count > self.__row_count * self.__max_stale_ratio:
+            self.__compact(unique_keys)
+
+        if len(keys) == 0:
+            return np.empty((0, self.__dimension), dtype=np.float32)
+        encodings = open_encodings(self.__get_encodings_path(), self.__dimension)
+        rows = [self.__entries[key]["row"] for key in keys]
+        if rows == list(range(self.__row_count)):
+            return encodings
+        return encodings[rows]
+
+    def __compact(self, keys):
+        # write new matrix with new file name, and switch index file to it
+        old_encodings_path = self.__get_encodings_path()
+        new_encodings_file_name = self.__create_encodings_file_name()
+        if self.__row_count > 0:
+            old_encodings = open_encodings(old_encodings_path, self.__dimension)
+            new_encodings = old_encodings[[self.__entries[key]["row"] for key in keys]]
+            del old_encodings
+        else:
+            new_encodings = np.empty((0, self.__dimension), dtype=np.float32)
+        with open(os.path.join(self.__store_dir, new_encodings_file_name), "wb") as f:
+            f.write(np.ascontiguousarray(new_encodings).tobytes())
+
+        entries = []
+        for row, key in enumerate(keys):
+            entry = dict(self.__entries[key])
+            entry["row"] = row
+            entries.append(entry)
+
+        # entries without encoding are kept not to process their images again
+        entries.extend(entry for entry in self.__entries.values() if entry["row"] is None)
+        self.__write_index(entries, new_encodings_file_name)
+        os.remove(old_encodings_path)
+
+        self.__encodings_file_name = new_encodings_file_name
+        self.__entries = {entry["key"]: entry for entry in entries}
+        self.__row_count = len(keys)
+
+    def __write_index(self, entries, encodings_file_name):
+        # replace index file atomically
+        index_path = self.__get_index_path()
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps({"encodings_file": encodings_file_name, "dimension": self.__dimension}) + "\n")
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        encodings_path = os.path.join(self.__store_dir, encodings_file_name)
+        if not os.path.exists(encodings_path):
+            open(encodings_path, "wb").close()
+        os.replace(tmp_path, index_path)
+
+    def __get_index_path(self):
+        return os.path.join(self.__store_dir, self.INDEX_FILE_NAME)
+
+    def __get_encodings_path(self):
+        return os.path.join(self.__store_dir, self.__encodings_file_name)
+
+    @staticmethod
+    def __create_encodings_file_name():
+        return "encodings-{}.f32".format(uuid.uuid4().hex)
+
+
+class FaceEncodingStoreError(Exception):
+    pass
+
+
+def open_encodings(encodings_path, dimension=DEFAULT_DIMENSION):
+    """
+    open matrix file of encodings as read-only memory map.
+    pages of the file are shared by all processes which open it.
+    :param encodings_path: str
+    :param dimension: int
+    :return: numpy.memmap
+    """
+    return np.memmap(encodings_path, dtype=np.float32, mode="r").reshape((-1, dimension))
+
+
+def get_file_digest(file_path):
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
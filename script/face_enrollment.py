@@ -0,0 +1,129 @@
+import os
+import face_recognition
+import numpy as np
+from multiprocessing import cpu_count
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from enum import Enum
+
+
+class MultipleFacePolicy(Enum):
+    LARGEST_FACE = 0
+    SKIP = 1
+
+
+class EnrollmentStatus(Enum):
+    ENROLLED = 0
+    NO_FACE = 1
+    MULTIPLE_FACES = 2
+    FAILED = 3
+
+
+class FaceEnrollment:
+    def __init__(self, store, process_count=cpu_count(),
+                 multiple_face_policy=MultipleFacePolicy.LARGEST_FACE, debug_mode=False):
+        """
+        initialize enrollment which creates face encodings of images in parallel.
+        each encoding is written into store as soon as it is created,
+        so interrupted enrollment is resumed from images which are not enrolled yet.
+        image which has no face or fails is recorded without encoding until the image is changed.
+        :param store: FaceEncodingStore
+            store which is already opened.
+        :param process_count: int
+        :param multiple_face_policy: MultipleFacePolicy
+            the largest face is used or image is skipped if image has several faces.
+        :param debug_mode: bool
+        """
+        self.__store = store
+        self.__process_count = process_count
+        self.__multiple_face_policy = multiple_face_policy
+        self.__debug_mode = debug_mode
+
+    def enroll(self, targets):
+        """
+        create face encodings of images and write them into store.
+        :param targets: list
+            list of (key, image path).
+        :return: dict
+            EnrollmentStatus of each key.
+        """
+        statuses = {}
+
+        # old cache data of face encoding is used without face detection
+        remaining_targets = []
+        for key, image_path in targets:
+            encoding = load_encoding_cache(image_path)
+            if encoding is None:
+                remaining_targets.append((key, image_path))
+                continue
+            if self.__debug_mode:
+                print("face encoding of {} is loaded from cache data.".format(image_path))
+            self.__store.append(key, image_path, encoding)
+            statuses[key] = EnrollmentStatus.ENROLLED
+        if not remaining_targets:
+            return statuses
+
+        # fan out images across processes
+        target_count = len(remaining_targets)
+        print("start to enroll {} face images with {} processes.".format(target_count, self.__process_count))
+        with ProcessPoolExecutor(max_workers=self.__process_count) as executor:
+            future_to_target = {
+                executor.submit(create_face_encoding, image_path, self.__multiple_face_policy): (key, image_path)
+                for key, image_path in remaining_targets
+            }
+            for done_count, future in enumerate(as_completed(future_to_target), 1):
+                key, image_path = future_to_target[future]
+                try:
+                    status, encoding = future.result()
+                except Exception as e:
+                    print("failed to create face encoding of {}! {}".format(image_path, e))
+                    status, encoding = EnrollmentStatus.FAILED, None
+
+                # write each encoding immediately to resume interrupted enrollment.
+                # image without encoding is also recorded not to detect faces of it on every start
+                if encoding is not None:
+                    self.__store.append(key, image_path, encoding)
+                elif os.path.exists(image_path):
+                    self.__store.append_no_encoding(key, image_path, status.name)
+                statuses[key] = status
+                print("[{}/{}] {} : {}".format(done_count, target_count, image_path, status.name))
+        return statuses
+
+
+def load_encoding_cache(image_path):
+    """
+    load old cache data(*.npy) of face encoding which is saved next to the image.
+    :param image_path: str
+    :return: numpy.ndarray
+        None is returned if cache data doesn't exist or it is older than image.
+    """
+    cache_path = os.path.splitext(image_path)[0] + ".npy"
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(image_path):
+        return None
+    return np.load(cache_path)
+
+
+def create_face_encoding(image_path, multiple_face_policy=MultipleFacePolicy.LARGEST_FACE):
+    """
+    create face encoding of one image. this function is called in worker process.
+    :param image_path: str
+    :param multiple_face_policy: MultipleFacePolicy
+    :return: tuple
+        (EnrollmentStatus, encoding). encoding is None if no face is used.
+        status is MULTIPLE_FACES with encoding of the largest face if policy is LARGEST_FACE.
+    """
+    image = face_recognition.load_image_file(image_path)
+    face_locations = face_recognition.face_locations(image)
+    if len(face_locations) == 0:
+        return EnrollmentStatus.NO_FACE, None
+
+    status = EnrollmentStatus.ENROLLED
+    if len(face_locations) > 1:
+        if multiple_face_policy == MultipleFacePolicy.SKIP:
+            return EnrollmentStatus.MULTIPLE_FACES, None
+
+        # use the largest face (location is (top, right, bottom, left))
+        status = EnrollmentStatus.MULTIPLE_FACES
+        face_locations = [max(face_locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))]
+
+    encoding = face_recognition.face_encodings(image, face_locations)[0]
+    return status, encoding
@@ -0,0 +1,275 @@
+import numpy as np
+import hashlib
+import os
+from abc import ABCMeta, abstractmethod
+from enum import Enum
+
+
+class FaceIndexType(Enum):
+    BRUTE_FORCE = 0
+    IVF = 1
+
+
+class FaceIndexFactory:
+    @classmethod
+    def create(cls, index_type, encodings, **kwargs):
+        """
+        create index of face encodings.
+        :param index_type: FaceIndexType
+        :param encodings: numpy.ndarray
+            shape is (N, D).
+        :param kwargs:
+            parameters of each index (ex. "probe_count" of IVFFaceIndex)
+        :return: AbstractFaceIndex
+        """
+        if index_type == FaceIndexType.BRUTE_FORCE:
+            return BruteForceFaceIndex(encodings)
+        elif index_type == FaceIndexType.IVF:
+            return IVFFaceIndex(encodings, **kwargs)
+        else:
+            raise UndefinedFaceIndexError("{} face index type is not defined!".format(index_type))
+
+    @classmethod
+    def load(cls, path):
+        """
+        load index which is saved by "save" function of index.
+        :param path: str
+        :return: AbstractFaceIndex
+        """
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+        index_type = FaceIndexType(int(arrays.pop("index_type")))
+        if index_type == FaceIndexType.BRUTE_FORCE:
+            return BruteForceFaceIndex.from_arrays(arrays)
+        elif index_type == FaceIndexType.IVF:
+            return IVFFaceIndex.from_arrays(arrays)
+        else:
+            raise UndefinedFaceIndexError("{} face index type is not defined!".format(index_type))
+
+
+class UndefinedFaceIndexError(Exception):
+    pass
+
+
+def get_encodings_digest(encodings):
+    """
+    get digest of encodings to check whether saved index is created from the same encodings.
+    :param encodings: numpy.ndarray
+    :return: str
+    """
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    return hashlib.sha1(encodings.tobytes()).hexdigest()
+
+
+class AbstractFaceIndex:
+    __metaclass__ = ABCMeta
+
+    def __init__(self, index_type, encodings, digest=None):
+        self._index_type = index_type
+        self._encodings = _to_matrix(encodings)
+        self._squared_norms = np.einsum("ij,ij->i", self._encodings, self._encodings)
+        self._digest = digest if digest is not None else get_encodings_digest(self._encodings)
+
+    def __len__(self):
+        return len(self._encodings)
+
+    def __getstate__(self):
+        # memory-mapped encodings are reopened by other process instead of being copied
+        state = self.__dict__.copy()
+        if isinstance(self._encodings, np.memmap) and self._encodings.filename is not None \
+                and os.path.getsize(self._encodings.filename) == self._encodings.nbytes:
+            state["_encodings"] = None
+            state["_encodings_memmap"] = (self._encodings.filename, self._encodings.shape)
+        return state
+
+    def __setstate__(self, state):
+        memmap_info = state.pop("_encodings_memmap", None)
+        self.__dict__.update(state)
+        if memmap_info is not None:
+            filename, shape = memmap_info
+            self._encodings = np.memmap(filename, dtype=np.float32, mode="r", shape=shape)
+
+    def get_index_type(self):
+        return self._index_type
+
+    def get_digest(self):
+        return self._digest
+
+    @abstractmethod
+    def search(self, queries):
+        """
+        search the nearest encoding of each query.
+        :param queries: numpy.ndarray
+            shape is (M, D).
+        :return: tuple
+            (indices, distances). both shape is (M,).
+        """
+        pass
+
+    def save(self, path):
+        """
+        save index into npz file.
+        :param path: str
+        """
+        arrays = self._get_arrays()
+        arrays["index_type"] = np.array(self._index_type.value)
+        arrays["encodings"] = self._encodings
+        arrays["digest"] = np.array(self._digest)
+        np.savez(path, **arrays)
+
+    @abstractmethod
+    def _get_arrays(self):
+        pass
+
+    def _get_squared_distances(self, queries, rows=None):
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab
+        encodings = self._encodings if rows is None else self._encodings[rows]
+        squared_norms = self._squared_norms if rows is None else self._squared_norms[rows]
+        squared_distances = np.dot(queries, encodings.T)
+        squared_distances *= -2
+        squared_distances += squared_norms
+        squared_distances += np.einsum("ij,ij->i", queries, queries)[:, np.newaxis]
+        return squared_distances
+
+
+class BruteForceFaceIndex(AbstractFaceIndex):
+    def __init__(self, encodings, digest=None):
+        """
+        exact index which compares queries with all encodings.
+        :param encodings: numpy.ndarray
+            shape is (N, D).
+        """
+        super(BruteForceFaceIndex, self).__init__(FaceIndexType.BRUTE_FORCE, encodings, digest)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays["encodings"], str(arrays["digest"]))
+
+    def search(self, queries):
+        queries = _to_matrix(queries)
+        if len(queries) == 0 or len(self) == 0:
+            return _get_empty_result(len(queries))
+
+        squared_distances = self._get_squared_distances(queries)
+        indices = np.argmin(squared_distances, axis=1)
+        best_squared_distances = squared_distances[np.arange(len(queries)), indices]
+        return indices, np.sqrt(np.maximum(best_squared_distances, 0))
+
+    def _get_arrays(self):
+        return {}
+
+
+class IVFFaceIndex(AbstractFaceIndex):
+    def __init__(self, encodings, cluster_count=None, probe_count=8, iteration_count=10, seed=0, digest=None,
+                 centroids=None, order=None, offsets=None):
+        """
+        approximate index which searches only encodings in the nearest clusters (inverted file index).
+        clusters are created by k-means.
+        :param encodings: numpy.ndarray
+            shape is (N, D).
+        :param cluster_count: int
+            count of clusters. default value is sqrt(N).
+        :param probe_count: int
+            count of clusters which are searched for each query.
+            recall becomes higher and search becomes slower as it increases.
+        :param iteration_count: int
+            iteration count of k-means.
+        :param seed: int
+            random seed of k-means.
+        """
+        super(IVFFaceIndex, self).__init__(FaceIndexType.IVF, encodings, digest)
+        self.__probe_count = probe_count
+
+        if centroids is None:
+            if cluster_count is None:
+                cluster_count = int(np.sqrt(len(self)))
+            # empty gallery (ex. new enrollment) has no cluster
+            cluster_count = min(max(1, cluster_count), len(self))
+            centroids, labels = _kmeans(self._encodings, cluster_count, iteration_count, seed)
+
+            # inverted lists : rows of i-th cluster are order[offsets[i]:offsets[i + 1]]
+            order = np.argsort(labels, kind="stable")
+            offsets = np.zeros(cluster_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(labels, minlength=cluster_count), out=offsets[1:])
+        self.__centroids = centroids
+        self.__order = order
+        self.__offsets = offsets
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays["encodings"], probe_count=int(arrays["probe_count"]), digest=str(arrays["digest"]),
+                   centroids=arrays["centroids"], order=arrays["order"], offsets=arrays["offsets"])
+
+    def set_probe_count(self, probe_count):
+        self.__probe_count = probe_count
+
+    def search(self, queries):
+        queries = _to_matrix(queries)
+        if len(queries) == 0 or len(self) == 0:
+            return _get_empty_result(len(queries))
+
+        # select the nearest clusters of each query
+        probe_count = min(self.__probe_count, len(self.__centroids))
+        centroid_distances = np.dot(queries, self.__centroids.T) * -2
+        centroid_distances += np.einsum("ij,ij->i", self.__centroids, self.__centroids)
+        probes = np.argpartition(centroid_distances, probe_count - 1, axis=1)[:, :probe_count]
+
+        indices = np.empty(len(queries), dtype=np.int64)
+        distances = np.empty(len(queries), dtype=np.float32)
+        for i, query_probes in enumerate(probes):
+            rows = np.concatenate([self.__order[self.__offsets[c]:self.__offsets[c + 1]] for c in query_probes])
+            squared_distances = self._get_squared_distances(queries[i:i + 1], rows)[0]
+            best = np.argmin(squared_distances)
+            indices[i] = rows[best]
+            distances[i] = np.sqrt(max(squared_distances[best], 0))
+        return indices, distances
+
+    def _get_arrays(self):
+        return {
+            "probe_count": np.array(self.__probe_count),
+            "centroids": self.__centroids,
+            "order": self.__order,
+            "offsets": self.__offsets,
+        }
+
+
+def _to_matrix(encodings):
+    # memory-mapped matrix is kept as it is not to copy it
+    if isinstance(encodings, np.memmap) and encodings.dtype == np.float32 and encodings.ndim == 2 \
+            and encodings.flags["C_CONTIGUOUS"]:
+        return encodings
+
+    encodings = np.asarray(encodings, dtype=np.float32)
+    if encodings.ndim != 2:
+        encodings = encodings.reshape((len(encodings), -1)) if len(encodings) > 0 \
+            else np.empty((0, 0), dtype=np.float32)
+    return np.ascontiguousarray(encodings)
+
+
+def _get_empty_result(query_count):
+    return np.zeros(query_count, dtype=np.int64), np.full(query_count, np.inf, dtype=np.float32)
+
+
+def _kmeans(encodings, cluster_count, iteration_count, seed, chunk_size=16384):
+    # each centroid is initialized by different encoding, so clusters are not more than encodings
+    cluster_count = min(cluster_count, len(encodings))
+    if cluster_count == 0:
+        return np.empty((0, encodings.shape[1]), dtype=np.float32), np.zeros(len(encodings), dtype=np.int64)
+
+    rng = np.random.RandomState(seed)
+    centroids = encodings[rng.choice(len(encodings), cluster_count, replace=False)].copy()
+    labels = np.zeros(len(encodings), dtype=np.int64)
+    for _ in range(iteration_count):
+        # assign each encoding to the nearest centroid (chunked to limit memory)
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        for start in range(0, len(encodings), chunk_size):
+            chunk = encodings[start:start + chunk_size]
+            labels[start:start + chunk_size] = np.argmin(centroid_norms - 2 * np.dot(chunk, centroids.T), axis=1)
+
+        # update centroids with sum of each cluster (empty cluster keeps its centroid)
+        counts = np.bincount(labels, minlength=cluster_count)
+        non_empty = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[non_empty]
+        sums = np.add.reduceat(encodings[np.argsort(labels, kind="stable")], starts, axis=0)
+        centroids[non_empty] = sums / counts[non_empty, np.newaxis]
+    return centroids, labels
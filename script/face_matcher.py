@@ -0,0 +1,63 @@
+import numpy as np
+from face_index import BruteForceFaceIndex
+
+
+# same tolerance as default value of face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+UNKNOWN_FACE_NAME = "Unknown"
+
+
+class FaceMatcher:
+    def __init__(self, known_face_encodings, known_face_names, tolerance=DEFAULT_TOLERANCE, face_index=None):
+        """
+        initialize matcher of face encodings.
+        :param known_face_encodings: list or numpy.ndarray
+            face encodings. shape of each encoding is (128,).
+        :param known_face_names: list
+        :param tolerance: float
+            face is matched if its distance is equal to or less than tolerance.
+        :param face_index: AbstractFaceIndex
+            index of known face encodings. exact index (BruteForceFaceIndex) is used if it is None.
+        """
+        if len(known_face_encodings) != len(known_face_names):
+            raise FaceMatcherError("encodings count is not equal names count!")
+
+        if face_index is None:
+            face_index = BruteForceFaceIndex(known_face_encodings)
+        elif len(face_index) != len(known_face_names):
+            raise FaceMatcherError("encodings count of face index is not equal names count!")
+        self.__face_index = face_index
+        self.__names = list(known_face_names)
+        self.__tolerance = tolerance
+
+    def get_known_face_count(self):
+        return len(self.__names)
+
+    def get_face_index(self):
+        return self.__face_index
+
+    def match(self, face_encodings):
+        """
+        match all faces with known faces.
+        :param face_encodings: list or numpy.ndarray
+            face encodings of frame.
+        :return: tuple
+            (names, distances, matches)
+            names : list of the nearest known face name ("Unknown" if it is not matched)
+            distances : numpy.ndarray of distance to the nearest known face
+            matches : numpy.ndarray of bool whether the nearest known face is matched
+        """
+        face_count = len(face_encodings)
+        if face_count == 0 or len(self.__names) == 0:
+            return [UNKNOWN_FACE_NAME] * face_count, np.full(face_count, np.inf, dtype=np.float32), \
+                np.zeros(face_count, dtype=bool)
+
+        best_indices, distances = self.__face_index.search(face_encodings)
+        matches = distances <= self.__tolerance
+        names = [self.__names[index] if is_matched else UNKNOWN_FACE_NAME
+                 for index, is_matched in zip(best_indices, matches)]
+        return names, distances, matches
+
+
+class FaceMatcherError(Exception):
+    pass
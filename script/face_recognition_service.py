@@ -0,0 +1,136 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class FaceRecognitionService:
+    # sentinel to stop service thread
+    __STOP = object()
+
+    def __init__(self, recognition):
+        """
+        initialize long-lived service which keeps video capture, face encodings and worker processes warm.
+        recognition is run only on the service thread because RealTimeFaceRecognition is not thread safe.
+        :param recognition: RealTimeFaceRecognition
+            module with OneFaceRecognitionMode. "setup" is called by "start" function.
+        """
+        self.__recognition = recognition
+        self.__job_queue = queue.Queue()
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is not None:
+            return
+
+        # setup is done only once
+        self.__recognition.setup()
+        self.__thread = threading.Thread(target=self.__run_loop)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+
+        self.__job_queue.put(self.__STOP)
+        self.__thread.join()
+        self.__thread = None
+        self.__recognition.close()
+
+    def is_started(self):
+        return self.__thread is not None
+
+    def submit(self):
+        """
+        enqueue recognition job.
+        :return: concurrent.futures.Future
+            result is tuple(FaceRecognitionResult, process time[sec]).
+        """
+        if self.__thread is None:
+            raise ServiceNotStartedException("service is not started! Please call 'start' function.")
+
+        future = Future()
+        self.__job_queue.put(future)
+        return future
+
+    def recognize(self, timeout=None):
+        """
+        enqueue recognition job and wait its result.
+        :param timeout: float
+        :return: tuple
+            (FaceRecognitionResult, process time[sec])
+        """
+        return self.submit().result(timeout=timeout)
+
+    def __run_loop(self):
+        while True:
+            future = self.__job_queue.get()
+            if future is self.__STOP:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                run_start_time = time.time()
+                self.__recognition.run()
+                run_process_time = time.time() - run_start_time
+                future.set_result((self.__recognition.get_result(), run_process_time))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class FakeFaceRecognitionService:
+    def __init__(self, face_name="fake", run_time=0.5):
+        """
+        initialize fake service which has the same interface as FaceRecognitionService.
+        it simulates capture-and-vote cycle without camera and face data to test api server locally.
+        :param face_name: str
+            face name of every result.
+        :param run_time: float
+            time[sec] of one recognition run.
+        """
+        self.__face_name = face_name
+        self.__run_time = run_time
+        self.__executor = None
+        self.__run_count = 0
+
+    def start(self):
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=1)
+
+    def stop(self):
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def is_started(self):
+        return self.__executor is not None
+
+    def get_run_count(self):
+        return self.__run_count
+
+    def submit(self):
+        if self.__executor is None:
+            raise ServiceNotStartedException("service is not started! Please call 'start' function.")
+        return self.__executor.submit(self.__run)
+
+    def recognize(self, timeout=None):
+        return self.submit().result(timeout=timeout)
+
+    def __run(self):
+        time.sleep(self.__run_time)
+        self.__run_count += 1
+        result = FakeFaceRecognitionResult()
+        result.FaceName = self.__face_name
+        return result, self.__run_time
+
+
+class FakeFaceRecognitionResult:
+    def __init__(self):
+        self.FrameData = None
+        self.FaceName = None
+
+
+class ServiceNotStartedException(Exception):
+    pass
@@ -4,9 +4,20 @@ import cv2
 import os
 import csv
 import collections
-from multiprocessing import cpu_count, Manager
-from concurrent.futures import ProcessPoolExecutor
+import queue
+import itertools
+import time
+from multiprocessing import cpu_count, Process, Queue, Event, BoundedSemaphore
 from enum import Enum
+from shared_frame_buffer import SharedFrameRingBuffer
+from face_matcher import FaceMatcher
+from face_index import FaceIndexType, FaceIndexFactory, get_encodings_digest
+from face_encoding_store import FaceEncodingStore
+from face_enrollment import FaceEnrollment
+from threaded_capture import ThreadedVideoCapture
+from frame_source import FrameSourceFactory
+from metrics import REGISTRY
+from profiler import get_profiler
 
 
 class DisplayType(Enum):
@@ -25,11 +36,27 @@ class VideoCaptureParams:
         self.size = DisplayType.HDTV720p.value
         self.fps = 30
 
+        # source of frames. "--source" argument of FrameSourceFactory or AbstractFrameSource
+        self.source = 0
+
+        # CaptureMode. it is decided by source if None (the newest frame is used for camera)
+        self.capture_mode = None
+
 
 class FaceRecognitionError(Exception):
     pass
 
 
+# stages of face recognition which are measured
+FACE_STAGES = ("capture", "detect", "encode", "match", "run")
+
+
+def get_face_stage_histograms():
+    return {stage: REGISTRY.histogram("face_stage_seconds", "time[sec] of each stage of face recognition",
+                                      {"stage": stage})
+            for stage in FACE_STAGES}
+
+
 class FaceRecognitionResult:
     def __init__(self):
         self.FrameData = None
@@ -45,6 +72,9 @@ class RealTimeFaceRecognition:
                  video_capture_params=VideoCaptureParams(),
                  frame_count_with_use_face_recog=50,
                  process_count=cpu_count(),
+                 face_index_type=FaceIndexType.BRUTE_FORCE,
+                 face_index_path=None,
+                 face_encoding_store_dir=None,
                  debug_mode=False):
         self.__capture = None
         self.__face_image_folder = face_image_folder
@@ -55,12 +85,25 @@ class RealTimeFaceRecognition:
         self.__video_capture_params = video_capture_params
         self.__frame_count_with_use_face_recog = frame_count_with_use_face_recog
         self.__process_count = process_count
+        self.__face_index_type = face_index_type
+        self.__face_index_path = face_index_path  # index is saved into this path(*.npz) if it is not None
+        self.__face_encoding_store_dir = face_encoding_store_dir if face_encoding_store_dir is not None \
+            else os.path.join(face_image_folder, "encoding_store")
         self.__debug_mode = debug_mode
 
         # local value
         self.__known_face_encodings = []
         self.__known_face_names = []
+        self.__face_matcher = None
+        self.__worker_pool = None
+        self.__run_ids = itertools.count()
         self.__result = None
+        self.__stage_histograms = get_face_stage_histograms()
+
+        # profiler which profiles frames only when it is requested (ex. by signal or api)
+        # in OneFaceRecognitionMode, face detection and encoding run in worker processes, so it covers
+        # only capture and dispatch loop (time of worker stages is in "face_stage_seconds" metrics)
+        self.__profiler = get_profiler("face_recognition")
 
     def setup(self):
         # set video capture
@@ -70,10 +113,13 @@ class RealTimeFaceRecognition:
         self.__load_face_image()
 
     def __set_video_capture(self):
-        video_capture = cv2.VideoCapture(0)
-        video_capture.set(cv2.CAP_PROP_FPS, self.__video_capture_params.fps)
-        video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.__video_capture_params.size[0])
-        video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.__video_capture_params.size[1])
+        source = FrameSourceFactory.create_from_argument(self.__video_capture_params.source,
+                                                         size=self.__video_capture_params.size,
+                                                         fps=self.__video_capture_params.fps)
+
+        # frames are read on capture thread not to use stale frames after face recognition
+        video_capture = ThreadedVideoCapture(source, self.__video_capture_params.capture_mode)
+        video_capture.start()
         self.__capture = video_capture
 
         # if debug_mode is true, video capture parameters are printed.
@@ -85,51 +131,93 @@ class RealTimeFaceRecognition:
             ))
 
     def __load_face_image(self):
+        # open consolidated store of face encodings
+        store = FaceEncodingStore(self.__face_encoding_store_dir)
+        store.open()
+
         # read csv to load face image
+        faces = []
         with open(self.__face_csv, "r") as f:
             reader = csv.reader(f, delimiter=",", quotechar='"')
             for row in reader:
                 face_file_name = row[0]
                 face_name = row[1]
                 face_file_path = os.path.join(self.__face_image_folder, face_file_name)
+                faces.append((face_file_name, face_name, face_file_path))
 
-                # check the cache data of face encoding
-                face_encoding_cache_path_without_ext = \
-                    os.path.join(self.__face_image_folder, os.path.splitext(os.path.basename(face_file_name))[0])
-                face_encoding_cache_path = face_encoding_cache_path_without_ext + ".npy"
-                if os.path.exists(face_encoding_cache_path):
-                    if self.__debug_mode:
-                        print("{} file is exist! face encoding data is loaded from it.".format(face_encoding_cache_path))
+        # create face encodings in parallel only if image is new or changed
+        targets = [(face_file_name, face_file_path) for face_file_name, _, face_file_path in faces
+                   if not store.is_valid(face_file_name, face_file_path)]
+        if targets:
+            enrollment = FaceEnrollment(store, process_count=self.__process_count, debug_mode=self.__debug_mode)
+            enrollment.enroll(targets)
 
-                    # load face encoding from cache data
-                    encoding = np.load(face_encoding_cache_path)
-                else:
-                    # create face encoding
-                    image = face_recognition.load_image_file(face_file_path)
-                    encoding = face_recognition.face_encodings(image)[0]
-
-                    # save cache data
-                    np.save(face_encoding_cache_path_without_ext, encoding)
-
-                # set face data into list
-                self.__known_face_encodings.append(encoding)
-                self.__known_face_names.append(face_name)
+        # images without face are skipped
+        face_file_names = []
+        face_names = []
+        for face_file_name, face_name, face_file_path in faces:
+            if not store.is_valid(face_file_name, face_file_path) or not store.has_encoding(face_file_name):
+                print("{} is skipped because its face encoding is not created. ({})".format(
+                    face_file_path, store.get_status(face_file_name)))
+                continue
+            face_file_names.append(face_file_name)
+            face_names.append(face_name)
+
+        # set all face data as one matrix (it is memory-mapped if rows of store are the same as faces)
+        self.__known_face_encodings = store.get_encodings(face_file_names)
+        self.__known_face_names = face_names
+
+        # create matcher with all face data
+        face_index = self.__create_face_index()
+        self.__face_matcher = FaceMatcher(self.__known_face_encodings, self.__known_face_names,
+                                          face_index=face_index)
 
         # print face list if debug_mode is true
         if self.__debug_mode:
             print("face data count is {}".format(len(self.__known_face_names)))
 
+    def __create_face_index(self):
+        # reuse saved index if it is created from the same face data
+        if self.__face_index_path is not None and os.path.exists(self.__face_index_path):
+            face_index = FaceIndexFactory.load(self.__face_index_path)
+            if face_index.get_index_type() == self.__face_index_type and \
+                    face_index.get_digest() == get_encodings_digest(self.__known_face_encodings):
+                if self.__debug_mode:
+                    print("face index is loaded from {}.".format(self.__face_index_path))
+                return face_index
+
+        # create index and save it if needed
+        face_index = FaceIndexFactory.create(self.__face_index_type, self.__known_face_encodings)
+        if self.__face_index_path is not None:
+            face_index.save(self.__face_index_path)
+        return face_index
+
     def run(self):
-        if self.__face_recognition_mode == FaceRecognitionMode.DrawBoundingBoxMode:
-            self.__start_face_recognition_with_drawing_bounding_box()
-        elif self.__face_recognition_mode == FaceRecognitionMode.OneFaceRecognitionMode:
-            self.__start_one_face_recognition()
-        else:
-            raise FaceRecognitionError("{} mode is not defined!")
+        with self.__stage_histograms["run"].time():
+            if self.__face_recognition_mode == FaceRecognitionMode.DrawBoundingBoxMode:
+                self.__start_face_recognition_with_drawing_bounding_box()
+            elif self.__face_recognition_mode == FaceRecognitionMode.OneFaceRecognitionMode:
+                self.__start_one_face_recognition()
+            else:
+                raise FaceRecognitionError("{} mode is not defined!")
 
     def get_result(self):
         return self.__result
 
+    def close(self):
+        """
+        stop worker processes and release video capture.
+        """
+        if self.__worker_pool is not None:
+            self.__worker_pool.stop()
+            self.__worker_pool = None
+        if self.__capture is not None:
+            if self.__debug_mode:
+                print("captured frame count : {}, dropped frame count : {}".format(
+                    self.__capture.get_captured_count(), self.__capture.get_dropped_count()))
+            self.__capture.release()
+            self.__capture = None
+
     def __start_face_recognition_with_drawing_bounding_box(self):
         current_frame_count = 1
         face_locations = []
@@ -144,44 +232,42 @@ class RealTimeFaceRecognition:
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
-        # if loop is end, video capture instance is released
+        # if loop is end, video capture instance is released (it is opened again by next run)
         self.__capture.release()
+        self.__capture = None
         cv2.destroyAllWindows()
 
     def __start_one_face_recognition(self):
-        manager = Manager()
-
-        # create queue to save video frame
-        q = manager.Queue()
+        frame, rgb_small_frame = self.__get_frame()
 
-        # create queue to save face recognition result
-        # face recognition result is tuple(face_location, face_name)
-        fq = manager.Queue()
+        # start worker processes once, and reuse them in next run
+        # (one process is left for video capture)
+        if self.__worker_pool is None:
+            self.__worker_pool = FaceRecognitionWorkerPool(worker_count=max(self.__process_count - 1, 1),
+                                                           face_matcher=self.__face_matcher,
+                                                           frame_size=rgb_small_frame.nbytes,
+                                                           debug_mode=self.__debug_mode)
+            self.__worker_pool.start()
 
-        # start the process to do face recognition
-        executor = ProcessPoolExecutor(max_workers=self.__process_count-1)
-        for i in range(self.__process_count):
-            executor.submit(analyze_face_info_with_worker_process,
-                            q, fq, self.__debug_mode, get_face_information,
-                            self.__frame_count_with_use_face_recog,
-                            self.__known_face_encodings, self.__known_face_names,)
+        # results of previous run are ignored by run id
+        run_id = next(self.__run_ids)
 
         # start video capture
+        # face recognition result is tuple(face_location, face_name)
+        face_name_list = []
         while True:
-            frame, rgb_small_frame = self.__get_frame()
-            q.put(rgb_small_frame)
+            self.__worker_pool.submit(run_id, rgb_small_frame)
+            for result_run_id, face_location, face_name in self.__worker_pool.get_results():
+                if result_run_id == run_id:
+                    face_name_list.append(face_name)
 
             # Hit 'q' on the keyboard to quit
-            # if face queue size is max size, video capture is end
-            if (cv2.waitKey(1) & 0xFF == ord('q')) or fq.qsize() >= self.__frame_count_with_use_face_recog:
+            # if face count is max count, video capture is end
+            if (cv2.waitKey(1) & 0xFF == ord('q')) or len(face_name_list) >= self.__frame_count_with_use_face_recog:
                 if self.__debug_mode:
-                    print("video capture is end.")
+                    print("video capture is end. face count is {}".format(len(face_name_list)))
                 break
-
-        # get face info
-        face_name_list = []
-        while not fq.empty():
-            face_name_list.append(fq.get()[1])
+            frame, rgb_small_frame = self.__get_frame()
 
         counter = collections.Counter(face_name_list)
         face_info = counter.most_common()[0]
@@ -193,10 +279,6 @@ class RealTimeFaceRecognition:
         face_names = [face_info[0]]
         self.__draw_boxes_into_frame(frame, face_locations, face_names, self.__reduction_ratio)
 
-        # wait subprocess and terminate queue and process
-        manager.shutdown()
-        executor.shutdown()
-
         # display frame until exit command is received
         result = FaceRecognitionResult()
         result.FrameData = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # need to convert from BGR to RGB because frame data is BGR color
@@ -208,7 +290,10 @@ class RealTimeFaceRecognition:
 
         # Only process every other frame of video to save time
         if process_this_frame:
-            face_locations, face_names = get_face_information(rgb_small_frame, self.__known_face_encodings, self.__known_face_names)
+            timings = {}
+            face_locations, face_names = get_face_information(rgb_small_frame, self.__face_matcher, timings)
+            for stage, seconds in timings.items():
+                self.__stage_histograms[stage].observe(seconds)
 
         # draw boxes into frame
         self.__draw_boxes_into_frame(frame, face_locations, face_names, self.__reduction_ratio)
@@ -217,8 +302,15 @@ class RealTimeFaceRecognition:
         cv2.imshow('Video', frame)
 
     def __get_frame(self):
-        ret, frame = self.__capture.read()
-        small_frame = cv2.resize(frame, (0, 0), fx=1 / self.__reduction_ratio, fy=1 / self.__reduction_ratio)
+        # each frame is the boundary of profiled frames
+        self.__profiler.tick()
+        if self.__capture is None:
+            self.__set_video_capture()
+        with self.__stage_histograms["capture"].time():
+            ret, frame = self.__capture.read()
+            if not ret:
+                raise FaceRecognitionError("frame can't be read from video capture!")
+            small_frame = cv2.resize(frame, (0, 0), fx=1 / self.__reduction_ratio, fy=1 / self.__reduction_ratio)
 
         # Convert the image from BGR color (which OpenCV uses) to RGB color (which face_recognition uses)
         rgb_small_frame = small_frame[:, :, ::-1]
@@ -241,45 +333,174 @@ class RealTimeFaceRecognition:
             cv2.putText(frame, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
 
 
-def analyze_face_info_with_worker_process(video_queue, face_information_queue,
-                                          debug_mode, get_face_info_func, frame_count_with_use_face_recog,
-                                          known_face_encodings, known_face_names):
-    while True:
-        if video_queue.qsize() > 0:
-            frame = video_queue.get()
-            tmp_face_locations, tmp_face_names = get_face_info_func(frame, known_face_encodings, known_face_names)
-            for face_location, face_name in zip(tmp_face_locations, tmp_face_names):
-                face_information_queue.put((face_location, face_name))
-
-        # TODO : should send exit code from main process
-        if (cv2.waitKey(1) & 0xFF == ord('q')) or face_information_queue.qsize() >= frame_count_with_use_face_recog:
-            if debug_mode:
-                print("face count is max! count is {}".format(face_information_queue.qsize()))
-            break
+class FaceRecognitionWorkerPool:
+    def __init__(self, worker_count, face_matcher, frame_size, debug_mode=False):
+        """
+        initialize pool of worker processes which do face recognition.
+        workers persist until "stop" is called, and they wait frames with blocking get.
+        :param worker_count: int
+        :param face_matcher: FaceMatcher
+        :param frame_size: int
+            byte size of RGB frame.
+        :param debug_mode: bool
+        """
+        self.__worker_count = worker_count
+        self.__face_matcher = face_matcher
+        self.__frame_size = frame_size
+        self.__debug_mode = debug_mode
 
+        self.__frame_buffer = None
+        self.__frame_queue = None
+        self.__free_queue_count = None
+        self.__result_queue = None
+        self.__stop_event = None
+        self.__processes = []
+
+        # metrics
+        # (stages of worker processes are measured in workers and observed in main process)
+        self.__stage_histograms = get_face_stage_histograms()
+        self.__dropped_counter = REGISTRY.counter("face_worker_dropped_frames_total",
+                                                  "count of frames dropped because all workers are busy")
+        self.__queue_depth_gauge = REGISTRY.gauge("face_worker_queue_depth", "count of frames waiting workers")
+
+    def start(self):
+        # frame is dropped if all workers are busy, so the queue is bounded
+        queue_size = self.__worker_count * 2
+        self.__frame_queue = Queue(maxsize=queue_size)
+
+        # count of frames which can be sent. it is released by worker after frame is copied from ring buffer,
+        # so ring buffer is written only when frame is surely enqueued
+        self.__free_queue_count = BoundedSemaphore(queue_size)
+        self.__result_queue = Queue()
+        self.__stop_event = Event()
+
+        # ring buffer on shared memory to save video frame
+        # (slots must not be overwritten while their frames are in queue or processed by workers)
+        self.__frame_buffer = SharedFrameRingBuffer(slot_count=queue_size + self.__worker_count + 2,
+                                                    slot_size=self.__frame_size)
+        self.__queue_depth_gauge.set_function(self.__frame_queue.qsize)
+
+        for i in range(self.__worker_count):
+            p = Process(target=analyze_face_info_with_worker_process,
+                        args=(self.__frame_buffer.get_attach_info(), self.__frame_queue, self.__free_queue_count,
+                              self.__result_queue, self.__stop_event, get_face_information, self.__face_matcher,
+                              self.__debug_mode,))
+            p.daemon = True
+            p.start()
+            self.__processes.append(p)
+
+    def stop(self):
+        # wake up workers which wait frames
+        self.__stop_event.set()
+        for _ in self.__processes:
+            try:
+                self.__frame_queue.put_nowait(None)
+            except queue.Full:
+                break
+        for p in self.__processes:
+            p.join()
+        self.__processes = []
+        self.__queue_depth_gauge.clear_function(self.__frame_queue.qsize)
+
+        # frames which are not read by workers are discarded
+        self.__frame_queue.cancel_join_thread()
+        self.__frame_buffer.close()
+
+    def submit(self, run_id, frame):
+        """
+        send frame to workers. frame is dropped if all workers are busy.
+        :param run_id: int
+        :param frame: numpy.ndarray
+            RGB frame.
+        :return: bool
+            whether frame is sent or not.
+        """
+        # reserve queue before frame is written, not to overwrite slots of queued frames by dropped frames
+        if not self.__free_queue_count.acquire(block=False):
+            self.__dropped_counter.inc()
+            return False
+
+        slot, sequence, shape = self.__frame_buffer.put(frame)
+        self.__frame_queue.put((run_id, slot, sequence, shape))
+        return True
+
+    def get_results(self, timeout=None):
+        """
+        get all results which are received.
+        :param timeout: float
+            time to wait the first result. it doesn't wait if it is None.
+        :return: list
+            list of (run id, face location, face name)
+        """
+        results = []
+        try:
+            item = self.__result_queue.get(timeout=timeout) if timeout is not None \
+                else self.__result_queue.get_nowait()
+            while True:
+                run_id, face_locations, face_names, timings = item
+                for stage, seconds in timings.items():
+                    self.__stage_histograms[stage].observe(seconds)
+                for face_location, face_name in zip(face_locations, face_names):
+                    results.append((run_id, face_location, face_name))
+                item = self.__result_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return results
+
+
+def analyze_face_info_with_worker_process(frame_buffer_info, frame_queue, free_queue_count, face_information_queue,
+                                          stop_event, get_face_info_func, face_matcher, debug_mode):
+    frame_buffer = SharedFrameRingBuffer.attach(frame_buffer_info)
+    while not stop_event.is_set():
+        # wait frame without busy loop
+        try:
+            item = frame_queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        if item is None:
+            break
 
-def get_face_information(frame, known_face_encodings, known_face_names):
+        # frame is skipped if it is already overwritten by newer frame
+        run_id, slot, sequence, shape = item
+        frame = frame_buffer.get(slot, sequence, shape)
+
+        # slot can be overwritten after frame is copied
+        free_queue_count.release()
+        if frame is None:
+            continue
+
+        timings = {}
+        face_locations, face_names = get_face_info_func(frame, face_matcher, timings)
+        face_information_queue.put((run_id, face_locations, face_names, timings))
+
+    # results which are not read by main process are discarded
+    if debug_mode:
+        print("face recognition worker is stopped.")
+    face_information_queue.cancel_join_thread()
+    frame_buffer.close()
+
+
+def get_face_information(frame, face_matcher, timings=None):
+    """
+    :param frame: numpy.ndarray
+        RGB frame.
+    :param face_matcher: FaceMatcher
+    :param timings: dict
+        time[sec] of "detect", "encode" and "match" stages are set if it is not None.
+    :return: tuple
+        (face locations, face names)
+    """
     # Find all the faces and face encodings in the current frame of video
+    start_time = time.perf_counter()
     face_locations = face_recognition.face_locations(frame)
+    detect_time = time.perf_counter()
     face_encodings = face_recognition.face_encodings(frame, face_locations)
-
-    face_names = []
-    for face_encoding in face_encodings:
-        # See if the face is a match for the known face(s)
-        matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-        name = "Unknown"
-
-        # # If a match was found in known_face_encodings, just use the first one.
-        # if True in matches:
-        #     first_match_index = matches.index(True)
-        #     name = known_face_names[first_match_index]
-
-        # Or instead, use the known face with the smallest distance to the new face
-        face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-        best_match_index = np.argmin(face_distances)
-        if matches[best_match_index]:
-            name = known_face_names[best_match_index]
-
-        face_names.append(name)
-
+    encode_time = time.perf_counter()
+
+    # use the known face with the smallest distance to each new face
+    face_names, _, _ = face_matcher.match(face_encodings)
+    if timings is not None:
+        timings["detect"] = detect_time - start_time
+        timings["encode"] = encode_time - detect_time
+        timings["match"] = time.perf_counter() - encode_time
     return face_locations, face_names
@@ -0,0 +1,339 @@
+import os
+import glob
+import time
+import numpy as np
+import cv2
+from abc import ABCMeta, abstractmethod
+from enum import Enum
+
+
+class FrameSourceType(Enum):
+    CAMERA = 0
+    VIDEO_FILE = 1
+    IMAGE_DIRECTORY = 2
+    SYNTHETIC = 3
+
+
+# extensions of images which are read from directory
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSourceFactory:
+    # prefix of "--source" argument
+    CAMERA_PREFIX = "camera:"
+    SYNTHETIC_NAME = "synthetic"
+
+    @classmethod
+    def create(cls, source_type, **kwargs):
+        """
+        create frame source.
+        :param source_type: FrameSourceType
+        :param kwargs: dict
+            arguments of constructor of each frame source.
+        :return: AbstractFrameSource
+        """
+        if source_type == FrameSourceType.CAMERA:
+            return CameraFrameSource(**kwargs)
+        elif source_type == FrameSourceType.VIDEO_FILE:
+            return VideoFileFrameSource(**kwargs)
+        elif source_type == FrameSourceType.IMAGE_DIRECTORY:
+            return ImageDirectoryFrameSource(**kwargs)
+        elif source_type == FrameSourceType.SYNTHETIC:
+            return SyntheticFrameSource(**kwargs)
+        else:
+            raise FrameSourceNotDefinedError("{} frame source is not defined!".format(source_type))
+
+    @classmethod
+    def create_from_argument(cls, source, size=None, fps=None):
+        """
+        create frame source from "--source" argument.
+        - "0" or "camera:0" : camera of the index
+        - "synthetic" or "synthetic:300" : synthetic frames (endless or the count of frames)
+        - directory or glob pattern (ex. "data/*.jpg") : images in name order
+        - other : video file
+        :param source: str or int
+        :param size: tuple
+            frame size of camera and synthetic source. format is (width, height).
+        :param fps: float
+            fps of camera and synthetic source.
+        :return: AbstractFrameSource
+        """
+        if isinstance(source, AbstractFrameSource):
+            return source
+
+        source = str(source)
+        if source.isdigit() or source.startswith(cls.CAMERA_PREFIX):
+            camera_index = int(source[len(cls.CAMERA_PREFIX):] if source.startswith(cls.CAMERA_PREFIX) else source)
+            return cls.create(FrameSourceType.CAMERA, camera_index=camera_index, size=size, fps=fps)
+        elif source == cls.SYNTHETIC_NAME or source.startswith(cls.SYNTHETIC_NAME + ":"):
+            frame_count = int(source.split(":")[1]) if ":" in source else None
+            return cls.create(FrameSourceType.SYNTHETIC, size=size if size is not None else (640, 480),
+                              fps=fps, frame_count=frame_count)
+        elif os.path.isdir(source) or glob.has_magic(source):
+            return cls.create(FrameSourceType.IMAGE_DIRECTORY, pattern=source)
+        else:
+            return cls.create(FrameSourceType.VIDEO_FILE, file_path=source)
+
+
+class FrameSourceNotDefinedError(Exception):
+    pass
+
+
+class FrameSourceOpenError(Exception):
+    pass
+
+
+class AbstractFrameSource:
+    """
+    source of frames which has the same interface as cv2.VideoCapture ("read", "get", "set", "release").
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def read(self):
+        """
+        :return: tuple
+            (ret, frame). ret is False if source is ended.
+        """
+        pass
+
+    @abstractmethod
+    def is_live(self):
+        """
+        :return: bool
+            True if frames are created in real time (ex. camera).
+            frames of live source should be read in latest-frame mode, and others can be read in every-frame mode.
+        """
+        pass
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop_id):
+        return 0
+
+    def set(self, prop_id, value):
+        # properties can't be changed as default
+        return False
+
+    def release(self):
+        pass
+
+
+class CameraFrameSource(AbstractFrameSource):
+    def __init__(self, camera_index=0, size=None, fps=None):
+        """
+        :param camera_index: int
+        :param size: tuple
+            format is (width, height). default size of camera is used if it is None.
+        :param fps: float
+        """
+        self.__capture = cv2.VideoCapture(camera_index)
+        if fps is not None:
+            self.__capture.set(cv2.CAP_PROP_FPS, fps)
+        if size is not None:
+            self.__capture.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+            self.__capture.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+
+    def read(self):
+        return self.__capture.read()
+
+    def is_live(self):
+        return True
+
+    def isOpened(self):
+        return self.__capture.isOpened()
+
+    def get(self, prop_id):
+        return self.__capture.get(prop_id)
+
+    def set(self, prop_id, value):
+        return self.__capture.set(prop_id, value)
+
+    def release(self):
+        self.__capture.release()
+
+
+class VideoFileFrameSource(AbstractFrameSource):
+    def __init__(self, file_path, is_realtime=False, is_loop=False):
+        """
+        :param file_path: str
+        :param is_realtime: bool
+            frames are read at fps of video if True. otherwise they are read as fast as possible.
+        :param is_loop: bool
+            video is replayed from the first frame after the last frame.
+        """
+        if not os.path.exists(file_path):
+            raise FrameSourceOpenError("{} is not found!".format(file_path))
+        self.__capture = cv2.VideoCapture(file_path)
+        if not self.__capture.isOpened():
+            raise FrameSourceOpenError("{} can't be opened!".format(file_path))
+        self.__is_loop = is_loop
+        self.__pacer = FramePacer(self.__capture.get(cv2.CAP_PROP_FPS) if is_realtime else None)
+
+    def read(self):
+        ret, frame = self.__capture.read()
+        if not ret and self.__is_loop:
+            self.__capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.__capture.read()
+        if ret:
+            self.__pacer.wait()
+        return ret, frame
+
+    def is_live(self):
+        return False
+
+    def isOpened(self):
+        return self.__capture.isOpened()
+
+    def get(self, prop_id):
+        return self.__capture.get(prop_id)
+
+    def release(self):
+        self.__capture.release()
+
+
+class ImageDirectoryFrameSource(AbstractFrameSource):
+    def __init__(self, pattern, fps=None, is_loop=False):
+        """
+        :param pattern: str
+            directory or glob pattern (ex. "data/**/*.jpg"). images are read in name order.
+        :param fps: float
+            images are read as fast as possible if it is None.
+        :param is_loop: bool
+        """
+        self.__file_paths = list_image_files(pattern)
+        if not self.__file_paths:
+            raise FrameSourceOpenError("image is not found in {}!".format(pattern))
+        self.__is_loop = is_loop
+        self.__pacer = FramePacer(fps)
+        self.__fps = fps
+        self.__index = 0
+        self.__current_file_path = None
+
+    def read(self):
+        while True:
+            if self.__index >= len(self.__file_paths):
+                if not self.__is_loop:
+                    return False, None
+                self.__index = 0
+
+            self.__current_file_path = self.__file_paths[self.__index]
+            self.__index += 1
+            frame = cv2.imread(self.__current_file_path)
+
+            # skip file which can't be decoded
+            if frame is not None:
+                self.__pacer.wait()
+                return True, frame
+
+    def is_live(self):
+        return False
+
+    def get_current_file_path(self):
+        """
+        :return: str
+            file path of frame which is read last.
+        """
+        return self.__current_file_path
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.__fps if self.__fps is not None else 0
+        elif prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.__file_paths)
+        return 0
+
+
+class SyntheticFrameSource(AbstractFrameSource):
+    def __init__(self, size=(640, 480), fps=30, frame_count=None):
+        """
+        deterministic source which creates frames with moving box and frame index.
+        the same frames are created every time, so it can be used for regression benchmark without camera.
+        :param size: tuple
+            format is (width, height).
+        :param fps: float
+            frames are created as fast as possible if it is None.
+        :param frame_count: int
+            source is ended after this count of frames. it is endless if None.
+        """
+        self.__size = size
+        self.__fps = fps
+        self.__frame_count = frame_count
+        self.__pacer = FramePacer(fps)
+        self.__index = 0
+        self.__is_opened = True
+
+    def read(self):
+        if not self.__is_opened or (self.__frame_count is not None and self.__index >= self.__frame_count):
+            return False, None
+
+        # wait next frame time like camera
+        self.__pacer.wait()
+
+        width, height = self.__size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        box_size = min(width, height) // 4
+        left = (self.__index * 8) % max(width - box_size, 1)
+        top = (height - box_size) // 2
+        cv2.rectangle(frame, (left, top), (left + box_size, top + box_size), (77, 255, 9), cv2.FILLED)
+        cv2.putText(frame, str(self.__index), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        self.__index += 1
+        return True, frame
+
+    def is_live(self):
+        # frames are dropped like camera if they are created in real time
+        return self.__fps is not None
+
+    def isOpened(self):
+        return self.__is_opened
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.__fps if self.__fps is not None else 0
+        elif prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.__size[0]
+        elif prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.__size[1]
+        elif prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return self.__frame_count if self.__frame_count is not None else -1
+        return 0
+
+    def release(self):
+        self.__is_opened = False
+
+
+def list_image_files(pattern):
+    """
+    list image files of directory or glob pattern in name order.
+    :param pattern: str
+        directory or glob pattern (ex. "data/**/*.jpg").
+    :return: list
+    """
+    if os.path.isdir(pattern):
+        file_paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        file_paths = glob.glob(pattern, recursive=True)
+    return sorted(path for path in file_paths if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+
+
+class FramePacer:
+    def __init__(self, fps=None):
+        """
+        wait until next frame time.
+        :param fps: float
+            "wait" returns immediately if it is None or 0.
+        """
+        self.__interval = 1.0 / fps if fps else None
+        self.__next_time = None
+
+    def wait(self):
+        if self.__interval is None:
+            return
+
+        now = time.monotonic()
+        if self.__next_time is None:
+            self.__next_time = now
+        if self.__next_time > now:
+            time.sleep(self.__next_time - now)
+        self.__next_time += self.__interval
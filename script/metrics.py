@@ -0,0 +1,312 @@
+import threading
+import time
+import weakref
+import bisect
+import math
+
+
+# default buckets of latency[sec] (from 0.5ms to 10sec)
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# buckets of batch size
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        registry of metrics. metric of the same name and labels is created only once,
+        so instrumented classes can get their metrics in constructor.
+        """
+        self.__lock = threading.Lock()
+        self.__metrics = {}
+
+    def histogram(self, name, help_text="", labels=None, buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.__get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def counter(self, name, help_text="", labels=None):
+        return self.__get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", labels=None):
+        return self.__get_or_create(Gauge, name, help_text, labels)
+
+    def get_metrics(self):
+        with self.__lock:
+            return list(self.__metrics.values())
+
+    def export_prometheus_text(self):
+        """
+        export all metrics as Prometheus text format (version 0.0.4).
+        :return: str
+        """
+        lines = []
+        written_names = set()
+        for metric in sorted(self.get_metrics(), key=lambda m: m.name):
+            # HELP and TYPE are written once for metrics which have the same name and different labels
+            if metric.name not in written_names:
+                written_names.add(metric.name)
+                lines.append("# HELP {} {}".format(metric.name, metric.help_text))
+                lines.append("# TYPE {} {}".format(metric.name, metric.TYPE))
+            lines.extend(metric.export_prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def __get_or_create(self, metric_class, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.__lock:
+            metric = self.__metrics.get(key)
+            if metric is None:
+                metric = metric_class(name, help_text, labels, **kwargs)
+                self.__metrics[key] = metric
+            elif not isinstance(metric, metric_class):
+                raise MetricsError("{} is already registered as {}!".format(name, metric.TYPE))
+            return metric
+
+
+class MetricsError(Exception):
+    pass
+
+
+class AbstractMetric:
+    TYPE = "untyped"
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = dict(labels or {})
+        self._lock = threading.Lock()
+
+    def get_label_text(self, extra_labels=None):
+        labels = dict(self.labels)
+        if extra_labels is not None:
+            labels.update(extra_labels)
+        if not labels:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(key, value) for key, value in sorted(labels.items())) + "}"
+
+    def export_prometheus_lines(self):
+        return []
+
+
+class Counter(AbstractMetric):
+    TYPE = "counter"
+
+    def __init__(self, name, help_text="", labels=None):
+        super(Counter, self).__init__(name, help_text, labels)
+        self.__value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.__value += amount
+
+    def get_value(self):
+        return self.__value
+
+    def export_prometheus_lines(self):
+        return ["{}{} {}".format(self.name, self.get_label_text(), self.__value)]
+
+
+class Gauge(AbstractMetric):
+    TYPE = "gauge"
+
+    def __init__(self, name, help_text="", labels=None):
+        super(Gauge, self).__init__(name, help_text, labels)
+        self.__value = 0
+        self.__function = None
+
+    def set(self, value):
+        self.__value = value
+
+    def set_function(self, function):
+        """
+        set function which returns current value (ex. qsize of queue).
+        it is called only when value is read, so instrumented code has no overhead.
+        bound method is referenced weakly, so gauge of global registry doesn't keep its object alive.
+        :param function: function
+        """
+        with self._lock:
+            if hasattr(function, "__self__") and hasattr(function, "__func__"):
+                self.__function = weakref.WeakMethod(function)
+            else:
+                self.__function = lambda: function
+
+    def clear_function(self, function=None):
+        """
+        clear function which is set by "set_function". value set by "set" is used after it.
+        :param function: function
+            if it is set, function is cleared only if it is the current function,
+            so function which is set by other instance later is kept.
+        """
+        with self._lock:
+            if function is None or self.__get_function() == function:
+                self.__function = None
+
+    def get_value(self):
+        function = self.__get_function()
+        if function is not None:
+            try:
+                return function()
+            except Exception:
+                return float("nan")
+        return self.__value
+
+    def __get_function(self):
+        # function is None if object of weakly referenced method is already deleted
+        reference = self.__function
+        return reference() if reference is not None else None
+
+    def export_prometheus_lines(self):
+        return ["{}{} {}".format(self.name, self.get_label_text(), self.get_value())]
+
+
+class Histogram(AbstractMetric):
+    TYPE = "histogram"
+
+    def __init__(self, name, help_text="", labels=None, buckets=DEFAULT_LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help_text, labels)
+        self.__buckets = tuple(buckets)
+        self.__bucket_counts = [0] * (len(self.__buckets) + 1)
+        self.__sum = 0.0
+        self.__count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.__buckets, value)
+        with self._lock:
+            self.__bucket_counts[index] += 1
+            self.__sum += value
+            self.__count += 1
+
+    def time(self):
+        """
+        measure time[sec] of "with" block.
+        """
+        return HistogramTimer(self)
+
+    def get_snapshot(self):
+        """
+        :return: tuple
+            (count, sum, bucket counts). bucket counts are not cumulative and the last one is +Inf bucket.
+        """
+        with self._lock:
+            return self.__count, self.__sum, list(self.__bucket_counts)
+
+    def get_buckets(self):
+        return self.__buckets
+
+    def export_prometheus_lines(self):
+        count, total, bucket_counts = self.get_snapshot()
+        lines = []
+        cumulative_count = 0
+        for bound, bucket_count in zip(self.__buckets + (math.inf,), bucket_counts):
+            cumulative_count += bucket_count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            lines.append("{}_bucket{} {}".format(self.name, self.get_label_text({"le": le}), cumulative_count))
+        lines.append("{}_sum{} {}".format(self.name, self.get_label_text(), total))
+        lines.append("{}_count{} {}".format(self.name, self.get_label_text(), count))
+        return lines
+
+
+class HistogramTimer:
+    def __init__(self, histogram):
+        self.__histogram = histogram
+        self.__start_time = None
+
+    def __enter__(self):
+        self.__start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__histogram.observe(time.perf_counter() - self.__start_time)
+
+
+def estimate_quantile(buckets, bucket_counts, quantile):
+    """
+    estimate quantile from bucket counts by linear interpolation in the bucket.
+    :param buckets: tuple
+        upper bounds of buckets.
+    :param bucket_counts: list
+        count of each bucket (not cumulative). the last one is +Inf bucket.
+    :param quantile: float
+    :return: float
+    """
+    total = sum(bucket_counts)
+    if total == 0:
+        return float("nan")
+
+    rank = quantile * total
+    cumulative_count = 0
+    for i, bucket_count in enumerate(bucket_counts):
+        if cumulative_count + bucket_count >= rank and bucket_count > 0:
+            if i >= len(buckets):
+                # value is over the largest bucket
+                return buckets[-1]
+            lower = buckets[i - 1] if i > 0 else 0.0
+            return lower + (buckets[i] - lower) * (rank - cumulative_count) / bucket_count
+        cumulative_count += bucket_count
+    return buckets[-1]
+
+
+class MetricsLogger:
+    def __init__(self, registry, interval=60.0, log_func=print):
+        """
+        initialize logger which writes one summary line of metrics periodically.
+        histograms are summarized with values observed in the interval.
+        :param registry: MetricsRegistry
+        :param interval: float
+            interval[sec] of log line.
+        :param log_func: function
+            function which receives log line.
+        """
+        self.__registry = registry
+        self.__interval = interval
+        self.__log_func = log_func
+        self.__previous_snapshots = {}
+        self.__stop_event = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is not None:
+            return
+
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run_loop)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+
+        self.__stop_event.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def create_log_line(self):
+        items = []
+        for metric in sorted(self.__registry.get_metrics(), key=lambda m: (m.name, m.get_label_text())):
+            name = metric.name + metric.get_label_text()
+            if isinstance(metric, Histogram):
+                count, total, bucket_counts = metric.get_snapshot()
+                previous_count, previous_total, previous_bucket_counts = self.__previous_snapshots.get(
+                    id(metric), (0, 0.0, [0] * len(bucket_counts)))
+                self.__previous_snapshots[id(metric)] = (count, total, bucket_counts)
+
+                # values in the interval
+                interval_count = count - previous_count
+                if interval_count == 0:
+                    continue
+                interval_bucket_counts = [c - p for c, p in zip(bucket_counts, previous_bucket_counts)]
+                items.append("{} n={} mean={:.4f} p50={:.4f} p99={:.4f}".format(
+                    name, interval_count, (total - previous_total) / interval_count,
+                    estimate_quantile(metric.get_buckets(), interval_bucket_counts, 0.5),
+                    estimate_quantile(metric.get_buckets(), interval_bucket_counts, 0.99)))
+            else:
+                items.append("{}={}".format(name, metric.get_value()))
+        return "metrics: " + ", ".join(items)
+
+    def __run_loop(self):
+        while not self.__stop_event.wait(self.__interval):
+            self.__log_func(self.create_log_line())
+
+
+# default registry which is used by instrumented classes
+REGISTRY = MetricsRegistry()
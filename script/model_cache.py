@@ -0,0 +1,256 @@
+import os
+import shutil
+import hashlib
+import threading
+from download_manager import get_sha256
+try:
+    import fcntl
+except ImportError:
+    # file lock is not supported (ex. windows), so cache is locked only in process
+    fcntl = None
+
+
+# environment variable to set cache directory. cache is disabled if it is empty (ex. "NEO_MODEL_CACHE_DIR=")
+CACHE_DIR_ENV_NAME = "NEO_MODEL_CACHE_DIR"
+
+# environment variable to set max byte size of cache. 0 means no limit
+CACHE_MAX_SIZE_ENV_NAME = "NEO_MODEL_CACHE_MAX_SIZE"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "neo_models")
+DEFAULT_CACHE_MAX_SIZE = 4 * 1024 ** 3
+
+
+class ModelCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_MAX_SIZE):
+        """
+        initialize content-addressed cache of model files which is shared by processes.
+        file is stored as "blobs/<sha256>" and each key (ex. url) refers it by "refs/<hash of key>".
+        file of a key is created only once while other processes wait for its lock file,
+        and it is hard-linked into model directory (it is copied if cache is on other file system).
+        :param cache_dir: str
+        :param max_size: int
+            max byte size of blobs. least recently used blobs are removed over it. None means no limit.
+        """
+        self.__cache_dir = cache_dir
+        self.__max_size = max_size
+        for name in ("blobs", "refs", "locks", "tmp"):
+            os.makedirs(os.path.join(cache_dir, name), exist_ok=True)
+
+    def get_cache_dir(self):
+        return self.__cache_dir
+
+    def lock(self, key):
+        """
+        lock key between processes and threads.
+        :param key: str
+        :return: FileLock
+        """
+        return FileLock(self.__get_key_path("locks", key) + ".lock")
+
+    def link(self, key, path, sha256=None):
+        """
+        link cached file of key to path.
+        :param key: str
+        :param path: str
+        :param sha256: str
+            hex digest of file. file which has the same content is used even if it is cached by other key.
+        :return: bool
+            False if file is not cached.
+        """
+        blob_path = self.__find_blob_path(key, sha256)
+        if blob_path is None:
+            return False
+        try:
+            # update modified time because it is used as last access time of LRU
+            os.utime(blob_path)
+            link_file(blob_path, path)
+        except FileNotFoundError:
+            # blob is evicted by other process
+            return False
+        return True
+
+    def put(self, key, file_path, sha256=None):
+        """
+        move file into cache.
+        :param key: str
+        :param file_path: str
+            file which is moved. it must be on the same file system (ex. path of "get_temp_path").
+        :param sha256: str
+            hex digest of file. it is calculated if it is None.
+        :return: str
+            path of blob.
+        """
+        if sha256 is None:
+            sha256 = get_sha256(file_path)
+        blob_path = os.path.join(self.__cache_dir, "blobs", sha256)
+        os.replace(file_path, blob_path)
+
+        # write reference atomically not to be read while writing
+        ref_path = self.__get_key_path("refs", key)
+        temp_ref_path = "{}.{}-{}".format(ref_path, os.getpid(), threading.get_ident())
+        with open(temp_ref_path, "w") as f:
+            f.write(sha256)
+        os.replace(temp_ref_path, ref_path)
+        return blob_path
+
+    def get_temp_path(self, key):
+        """
+        get path to create file of key. it is the same for each key so interrupted download can be resumed.
+        :param key: str
+        :return: str
+        """
+        return self.__get_key_path("tmp", key)
+
+    def get_file(self, key, path, create_func, sha256=None):
+        """
+        link cached file of key to path. file is created only if it is not cached.
+        :param key: str
+        :param path: str
+        :param create_func: function
+            function which receives temporary path and creates file there.
+        :param sha256: str
+            hex digest of file if it is known.
+        :return: bool
+            True if file was cached.
+        """
+        with self.lock(key):
+            is_cached = self.link(key, path, sha256)
+            if not is_cached:
+                temp_path = self.get_temp_path(key)
+                create_func(temp_path)
+                self.put(key, temp_path, sha256)
+                if not self.link(key, path, sha256):
+                    raise ModelCacheError("{} is evicted while it is linked!".format(key))
+        self.evict()
+        return is_cached
+
+    def evict(self):
+        """
+        remove least recently used blobs while total size is over max size.
+        the latest blob is always kept. hard links in model directories remain after their blobs are removed.
+        """
+        if self.__max_size is None:
+            return
+
+        with FileLock(os.path.join(self.__cache_dir, "evict.lock"), blocking=False) as is_locked:
+            # other process is evicting
+            if not is_locked:
+                return
+
+            blob_dir_path = os.path.join(self.__cache_dir, "blobs")
+            entries = []
+            for name in os.listdir(blob_dir_path):
+                blob_path = os.path.join(blob_dir_path, name)
+                try:
+                    stat = os.stat(blob_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, blob_path))
+            entries.sort()
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, blob_path in entries[:-1]:
+                if total_size <= self.__max_size:
+                    break
+                try:
+                    os.remove(blob_path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+                print("{} is evicted from model cache.".format(blob_path))
+
+    def __find_blob_path(self, key, sha256):
+        if sha256 is None:
+            try:
+                with open(self.__get_key_path("refs", key)) as f:
+                    sha256 = f.read().strip()
+            except FileNotFoundError:
+                return None
+
+        blob_path = os.path.join(self.__cache_dir, "blobs", sha256)
+        return blob_path if os.path.exists(blob_path) else None
+
+    def __get_key_path(self, dir_name, key):
+        # key is hashed because it may have characters which can't be used in file name
+        return os.path.join(self.__cache_dir, dir_name, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+
+class ModelCacheError(Exception):
+    pass
+
+
+class FileLock:
+    # locks in process which are used if fcntl is not supported
+    __thread_locks = {}
+    __thread_locks_lock = threading.Lock()
+
+    def __init__(self, path, blocking=True):
+        """
+        initialize exclusive lock between processes by flock.
+        "with" statement returns whether lock is acquired (it is always True if blocking is True).
+        :param path: str
+        :param blocking: bool
+        """
+        self.__path = path
+        self.__blocking = blocking
+        self.__file = None
+        self.__thread_lock = None
+
+    def __enter__(self):
+        if fcntl is None:
+            with self.__thread_locks_lock:
+                self.__thread_lock = self.__thread_locks.setdefault(self.__path, threading.Lock())
+            if self.__thread_lock.acquire(self.__blocking):
+                return True
+            self.__thread_lock = None
+            return False
+
+        # flock is held by open file, so threads in the same process are also excluded
+        self.__file = open(self.__path, "a")
+        try:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_EX | (0 if self.__blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            self.__file.close()
+            self.__file = None
+            return False
+        return True
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.__thread_lock is not None:
+            self.__thread_lock.release()
+            self.__thread_lock = None
+        if self.__file is not None:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+            self.__file.close()
+            self.__file = None
+
+
+def link_file(src_path, dst_path):
+    """
+    hard-link file. it is copied if hard link is not supported.
+    dst path is replaced atomically, so it is never read while it is written.
+    """
+    dir_path = os.path.dirname(dst_path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+
+    temp_path = "{}.link-{}-{}".format(dst_path, os.getpid(), threading.get_ident())
+    try:
+        os.link(src_path, temp_path)
+    except OSError:
+        # other file system or file system which doesn't support hard link
+        shutil.copyfile(src_path, temp_path)
+    os.replace(temp_path, dst_path)
+
+
+def get_default_cache():
+    """
+    get cache which is configured by environment variables.
+    :return: ModelCache
+        None if cache is disabled.
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV_NAME, DEFAULT_CACHE_DIR)
+    if not cache_dir:
+        return None
+    max_size = int(os.environ.get(CACHE_MAX_SIZE_ENV_NAME, DEFAULT_CACHE_MAX_SIZE))
+    return ModelCache(cache_dir, max_size if max_size > 0 else None)
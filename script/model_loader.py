@@ -3,6 +3,9 @@ import util
 import os
 from enum import Enum
 from coco import coco
+import download_manager
+from download_manager import DownloadManager, DownloadArtifact
+import model_cache
 
 
 class ModelType(Enum):
@@ -33,6 +36,12 @@ class ModelDefine(Enum):
                 "https://s3.us-east-2.amazonaws.com/dlc-models/aisage/mxnet-ssd-mobilenet-512/model.json",
                 "https://s3.us-east-2.amazonaws.com/dlc-models/aisage/mxnet-ssd-mobilenet-512/model.so"
             ],
+            # expected size and sha256 of each file ({file name: {"size": size, "sha256": hex digest}}).
+            # files are verified after download if they are defined. it can be created by
+            # "python3 download_manager.py <downloaded files>".
+            # size and sha256 of each downloaded file are also recorded in "<file>.verified",
+            # and existing file without it is downloaded again
+            "manifest": {},
             "input_size": (512, 512),
             "img_transpose": (2, 0, 1),
             "classes": ["aeroplane", "bicycle", "bird", "boat", "bottle", "bus", "car", "cat", "chair",
@@ -66,13 +75,16 @@ class ModelLoaderFactory:
 
         # get loader
         if loader_type == ModelLoaderType.TF_ZOO_LOADER:
-            return TfModelZooLoader(root_path=root_path, url=model_define["url"], classes=classes)
+            return TfModelZooLoader(root_path=root_path, url=model_define["url"], classes=classes,
+                                    manifest=model_define.get("manifest"),
+                                    is_streaming=model_define.get("is_streaming", True))
         elif loader_type == ModelLoaderType.MXNET_REMOTE_LOADER:
             return MXNetRemoteModelLoader(
                 root_path=root_path,
                 model_dir_name=model_define["model_dir_name"],
                 url_list=model_define["url_list"],
-                classes=classes
+                classes=classes,
+                manifest=model_define.get("manifest")
             )
         else:
             raise UndefinedModelLoaderError("{} loader type is not defined!".format(loader_type))
@@ -106,6 +118,10 @@ class AbstractModelLoader:
     def get_classes(self):
         return self._classes
 
+    def _create_download_manager(self):
+        # files are shared by processes and model root paths through cache
+        return DownloadManager(cache=model_cache.get_default_cache())
+
     @abstractmethod
     def _check_model_path(self):
         pass
@@ -118,9 +134,16 @@ class AbstractModelLoader:
 class RemoteArchiveModelLoader(AbstractModelLoader):
     __metaclass__ = ABCMeta
 
-    def __init__(self, root_path, model_type, url, classes):
+    def __init__(self, root_path, model_type, url, classes, manifest=None, is_streaming=True):
+        """
+        :param is_streaming: bool
+            if it is True, only required files are extracted while archive is downloaded and archive is not saved.
+            otherwise whole archive is downloaded and all files are extracted.
+        """
         super(RemoteArchiveModelLoader, self).__init__(root_path, model_type, classes)
         self._url = url
+        self._manifest = manifest
+        self._is_streaming = is_streaming
 
     def setup(self):
         # check model path
@@ -128,14 +151,26 @@ class RemoteArchiveModelLoader(AbstractModelLoader):
             print("{} path is already exist!".format(self._get_model_dir_path()))
             return
 
-        # download archive model
-        zip_file_name = self.__get_zip_filename()
-        util.download(self._url, os.path.join(self._root_path, zip_file_name))
+        if self._is_streaming:
+            # member name is relative path from root path (ex. "<model name>/frozen_inference_graph.pb")
+            member_paths = {os.path.relpath(path, self._root_path).replace(os.sep, "/"): path
+                            for path in self._get_required_file_paths()}
+            self._create_download_manager().download_and_extract(self._url, member_paths, self._manifest)
+            return
 
-        # extract archive
+        # download archive model. interrupted download is resumed
         archive_path = self.__get_archive_path()
+        artifact = DownloadArtifact.from_manifest(self._url, archive_path, self._manifest)
+        self._create_download_manager().download(artifact)
+
+        # extract archive
         util.extract_all(archive_path, self._root_path)
         os.remove(archive_path)
+        os.remove(archive_path + download_manager.VERIFIED_FILE_SUFFIX)
+        for path in self._get_required_file_paths():
+            if not os.path.exists(path):
+                raise download_manager.ArchiveMemberError("{} is not found in {}!".format(path, self._url))
+            download_manager.write_verified_info(path, self.__get_manifest_entry(path).get("sha256"))
 
     @abstractmethod
     def get_model_detail(self):
@@ -145,9 +180,21 @@ class RemoteArchiveModelLoader(AbstractModelLoader):
     def get_model_path(self):
         pass
 
+    def _get_required_file_paths(self):
+        """
+        files which are extracted in streaming mode.
+        :return: list
+        """
+        return [self.get_model_path()]
+
     def _check_model_path(self):
-        model_dir_path = self._get_model_dir_path()
-        return os.path.exists(model_dir_path)
+        # directory exists even if extraction is interrupted, so required files are checked
+        return all(download_manager.is_verified(path, self.__get_manifest_entry(path).get("size"),
+                                                self.__get_manifest_entry(path).get("sha256"))
+                   for path in self._get_required_file_paths())
+
+    def __get_manifest_entry(self, path):
+        return (self._manifest or {}).get(os.path.basename(path), {})
 
     def _get_model_dir_path(self):
         archive_path = self.__get_archive_path()
@@ -162,8 +209,9 @@ class RemoteArchiveModelLoader(AbstractModelLoader):
 
 
 class TfModelZooLoader(RemoteArchiveModelLoader):
-    def __init__(self, root_path, url, classes):
-        super(TfModelZooLoader, self).__init__(root_path, ModelType.TENSORFLOW, url, classes)
+    def __init__(self, root_path, url, classes, manifest=None, is_streaming=True):
+        super(TfModelZooLoader, self).__init__(root_path, ModelType.TENSORFLOW, url, classes, manifest,
+                                               is_streaming)
 
     def get_model_detail(self):
         model_file = os.path.join(self._get_model_dir_path(), "frozen_inference_graph.pb")
@@ -178,10 +226,11 @@ class TfModelZooLoader(RemoteArchiveModelLoader):
 class RemoteModelLoader(AbstractModelLoader):
     __metaclass__ = ABCMeta
 
-    def __init__(self, root_path, model_type, model_dir_name, url_list, classes):
+    def __init__(self, root_path, model_type, model_dir_name, url_list, classes, manifest=None):
         super(RemoteModelLoader, self).__init__(root_path, model_type, classes)
         self._model_dir_name = model_dir_name
         self._url_list = url_list
+        self._manifest = manifest
 
     def setup(self):
         # check model path
@@ -189,13 +238,10 @@ class RemoteModelLoader(AbstractModelLoader):
             print("{} path is already exist!".format(self._get_model_dir_path()))
             return
 
-        # download model data
-        model_dir_path = self._get_model_dir_path()
-        os.makedirs(model_dir_path, exist_ok=True)
-        for url in self._url_list:
-            file_name = os.path.basename(url)
-            file_path = os.path.join(model_dir_path, file_name)
-            util.download(url, file_path)
+        # download model data concurrently. files which are already downloaded are skipped
+        # and interrupted downloads are resumed
+        os.makedirs(self._get_model_dir_path(), exist_ok=True)
+        self._create_download_manager().download_all(self.__get_artifacts())
 
     @abstractmethod
     def get_model_detail(self):
@@ -205,20 +251,26 @@ class RemoteModelLoader(AbstractModelLoader):
         return self._get_model_dir_path()
 
     def _check_model_path(self):
-        model_dir_path = self._get_model_dir_path()
-        return os.path.exists(model_dir_path)
+        # directory exists even if download is interrupted, so every file is checked
+        return all(download_manager.is_downloaded(artifact) for artifact in self.__get_artifacts())
 
     def _get_model_dir_path(self):
         return os.path.join(self._root_path, self._model_dir_name)
 
+    def __get_artifacts(self):
+        model_dir_path = self._get_model_dir_path()
+        return [DownloadArtifact.from_manifest(url, os.path.join(model_dir_path, os.path.basename(url)), self._manifest)
+                for url in self._url_list]
+
 
 class MXNetRemoteModelLoader(RemoteModelLoader):
-    def __init__(self, root_path, model_dir_name, url_list, classes):
+    def __init__(self, root_path, model_dir_name, url_list, classes, manifest=None):
         super(MXNetRemoteModelLoader, self).__init__(root_path=root_path,
                                                      model_type=ModelType.MXNET,
                                                      model_dir_name=model_dir_name,
                                                      url_list=url_list,
-                                                     classes=classes)
+                                                     classes=classes,
+                                                     manifest=manifest)
 
     def get_model_detail(self):
         model_path_map = {}
@@ -0,0 +1,67 @@
+import threading
+
+
+class ModelRegistry:
+    def __init__(self):
+        """
+        registry of loaded model handles in process.
+        model of the same key (ex. model path and target device) is loaded only once,
+        so reloading wrapper or creating several wrappers doesn't pay load time again.
+        """
+        self.__lock = threading.Lock()
+        self.__models = {}
+
+    def get_or_create(self, key, create_func):
+        """
+        get model of key. it is created by create_func only if it is not registered.
+        :param key: tuple
+        :param create_func: function
+            function which returns model (ex. dlr.DLRModel).
+        :return: tuple
+            (SharedModel, bool). bool is True if model was already registered.
+        """
+        with self.__lock:
+            model = self.__models.get(key)
+            if model is not None:
+                return model, True
+
+            # models are loaded rarely, so other keys wait while model is loaded
+            model = SharedModel(create_func())
+            self.__models[key] = model
+            return model, False
+
+    def remove(self, key):
+        with self.__lock:
+            self.__models.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__models.clear()
+
+    def get_keys(self):
+        with self.__lock:
+            return list(self.__models.keys())
+
+
+class SharedModel:
+    def __init__(self, model):
+        """
+        model handle which can be used by several wrappers.
+        "run" is serialized because runtime doesn't allow concurrent run of the same handle.
+        :param model: object
+            model which has "run" function like dlr.DLRModel.
+        """
+        self.__model = model
+        self.__lock = threading.Lock()
+        self.is_warmed_up = False
+
+    def get_model(self):
+        return self.__model
+
+    def run(self, input_data):
+        with self.__lock:
+            return self.__model.run(input_data)
+
+
+# default registry which is used by SageMakerNeoWrapper
+MODEL_REGISTRY = ModelRegistry()
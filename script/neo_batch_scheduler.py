@@ -0,0 +1,175 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future
+from metrics import REGISTRY
+from neo_wrapper import get_output_size_array
+
+
+class NeoBatchScheduler:
+    # sentinel to stop scheduler thread
+    __STOP = object()
+
+    def __init__(self, wrapper, max_batch_size=None, max_batch_wait_time=None):
+        """
+        initialize scheduler which collects single image requests from many producers
+        and runs them as one batch.
+        model of wrapper needs to accept variable batch size.
+        :param wrapper: SageMakerNeoWrapper
+            wrapper which is already loaded.
+        :param max_batch_size: int
+            "max_batch_size" of NeoParameters is used if it is None.
+        :param max_batch_wait_time: float
+            longest time[sec] to wait other requests after the first request of batch is received.
+            "max_batch_wait_time" of NeoParameters is used if it is None.
+        """
+        params = wrapper.get_params()
+        self.__wrapper = wrapper
+        self.__max_batch_size = max_batch_size if max_batch_size is not None else params.max_batch_size
+        self.__max_batch_wait_time = \
+            max_batch_wait_time if max_batch_wait_time is not None else params.max_batch_wait_time
+
+        # scheduler thread has its own preprocessor not to share input tensor with "wrapper.run"
+        self.__preprocessor = wrapper.create_preprocessor()
+        self.__request_queue = queue.Queue()
+        self.__thread = None
+
+        # submit is rejected after stop is started, not to put request after stop sentinel
+        self.__lock = threading.Lock()
+        self.__is_stopping = False
+
+        # metrics
+        # (queue depth is read only while this scheduler is running, because gauge is shared by all schedulers)
+        self.__queue_depth_gauge = REGISTRY.gauge("neo_scheduler_queue_depth", "count of requests waiting batch")
+        self.__wait_histogram = REGISTRY.histogram("neo_scheduler_wait_seconds",
+                                                   "time[sec] from submit to start of batch")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        with self.__lock:
+            if self.__thread is not None:
+                return
+
+            self.__thread = threading.Thread(target=self.__run_loop)
+            self.__thread.daemon = True
+            self.__thread.start()
+        self.__queue_depth_gauge.set_function(self.__request_queue.qsize)
+
+    def stop(self):
+        """
+        stop scheduler after all submitted requests are processed.
+        """
+        with self.__lock:
+            if self.__thread is None or self.__is_stopping:
+                return
+            self.__is_stopping = True
+            self.__request_queue.put(self.__STOP)
+        self.__thread.join()
+
+        # requests which are not processed never get results
+        while True:
+            try:
+                request = self.__request_queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not self.__STOP and request[0].set_running_or_notify_cancel():
+                request[0].set_exception(SchedulerNotStartedException("scheduler is stopped!"))
+
+        with self.__lock:
+            self.__thread = None
+            self.__is_stopping = False
+        self.__queue_depth_gauge.clear_function(self.__request_queue.qsize)
+
+    def submit(self, image, output_size, file_name=None):
+        """
+        submit one image. this function can be called from many threads.
+        :param image: numpy.ndarray
+            BGR image. boxes are drawn into this image if "is_draw_box" parameter is True.
+        :param output_size: tuple
+            output size. format is (width, height).
+        :param file_name: str
+        :return: concurrent.futures.Future
+            result is NeoInferResult of this image.
+        """
+        # invalid request is rejected here not to fail other requests of the same batch
+        output_size = tuple(get_output_size_array(output_size, 1).reshape(2))
+
+        future = Future()
+        with self.__lock:
+            if self.__thread is None:
+                raise SchedulerNotStartedException("scheduler is not started! Please call 'start' function.")
+            if self.__is_stopping:
+                raise SchedulerNotStartedException("scheduler is stopped!")
+            self.__request_queue.put((future, image, output_size, file_name, time.perf_counter()))
+        return future
+
+    def run(self, image, output_size, file_name=None):
+        """
+        submit one image and wait the result.
+        :return: NeoInferResult
+        """
+        return self.submit(image, output_size, file_name).result()
+
+    def __run_loop(self):
+        while True:
+            requests, is_stopped = self.__collect_requests()
+            if requests:
+                self.__run_batch(requests)
+            if is_stopped:
+                return
+
+    def __collect_requests(self):
+        # wait the first request without timeout
+        request = self.__request_queue.get()
+        if request is self.__STOP:
+            return [], True
+
+        # collect other requests until batch is full or wait time is over
+        requests = [request]
+        deadline = time.monotonic() + self.__max_batch_wait_time
+        while len(requests) < self.__max_batch_size:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                request = self.__request_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is self.__STOP:
+                return requests, True
+            requests.append(request)
+        return requests, False
+
+    def __run_batch(self, requests):
+        # skip cancelled requests
+        requests = [request for request in requests if request[0].set_running_or_notify_cancel()]
+        if not requests:
+            return
+
+        futures, images, output_sizes, file_names, submit_times = map(list, zip(*requests))
+        start_time = time.perf_counter()
+        for submit_time in submit_times:
+            self.__wait_histogram.observe(start_time - submit_time)
+        file_name_list = file_names if any(name is not None for name in file_names) else None
+        try:
+            # each batch is one frame of profiler of wrapper
+            with self.__wrapper.profile_frame():
+                input_tensor = self.__wrapper.preprocess(images, self.__preprocessor)
+                model_output = self.__wrapper.infer(input_tensor)
+                result = self.__wrapper.create_result(images, model_output, output_sizes, file_name_list)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        # scatter result into each request
+        for future, one_result in zip(futures, result.split()):
+            future.set_result(one_result)
+
+
+class SchedulerNotStartedException(Exception):
+    pass
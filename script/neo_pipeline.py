@@ -0,0 +1,160 @@
+import threading
+import queue
+import collections
+from concurrent.futures import Future
+from metrics import REGISTRY
+
+
+class NeoInferencePipeline:
+    # sentinel to stop each stage
+    __STOP = object()
+
+    def __init__(self, wrapper, output_size, max_queue_size=2):
+        """
+        initialize pipeline which runs preprocessing, inference and result creation on separate threads.
+        preprocessing of frame N+1 and drawing of frame N-1 overlap with inference of frame N.
+        :param wrapper: SageMakerNeoWrapper
+            wrapper which is already loaded.
+        :param output_size: tuple
+            output size. format is (width, height).
+        :param max_queue_size: int
+            max size of each queue between stages. "submit" blocks while the first queue is full.
+        """
+        self.__wrapper = wrapper
+        self.__output_size = output_size
+
+        # each input tensor must not be overwritten until inference stage uses it
+        # (one in preprocess stage, "max_queue_size" in queue and one in inference stage)
+        self.__preprocessor = wrapper.create_preprocessor(buffer_count=max_queue_size + 2)
+
+        # bounded queues between stages
+        self.__preprocess_queue = queue.Queue(maxsize=max_queue_size)
+        self.__infer_queue = queue.Queue(maxsize=max_queue_size)
+        self.__result_queue = queue.Queue(maxsize=max_queue_size)
+
+        # queue depth of each stage
+        # (it is read only while this pipeline is running, because gauges are shared by all pipelines)
+        queue_help = "count of frames waiting each stage of NeoInferencePipeline"
+        self.__queue_depth_gauges = [
+            (REGISTRY.gauge("neo_pipeline_queue_depth", queue_help, {"stage": stage}), stage_queue)
+            for stage, stage_queue in (("preprocess", self.__preprocess_queue), ("infer", self.__infer_queue),
+                                       ("create_result", self.__result_queue))
+        ]
+
+        self.__threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        if self.__threads:
+            return
+
+        stages = [
+            (self.__preprocess_queue, self.__infer_queue, self.__preprocess),
+            (self.__infer_queue, self.__result_queue, self.__infer),
+            (self.__result_queue, None, self.__create_result),
+        ]
+        for in_queue, out_queue, func in stages:
+            thread = threading.Thread(target=self.__run_stage, args=(in_queue, out_queue, func))
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+        for gauge, stage_queue in self.__queue_depth_gauges:
+            gauge.set_function(stage_queue.qsize)
+
+    def stop(self):
+        """
+        stop pipeline after all submitted frames are processed.
+        """
+        if not self.__threads:
+            return
+
+        self.__preprocess_queue.put(self.__STOP)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+        for gauge, stage_queue in self.__queue_depth_gauges:
+            gauge.clear_function(stage_queue.qsize)
+
+    def submit(self, image, file_name=None):
+        """
+        submit one frame.
+        :param image: numpy.ndarray
+            BGR image. boxes are drawn into this image if "is_draw_box" parameter is True.
+        :param file_name: str
+        :return: concurrent.futures.Future
+            result is NeoInferResult.
+        """
+        if not self.__threads:
+            raise PipelineNotStartedException("pipeline is not started! Please call 'start' function.")
+
+        future = Future()
+        self.__preprocess_queue.put((future, [image], file_name))
+        return future
+
+    def stream(self, frames, in_flight_count=3):
+        """
+        run pipeline for each frame and yield results in order of frames.
+        :param frames: iterable
+            BGR images.
+        :param in_flight_count: int
+            count of frames which are processed at the same time.
+            default value keeps every stage busy.
+        :return: generator of NeoInferResult
+        """
+        pending = collections.deque()
+        for frame in frames:
+            pending.append(self.submit(frame))
+
+            # wait the oldest frame only when enough frames are in flight
+            if len(pending) >= in_flight_count:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def __run_stage(self, in_queue, out_queue, func):
+        while True:
+            item = in_queue.get()
+            if item is self.__STOP:
+                if out_queue is not None:
+                    out_queue.put(self.__STOP)
+                return
+
+            future = item[0]
+            try:
+                next_item = func(*item)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+
+            if out_queue is not None and next_item is not None:
+                out_queue.put(next_item)
+
+    def __preprocess(self, future, images, file_name):
+        # skip frame if it is cancelled
+        if not future.set_running_or_notify_cancel():
+            return None
+
+        input_tensor = self.__wrapper.preprocess(images, self.__preprocessor)
+        return future, images, file_name, input_tensor
+
+    def __infer(self, future, images, file_name, input_tensor):
+        # cProfile profiles only one thread, so only inference stage is profiled
+        with self.__wrapper.profile_frame():
+            model_output = self.__wrapper.infer(input_tensor)
+        return future, images, file_name, model_output
+
+    def __create_result(self, future, images, file_name, model_output):
+        file_name_list = None if file_name is None else [file_name]
+        result = self.__wrapper.create_result(images, model_output, self.__output_size, file_name_list)
+        future.set_result(result)
+
+
+class PipelineNotStartedException(Exception):
+    pass
@@ -0,0 +1,285 @@
+import threading
+import itertools
+import multiprocessing
+import queue
+import numpy as np
+from concurrent.futures import Future
+from enum import Enum
+from model_loader import ModelLoaderFactory
+from neo_wrapper import SageMakerNeoWrapper, NeoInferResult
+from shared_frame_buffer import SharedFrameBuffer
+
+
+class DispatchPolicy(Enum):
+    ROUND_ROBIN = 0
+    LEAST_LOADED = 1
+
+
+class NeoWorkerPool:
+    def __init__(self, params, worker_count=multiprocessing.cpu_count(),
+                 dispatch_policy=DispatchPolicy.LEAST_LOADED,
+                 max_frame_size=(1920, 1080), slot_count_per_worker=2):
+        """
+        initialize pool of worker processes. each worker has its own SageMakerNeoWrapper.
+        frames are passed to workers through shared memory, and boxes are drawn into it by workers.
+        :param params: NeoParameters
+        :param worker_count: int
+        :param dispatch_policy: DispatchPolicy
+        :param max_frame_size: tuple
+            max size of BGR frame. format is (width, height).
+        :param slot_count_per_worker: int
+            count of frames which can be sent to one worker at the same time.
+        """
+        self.__params = params
+        self.__worker_count = worker_count
+        self.__dispatch_policy = dispatch_policy
+        self.__slot_size = max_frame_size[0] * max_frame_size[1] * 3
+        self.__slot_count_per_worker = slot_count_per_worker
+
+        self.__workers = []
+        self.__result_queue = None
+        self.__collector = None
+        self.__condition = threading.Condition()
+        self.__round_robin_index = 0
+        self.__request_ids = itertools.count()
+        self.__pending = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        if self.__workers:
+            return
+
+        # download model data once before workers load it
+        loader = ModelLoaderFactory.get_loader(self.__params.model_define, self.__params.model_root_path)
+        loader.setup()
+
+        # start workers
+        self.__result_queue = multiprocessing.Queue()
+        for i in range(self.__worker_count):
+            self.__workers.append(_WorkerHandle(i, self.__params, self.__slot_count_per_worker,
+                                                self.__slot_size, self.__result_queue))
+
+        # wait until all workers load model.
+        # worker may be killed without reporting (ex. segmentation fault or out of memory), so it is checked periodically
+        loaded_indexes = set()
+        while len(loaded_indexes) < self.__worker_count:
+            try:
+                worker_index, error = self.__result_queue.get(timeout=1.0)
+            except queue.Empty:
+                for worker in self.__workers:
+                    if worker.index not in loaded_indexes and not worker.process.is_alive():
+                        self.__terminate()
+                        raise NeoWorkerException("worker {} is stopped while it loads model! exit code is {}".format(
+                            worker.index, worker.process.exitcode))
+                continue
+            if error is not None:
+                self.__terminate()
+                raise NeoWorkerException("worker {} failed to load model! {}".format(worker_index, error))
+            loaded_indexes.add(worker_index)
+
+        self.__collector = threading.Thread(target=self.__collect_results)
+        self.__collector.daemon = True
+        self.__collector.start()
+
+    def stop(self):
+        """
+        stop workers after all submitted frames are processed.
+        """
+        for worker in self.__workers:
+            worker.request_queue.put(None)
+        for worker in self.__workers:
+            worker.process.join()
+
+        if self.__collector is not None:
+            self.__result_queue.put(None)
+            self.__collector.join()
+            self.__collector = None
+
+        for worker in self.__workers:
+            worker.frame_buffer.close()
+        self.__workers = []
+
+    def __terminate(self):
+        # workers which are still loading model are killed, because they may not finish it
+        for worker in self.__workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.process.join()
+            worker.frame_buffer.close()
+        self.__workers = []
+
+    def submit(self, image, output_size, file_name=None):
+        """
+        submit one frame. it blocks while selected worker has no free slot.
+        :param image: numpy.ndarray
+            BGR image.
+        :param output_size: tuple
+            output size. format is (width, height).
+        :param file_name: str
+        :return: concurrent.futures.Future
+            result is NeoInferResult. its image is a copy of frame with boxes.
+        """
+        if not self.__workers:
+            raise NeoWorkerException("worker pool is not started! Please call 'start' function.")
+
+        # select worker and reserve its slot
+        with self.__condition:
+            worker = self.__select_worker()
+            while worker is None:
+                if not any(worker.is_alive for worker in self.__workers):
+                    raise NeoWorkerException("all workers are stopped unexpectedly!")
+                self.__condition.wait()
+                worker = self.__select_worker()
+            slot = worker.free_slots.pop()
+
+        # copy frame into shared memory and send only slot index
+        future = Future()
+        request_id = next(self.__request_ids)
+        try:
+            shape = worker.frame_buffer.write(slot, image)
+            with self.__condition:
+                self.__pending[request_id] = (future, worker, slot, shape)
+            worker.request_queue.put((request_id, slot, shape, output_size, file_name))
+        except Exception:
+            # slot is released not to block other frames forever (ex. frame is bigger than slot)
+            with self.__condition:
+                self.__pending.pop(request_id, None)
+                worker.free_slots.append(slot)
+                self.__condition.notify()
+            raise
+        return future
+
+    def run(self, image, output_size, file_name=None):
+        return self.submit(image, output_size, file_name).result()
+
+    def __select_worker(self):
+        # stopped workers have no free slots, so they are never selected
+        if self.__dispatch_policy == DispatchPolicy.ROUND_ROBIN:
+            for _ in range(len(self.__workers)):
+                if self.__workers[self.__round_robin_index].is_alive:
+                    break
+                self.__round_robin_index = (self.__round_robin_index + 1) % len(self.__workers)
+            worker = self.__workers[self.__round_robin_index]
+            if not worker.free_slots:
+                return None
+            self.__round_robin_index = (self.__round_robin_index + 1) % len(self.__workers)
+            return worker
+        elif self.__dispatch_policy == DispatchPolicy.LEAST_LOADED:
+            candidates = [worker for worker in self.__workers if worker.free_slots]
+            if not candidates:
+                return None
+            return max(candidates, key=lambda worker: len(worker.free_slots))
+        else:
+            raise NeoWorkerException("{} dispatch policy is not defined!".format(self.__dispatch_policy))
+
+    def __collect_results(self):
+        while True:
+            try:
+                item = self.__result_queue.get(timeout=1.0)
+            except queue.Empty:
+                self.__check_workers()
+                continue
+            if item is None:
+                return
+            self.__set_result(*item)
+
+    def __set_result(self, request_id, detections, error):
+        with self.__condition:
+            future, worker, slot, shape = self.__pending.pop(request_id)
+        if error is None:
+            image = np.array(worker.frame_buffer.get_frame(slot, shape))
+            future.set_result(NeoInferResult(detections, [image]))
+        else:
+            future.set_exception(NeoWorkerException(error))
+
+        # release slot
+        with self.__condition:
+            if worker.is_alive:
+                worker.free_slots.append(slot)
+            self.__condition.notify()
+
+    def __check_workers(self):
+        dead_workers = [worker for worker in self.__workers if worker.is_alive and not worker.process.is_alive()]
+        if not dead_workers:
+            return
+
+        # results which were sent before worker stopped are still set
+        try:
+            while True:
+                item = self.__result_queue.get_nowait()
+                if item is None:
+                    # "stop" is called, so sentinel is put back for collect loop
+                    self.__result_queue.put(None)
+                    break
+                self.__set_result(*item)
+        except queue.Empty:
+            pass
+
+        # futures of stopped workers never get results
+        for worker in dead_workers:
+            with self.__condition:
+                worker.is_alive = False
+                worker.free_slots = []
+                request_ids = [request_id for request_id, (_, pending_worker, _, _) in self.__pending.items()
+                               if pending_worker is worker]
+                futures = [self.__pending.pop(request_id)[0] for request_id in request_ids]
+                self.__condition.notify_all()
+            for future in futures:
+                future.set_exception(NeoWorkerException("worker {} is stopped unexpectedly! exit code is {}".format(
+                    worker.index, worker.process.exitcode)))
+
+
+class NeoWorkerException(Exception):
+    pass
+
+
+class _WorkerHandle:
+    def __init__(self, index, params, slot_count, slot_size, result_queue):
+        self.index = index
+        self.is_alive = True
+        self.frame_buffer = SharedFrameBuffer(slot_count, slot_size)
+        self.free_slots = list(range(slot_count))
+        self.request_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=run_neo_worker,
+            args=(index, params, self.frame_buffer.get_attach_info(), self.request_queue, result_queue)
+        )
+        self.process.daemon = True
+        self.process.start()
+
+
+def run_neo_worker(worker_index, params, frame_buffer_info, request_queue, result_queue):
+    frame_buffer = SharedFrameBuffer.attach(frame_buffer_info)
+
+    # load model once
+    try:
+        wrapper = SageMakerNeoWrapper(params)
+        wrapper.load()
+    except Exception as e:
+        result_queue.put((worker_index, "{}: {}".format(type(e).__name__, e)))
+        frame_buffer.close()
+        return
+    result_queue.put((worker_index, None))
+
+    while True:
+        request = request_queue.get()
+        if request is None:
+            break
+
+        # boxes are drawn into shared memory directly
+        request_id, slot, shape, output_size, file_name = request
+        image = frame_buffer.get_frame(slot, shape)
+        try:
+            file_name_list = None if file_name is None else [file_name]
+            result = wrapper.run([image], output_size, file_name_list)
+            result_queue.put((request_id, result.get_detections(), None))
+        except Exception as e:
+            result_queue.put((request_id, None, "{}: {}".format(type(e).__name__, e)))
+
+    frame_buffer.close()
@@ -1,10 +1,13 @@
-from model_loader import ModelLoaderFactory, get_transpose_tuple, ModelType
+from model_loader import ModelLoaderFactory, ModelType
+from preprocessor import ImagePreprocessor
+from metrics import REGISTRY, BATCH_SIZE_BUCKETS
+from profiler import get_profiler
+from model_registry import MODEL_REGISTRY, SharedModel
 import util
-import dlr
 from abc import ABCMeta, abstractmethod
 import numpy as np
 import os
-from PIL import Image
+import time
 import cv2
 from coco import coco
 
@@ -15,6 +18,20 @@ class SageMakerNeoWrapper:
         self.__model_loader = None
         self.__result_creator = None
         self.__params = params
+        self.__preprocessor = ImagePreprocessor(self.__params.model_define)
+
+        # metrics of each stage
+        stage_help = "time[sec] of each stage of SageMakerNeoWrapper"
+        self.__preprocess_histogram = REGISTRY.histogram("neo_stage_seconds", stage_help, {"stage": "preprocess"})
+        self.__infer_histogram = REGISTRY.histogram("neo_stage_seconds", stage_help, {"stage": "infer"})
+        self.__result_histogram = REGISTRY.histogram("neo_stage_seconds", stage_help, {"stage": "create_result"})
+        self.__run_histogram = REGISTRY.histogram("neo_stage_seconds", stage_help, {"stage": "run"})
+        self.__batch_size_histogram = REGISTRY.histogram("neo_batch_size", "image count of each inference",
+                                                         buckets=BATCH_SIZE_BUCKETS)
+
+        # profiler which profiles frames only when it is requested (ex. by signal or api)
+        # (it is shared with NeoBatchScheduler and NeoInferencePipeline which don't call "run")
+        self.__profiler = get_profiler("neo_wrapper")
 
         # create converter
         self.__one_detect_callback = None
@@ -32,20 +49,44 @@ class SageMakerNeoWrapper:
 
         self.__one_image_callback = None
         if self.__params.is_save_image_with_box:
+            # PIL is imported only when images are saved
+            from PIL import Image
+
             def callback2(image, file_name):
                 out_file_name = os.path.splitext(file_name)[0] + "_with_boxes.png"
                 Image.fromarray(image).save(out_file_name)
             self.__one_image_callback = callback2
 
-    def load(self):
-        # load model data
+    def load(self, model=None):
+        """
+        load model data and create Deep Learning Runtime.
+        runtime is registered in process by model path and target device, and it is reused by the next load.
+        model is warmed up with synthetic images if "warm_up_count" parameter is bigger than 0.
+        :param model: object
+            model which has "run" function like dlr.DLRModel (ex. StubDLRModel).
+            model data is not downloaded if it is set.
+        """
         loader = ModelLoaderFactory.get_loader(self.__params.model_define, self.__params.model_root_path)
-        loader.setup()
-        model_path = loader.get_model_path()
-
-        # create Deep Learning Runtime
+        is_shared_model_warmed_up = False
+        if model is None:
+            # load model data
+            loader.setup()
+            model_path = loader.get_model_path()
+
+            # create Deep Learning Runtime
+            # (dlr is imported only when it is used)
+            def create_model():
+                import dlr
+                return dlr.DLRModel(model_path, self.__params.target_device)
+            start_time = time.perf_counter()
+            model, is_registered = MODEL_REGISTRY.get_or_create((model_path, self.__params.target_device),
+                                                                create_model)
+            if not is_registered:
+                REGISTRY.gauge("neo_model_load_seconds", "time[sec] to create runtime of model").set(
+                    time.perf_counter() - start_time)
+            is_shared_model_warmed_up = model.is_warmed_up
         self.__model_loader = loader
-        self.__model = dlr.DLRModel(model_path, self.__params.target_device)
+        self.__model = model
 
         # create result creator
         model_type = self.__model_loader.get_model_detail().model_type
@@ -53,42 +94,198 @@ class SageMakerNeoWrapper:
                                                                         self.__one_detect_callback,
                                                                         self.__one_image_callback)
 
+        # runtime which is shared with other wrapper is already warm
+        if self.__params.warm_up_count > 0 and not is_shared_model_warmed_up:
+            warm_up_result = self.warm_up(self.__params.warm_up_count)
+            print("model is warmed up. {}".format(warm_up_result))
+
+    def warm_up(self, iteration_count=3, batch_size=1):
+        """
+        run inference with synthetic images of input size to finish one-time initialization of runtime
+        (ex. memory allocation) before the first request.
+        metrics and profiler are not used, so they are not affected.
+        :param iteration_count: int
+        :param batch_size: int
+        :return: WarmUpResult
+        """
+        if self.__model is None:
+            raise NotLoadException("SageMakerNeo Runtime is not initialized! Please call 'load' function.")
+
+        width, height = self.__params.model_define["input_size"]
+        images = np.random.RandomState(0).randint(0, 256, (batch_size, height, width, 3), dtype=np.uint8)
+        latencies = []
+        for _ in range(iteration_count):
+            start_time = time.perf_counter()
+            input_tensor = self.__preprocessor.preprocess(images)
+            model_output = self.__model.run(util.get_input_data(self.__params.model_define, input_tensor))
+            self.__result_creator.create_result(images, model_output, (width, height), self.__params.threshold)
+            latencies.append(time.perf_counter() - start_time)
+
+        result = WarmUpResult(latencies)
+        if isinstance(self.__model, SharedModel):
+            self.__model.is_warmed_up = True
+
+        warm_up_help = "latency[sec] of the first (cold) and the other (warm, median) inferences of warm up"
+        REGISTRY.gauge("neo_warm_up_seconds", warm_up_help, {"state": "cold"}).set(result.cold_latency)
+        REGISTRY.gauge("neo_warm_up_seconds", warm_up_help, {"state": "warm"}).set(result.get_warm_latency())
+        return result
+
     def run(self, original_images, output_size, file_name_list=None):
         """
         run inference.
         :param original_images: numpy.ndarray
-        :param output_size: tuple
-            output size. format is (width, height).
+        :param output_size: tuple or list
+            output size of all images. format is (width, height).
+            set list of it if output size is different for each image.
         :param file_name_list: list
         :return:
         """
-        # check model state and argument
+        # check arguments before preprocessing and inference not to waste them for invalid request
+        self.__check_arguments(original_images, output_size, file_name_list)
+
+        with self.__profiler.profile_frame(), self.__run_histogram.time():
+            input_tensor = self.preprocess(original_images)
+            result = self.infer(input_tensor)
+            return self.create_result(original_images, result, output_size, file_name_list)
+
+    def get_params(self):
+        return self.__params
+
+    def profile_frame(self):
+        """
+        profile "with" block as one frame if profiling is requested.
+        use it when stages are called without "run" (ex. batch of NeoBatchScheduler).
+        :return: context manager
+        """
+        return self.__profiler.profile_frame()
+
+    def get_classes(self):
+        """
+        :return: list
+            class names of model. index is class id.
+        """
+        if self.__model_loader is None:
+            raise NotLoadException("SageMakerNeo Runtime is not initialized! Please call 'load' function.")
+        return self.__model_loader.get_classes()
+
+    def create_preprocessor(self, buffer_count=1):
+        """
+        create preprocessor for this model.
+        use it when preprocessing is done on other thread (ex. NeoInferencePipeline).
+        :param buffer_count: int
+        :return: ImagePreprocessor
+        """
+        return ImagePreprocessor(self.__params.model_define, buffer_count)
+
+    def preprocess(self, original_images, preprocessor=None):
+        """
+        create input tensor from images.
+        :param original_images: numpy.ndarray
+        :param preprocessor: ImagePreprocessor
+            preprocessor of wrapper is used if it is None.
+        :return: numpy.ndarray
+        """
+        if preprocessor is None:
+            preprocessor = self.__preprocessor
+
+        # origin images are not changed by preprocessing, so they don't need to be copied
+        with self.__preprocess_histogram.time():
+            return preprocessor.preprocess(original_images)
+
+    def infer(self, input_tensor):
+        """
+        run Deep Learning Runtime.
+        :param input_tensor: numpy.ndarray
+        :return: list
+            output of DLRModel.
+        """
+        # check model state
         if self.__model is None:
             raise NotLoadException("SageMakerNeo Runtime is not initialized! Please call 'load' function.")
 
+        input_data = util.get_input_data(self.__params.model_define, input_tensor)
+        self.__batch_size_histogram.observe(len(input_tensor))
+        with self.__infer_histogram.time():
+            return self.__model.run(input_data)
+
+    def create_result(self, original_images, model_output, output_size, file_name_list=None):
+        """
+        create result from output of DLRModel.
+        boxes are drawn into original images if "is_draw_box" parameter is True.
+        :param original_images: numpy.ndarray
+        :param model_output: list
+        :param output_size: tuple or list
+            output size of all images. format is (width, height).
+            set list of it if output size is different for each image.
+        :param file_name_list: list
+            image is not saved if its file name is None.
+        :return: NeoInferResult
+        """
+        # check model state and argument
+        if self.__result_creator is None:
+            raise NotLoadException("SageMakerNeo Runtime is not initialized! Please call 'load' function.")
+
+        output_size = self.__check_arguments(original_images, output_size, file_name_list)
+
+        with self.__result_histogram.time():
+            return self.__result_creator.create_result(original_images,
+                                                       model_output, output_size,
+                                                       self.__params.threshold,
+                                                       file_name_list)
+
+    @staticmethod
+    def __check_arguments(original_images, output_size, file_name_list):
+        # return output size as array
         if file_name_list is not None and len(original_images) != len(file_name_list):
             raise ArgumentException("images count is not equal file name list count!")
+        return get_output_size_array(output_size, len(original_images))
 
-        # copy origin images
-        images = np.copy(original_images)
-
-        # create input data
-        model_define = self.__params.model_define
-        # TODO : move "transpose_tuple" function from model_loader class to this class.
-        transpose_tuple = get_transpose_tuple(model_define)
-        input_size = self.__params.model_define["input_size"]
-        imgs_ndarray = util.open_and_norm_images(images, input_size, transpose_tuple)
-        input_tensor = imgs_ndarray.astype("float32")
-        input_data = util.get_input_data(model_define, input_tensor)
 
-        # run inference
-        result = self.__model.run(input_data)
+class WarmUpResult:
+    def __init__(self, latencies):
+        """
+        :param latencies: list
+            latency[sec] of each warm up inference.
+        """
+        self.latencies = latencies
+        self.cold_latency = latencies[0] if latencies else float("nan")
 
-        # create result
-        return self.__result_creator.create_result(original_images,
-                                                   result, output_size,
-                                                   self.__params.threshold,
-                                                   file_name_list)
+    def get_warm_latency(self):
+        """
+        :return: float
+            median latency[sec] of inferences after the first one.
+        """
+        if len(self.latencies) < 2:
+            return float("nan")
+        return float(np.median(self.latencies[1:]))
+
+    def __str__(self):
+        return "cold: {:.1f} ms, warm: {:.1f} ms ({} iterations)".format(
+            self.cold_latency * 1000, self.get_warm_latency() * 1000, len(self.latencies))
+
+
+def get_output_size_array(output_size, image_count):
+    """
+    validate output size and convert it into array.
+    it is output sizes of each image only if it is 2-dimensional (ex. list of tuples).
+    :param output_size: tuple or list or numpy.ndarray
+        (width, height), or list of it for each image.
+    :param image_count: int
+    :return: numpy.ndarray
+        shape is (2,) or (image_count, 2).
+    """
+    try:
+        sizes = np.asarray(output_size, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise ArgumentException("output size must be (width, height) or list of it! {}".format(output_size))
+
+    if sizes.ndim == 2:
+        if sizes.shape != (image_count, 2):
+            raise ArgumentException("output size list must be list of (width, height) for each of {} images! {}"
+                                    .format(image_count, output_size))
+    elif sizes.shape != (2,):
+        raise ArgumentException("output size must be (width, height)! {}".format(output_size))
+    return sizes
 
 
 class NotLoadException(Exception):
@@ -101,7 +298,8 @@ class ArgumentException(Exception):
 
 class NeoParameters:
     def __init__(self, model_define, model_root_path, target_device,
-                 threshold=0.5, is_draw_box=True, is_save_image_with_box=False
+                 threshold=0.5, is_draw_box=True, is_save_image_with_box=False,
+                 max_batch_size=8, max_batch_wait_time=0.005, warm_up_count=3
                  ):
         self.model_define = model_define.value
         self.model_root_path = model_root_path
@@ -110,11 +308,20 @@ class NeoParameters:
         self.is_draw_box = is_draw_box
         self.is_save_image_with_box = is_save_image_with_box
 
+        # parameters of NeoBatchScheduler
+        # (max_batch_wait_time is the longest time[sec] to wait other requests after the first one)
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_time = max_batch_wait_time
+
+        # count of inferences with synthetic images in "load" (0 disables warm up)
+        self.warm_up_count = warm_up_count
+
 
 class NeoInferResult:
-    def __init__(self, result, images):
-        self.__result = result
+    def __init__(self, detections, images):
+        self.__detections = detections
         self.__images = images
+        self.__result = None
 
     def get_result(self):
         """
@@ -137,8 +344,20 @@ class NeoInferResult:
 
         (ymin, xmin, ymax, xmax) -> (bottom, left, top, right)
         """
+        # list format is created only when it is needed
+        if self.__result is None:
+            result_list = self.__detections.to_list()
+            self.__result = np.empty(len(result_list), dtype=object)
+            self.__result[:] = result_list
         return self.__result
 
+    def get_detections(self):
+        """
+        get result as columnar arrays.
+        :return: NeoDetections
+        """
+        return self.__detections
+
     def get_images(self):
         """
         get images.
@@ -148,6 +367,108 @@ class NeoInferResult:
         """
         return self.__images
 
+    def split(self):
+        """
+        split result into result of each image.
+        :return: list of NeoInferResult
+        """
+        return [NeoInferResult(detections, [image])
+                for detections, image in zip(self.__detections.split(), self.__images)]
+
+
+class NeoDetections:
+    def __init__(self, class_ids, scores, boxes, offsets):
+        """
+        detection result of all images as columnar arrays.
+        detections of i-th image are [offsets[i], offsets[i + 1]) rows of each array.
+        :param class_ids: numpy.ndarray
+            int32 array. shape is (M,).
+        :param scores: numpy.ndarray
+            float32 array. shape is (M,).
+        :param boxes: numpy.ndarray
+            float32 array. shape is (M, 4). format is (bottom, left, top, right).
+        :param offsets: numpy.ndarray
+            int64 array. shape is (N + 1,).
+        """
+        self.class_ids = class_ids
+        self.scores = scores
+        self.boxes = boxes
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_image_detections(self, index):
+        """
+        get detections of one image.
+        :param index: int
+        :return: tuple
+            (class_ids, scores, boxes)
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.class_ids[start:end], self.scores[start:end], self.boxes[start:end]
+
+    def split(self):
+        """
+        split detections into detections of each image.
+        arrays of each detections are views of this detections.
+        :return: list of NeoDetections
+        """
+        detections_list = []
+        for i in range(len(self)):
+            class_ids, scores, boxes = self.get_image_detections(i)
+            offsets = np.array([0, len(class_ids)], dtype=np.int64)
+            detections_list.append(NeoDetections(class_ids, scores, boxes, offsets))
+        return detections_list
+
+    def to_structured_array(self):
+        """
+        convert detections into structured array.
+        :return: numpy.ndarray
+            fields are "image_index", "class_id", "score" and "box".
+        """
+        dtype = np.dtype([("image_index", np.int32), ("class_id", np.int32),
+                          ("score", np.float32), ("box", np.float32, (4,))])
+        array = np.empty(len(self.class_ids), dtype=dtype)
+        array["image_index"] = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets))
+        array["class_id"] = self.class_ids
+        array["score"] = self.scores
+        array["box"] = self.boxes
+        return array
+
+    def to_list(self):
+        """
+        convert detections into list format of NeoInferResult.get_result.
+        :return: list
+        """
+        result = []
+        for i in range(len(self)):
+            class_ids, scores, boxes = self.get_image_detections(i)
+            result.append([[int(cid), float(score)] + box.tolist()
+                           for cid, score, box in zip(class_ids, scores, boxes)])
+        return result
+
+    @classmethod
+    def from_mask(cls, class_ids, scores, boxes, mask):
+        """
+        create detections from batched arrays and mask of valid detections.
+        :param class_ids: numpy.ndarray
+            shape is (N, K).
+        :param scores: numpy.ndarray
+            shape is (N, K).
+        :param boxes: numpy.ndarray
+            shape is (N, K, 4).
+        :param mask: numpy.ndarray
+            bool array. shape is (N, K).
+        :return: NeoDetections
+        """
+        offsets = np.zeros(len(mask) + 1, dtype=np.int64)
+        np.cumsum(np.count_nonzero(mask, axis=1), out=offsets[1:])
+        return cls(class_ids[mask].astype(np.int32),
+                   scores[mask].astype(np.float32),
+                   boxes[mask].astype(np.float32),
+                   offsets)
+
 
 class NeoResultConverterFactory:
     @classmethod
@@ -178,94 +499,83 @@ class AbstractNeoResultCreator:
         self._one_detect_callback = one_detect_callback
         self._one_image_callback = one_image_callback
 
-    @abstractmethod
     def create_result(self, origin_images, origin_result, output_size, threshold, file_name_list=None):
+        # decode all detections with array operations
+        detections = self._create_detections(origin_result, output_size, threshold)
+
+        # do callback functions if needed
+        self._do_callback(origin_images, detections, file_name_list)
+
+        # create neo result
+        return NeoInferResult(detections, origin_images)
+
+    @abstractmethod
+    def _create_detections(self, origin_result, output_size, threshold):
         pass
 
+    def _do_callback(self, origin_images, detections, file_name_list):
+        if self._one_detect_callback is None and self._one_image_callback is None:
+            return
+
+        for i in range(len(detections)):
+            # only detections over the threshold are visited
+            if self._one_detect_callback is not None:
+                class_ids, scores, boxes = detections.get_image_detections(i)
+                for cid, score, box in zip(class_ids, scores, boxes):
+                    (bottom, left, top, right) = box
+                    self._one_detect_callback(origin_images[i], int(cid), score, bottom, left, top, right)
+
+            if self._one_image_callback is not None and file_name_list is not None \
+                    and file_name_list[i] is not None:
+                self._one_image_callback(origin_images[i], file_name_list[i])
+
+    @staticmethod
+    def _get_box_scale(output_size):
+        """
+        get scale of (bottom, left, top, right).
+        :param output_size: tuple or list
+            (width, height) or list of it for each image.
+        :return: numpy.ndarray
+            shape is (4,) or (N, 1, 4).
+        """
+        sizes = np.asarray(output_size, dtype=np.float32)
+        scale = sizes[..., (1, 0, 1, 0)]
+        if scale.ndim == 2:
+            scale = scale[:, np.newaxis, :]
+        return scale
+
 
 class TFResultCreator(AbstractNeoResultCreator):
     def __init__(self, one_detect_callback=None, one_image_callback=None):
         super(TFResultCreator, self).__init__(one_detect_callback, one_image_callback)
 
-    def create_result(self, origin_images, origin_result, output_size, threshold, file_name_list=None):
+    def _create_detections(self, origin_result, output_size, threshold):
         boxes, classes, scores, num_det = origin_result
+        boxes = np.asarray(boxes)
+        classes = np.asarray(classes)
+        scores = np.asarray(scores)
 
-        # get file count
-        file_count = len(num_det)
-
-        # start loop
-        convert_res_for_imgs = []
-        for i in range(file_count):
-            n_obj = int(num_det[i])
-            convert_res_for_img = []
-            for j in range(n_obj):
-                # get class id
-                cid = int(classes[i][j])
-
-                # get score (check if it is the threshold)
-                score = scores[i][j]
-                if score < threshold:
-                    continue
-
-                # get box size
-                width = output_size[0]
-                height = output_size[1]
-                box = boxes[i][j]
-                (bottom, left, top, right) = box[0] * height, box[1] * width, box[2] * height, box[3] * width
-
-                # add result(class, id, score, box)
-                convert_res_for_img.append([cid, score, bottom, left, top, right])
-
-                # do callback function if needed
-                if self._one_detect_callback is not None:
-                    self._one_detect_callback(origin_images[i], cid, score, bottom, left, top, right)
-            convert_res_for_imgs.append(convert_res_for_img)
-
-            # do callback function if needed
-            if self._one_image_callback is not None and file_name_list is not None:
-                self._one_image_callback(origin_images[i], file_name_list[i])
+        # only the first "num_det" detections of each image are valid
+        num_det = np.asarray(num_det).astype(np.int64).reshape((-1, 1))
+        mask = np.arange(scores.shape[1]) < num_det
+        mask &= scores >= threshold
 
-        # create neo result
-        result = NeoInferResult(np.array(convert_res_for_imgs), origin_images)
-        return result
+        # (ymin, xmin, ymax, xmax) -> (bottom, left, top, right)
+        boxes = boxes * self._get_box_scale(output_size)
+        return NeoDetections.from_mask(classes, scores, boxes, mask)
 
 
 class MXNetResultCreator(AbstractNeoResultCreator):
     def __init__(self, one_detect_callback=None, one_image_callback=None):
         super(MXNetResultCreator, self).__init__(one_detect_callback, one_image_callback)
 
-    def create_result(self, origin_images, origin_result, output_size, threshold, file_name_list=None):
-        convert_res_for_imgs = []
-        for i, res_for_img in enumerate(origin_result[0]):
-            convert_res_for_img = []
-            for det in res_for_img:
-                # get class id
-                cid = int(det[0])
-                if cid < 0:
-                    continue
-
-                # get score (check if it is the threshold)
-                score = det[1]
-                if score < threshold:
-                    continue
-
-                # get box size
-                width = output_size[0]
-                height = output_size[1]
-                (left, right, top, bottom) = (det[2] * width, det[4] * width, det[3] * height, det[5] * height)
-
-                # add result(class id, score, box)
-                convert_res_for_img.append([cid, score, bottom, left, top, right])
-
-                # do callback function if needed
-                if self._one_detect_callback is not None:
-                    self._one_detect_callback(origin_images[i], cid, score, bottom, left, top, right)
-            convert_res_for_imgs.append(convert_res_for_img)
-
-            # do callback function if needed
-            if self._one_image_callback is not None and file_name_list is not None:
-                self._one_image_callback(origin_images[i], file_name_list[i])
+    def _create_detections(self, origin_result, output_size, threshold):
+        # each detection is [class id, score, xmin, ymin, xmax, ymax]
+        dets = np.asarray(origin_result[0])
+        classes = dets[:, :, 0]
+        scores = dets[:, :, 1]
+        mask = (classes >= 0) & (scores >= threshold)
 
-        # create neo result
-        result = NeoInferResult(np.array(convert_res_for_imgs), origin_images)
-        return result
+        # (xmin, ymin, xmax, ymax) -> (bottom, left, top, right)
+        boxes = dets[:, :, (5, 2, 3, 4)] * self._get_box_scale(output_size)
+        return NeoDetections.from_mask(classes, scores, boxes, mask)
@@ -0,0 +1,101 @@
+import threading
+import numpy as np
+import cv2
+from model_loader import get_transpose_tuple
+
+
+# mean value of RGB channels which is subtracted from input image
+MEAN_RGB = (123, 117, 104)
+
+
+class ImagePreprocessor:
+    def __init__(self, model_define, buffer_count=1):
+        """
+        initialize preprocessor.
+        input tensors are preallocated and reused across calls.
+        each thread has its own buffers, so preprocessor can be shared by threads
+        (ex. "run" of wrapper on request threads and warm up).
+        :param model_define: dict
+            value of ModelDefine.
+        :param buffer_count: int
+            count of input tensors which are used in turn.
+            set 2 or more if a tensor is still used by other thread while next images are preprocessed
+            by the same thread.
+        """
+        self.__input_size = model_define["input_size"]
+        self.__transpose_tuple = get_transpose_tuple(model_define)
+
+        # mean value with the same layout as one image of input tensor
+        mean = np.array(MEAN_RGB, dtype=np.float32).reshape((1, 1, 3))
+        if self.__transpose_tuple is not None:
+            mean = np.transpose(mean, self.__transpose_tuple)
+        self.__mean = np.ascontiguousarray(mean)
+
+        # shape of one image of input tensor (ex. (H, W, C) or (C, H, W))
+        width, height = self.__input_size
+        image_shape = (height, width, 3)
+        if self.__transpose_tuple is not None:
+            image_shape = tuple(image_shape[i] for i in self.__transpose_tuple)
+        self.__image_shape = image_shape
+
+        # preallocated buffers of each thread
+        self.__buffer_count = max(1, buffer_count)
+        self.__local = threading.local()
+
+    def get_image_shape(self):
+        return self.__image_shape
+
+    def preprocess(self, cv2_images):
+        """
+        resize images and convert them into input tensor.
+        channel swap (BGR -> RGB), mean subtraction and layout change are done in one pass
+        per image, and the result is written straight into the preallocated input tensor.
+        :param cv2_images: list or numpy.ndarray
+            BGR images. each shape is (H, W, 3).
+        :return: numpy.ndarray
+            float32 input tensor. shape is (N, H, W, C) or (N, C, H, W).
+            returned tensor is overwritten by later call of the same thread which uses the same buffer.
+        """
+        local = self.__get_local()
+        image_count = len(cv2_images)
+        input_tensor = self.__get_buffer(local, image_count)
+        for i, cv2_img in enumerate(cv2_images):
+            self.__write_image(local, cv2_img, input_tensor[i])
+        return input_tensor
+
+    def __get_local(self):
+        # buffers are allocated when thread uses preprocessor for the first time
+        local = self.__local
+        if not hasattr(local, "buffers"):
+            width, height = self.__input_size
+            local.buffers = [None] * self.__buffer_count
+            local.buffer_index = 0
+            local.resize_buffer = np.empty((height, width, 3), dtype=np.uint8)
+        return local
+
+    def __get_buffer(self, local, image_count):
+        index = local.buffer_index
+        local.buffer_index = (index + 1) % len(local.buffers)
+
+        # grow buffer if batch size is bigger than allocated one
+        buffer = local.buffers[index]
+        if buffer is None or len(buffer) < image_count:
+            buffer = np.empty((image_count,) + self.__image_shape, dtype=np.float32)
+            local.buffers[index] = buffer
+
+        # slice of leading axis keeps the tensor contiguous
+        return buffer[:image_count]
+
+    def __write_image(self, local, cv2_img, out):
+        # resize image (skip it if image size is already same as input size)
+        width, height = self.__input_size
+        if cv2_img.shape[0] == height and cv2_img.shape[1] == width:
+            img = cv2_img
+        else:
+            img = cv2.resize(cv2_img, self.__input_size, dst=local.resize_buffer)
+
+        # BGR -> RGB and layout change are only views, so subtraction writes each value once
+        view = img[:, :, ::-1]
+        if self.__transpose_tuple is not None:
+            view = np.transpose(view, self.__transpose_tuple)
+        np.subtract(view, self.__mean, out=out)
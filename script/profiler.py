@@ -0,0 +1,273 @@
+import os
+import io
+import time
+import signal
+import threading
+import util
+
+# profiling modules are imported only when profiling is requested
+
+
+# directory where reports are written
+DEFAULT_OUTPUT_DIR = "profile"
+
+# default count of frames which are profiled
+DEFAULT_FRAME_COUNT = 100
+
+
+class FrameProfiler:
+    def __init__(self, name, output_dir=DEFAULT_OUTPUT_DIR):
+        """
+        initialize profiler which profiles the next N frames only when it is requested.
+        it does nothing but one check per frame until "request" is called, so it can be left in hot paths.
+        cProfile profiles only the thread which runs the first profiled frame.
+        :param name: str
+            name of profiler. it is used in file name of report.
+        :param output_dir: str
+        """
+        self.__name = name
+        self.__output_dir = output_dir
+
+        self.__lock = threading.Lock()
+        self.__remaining_count = 0
+        self.__frame_count = 0
+        self.__with_memory = False
+        self.__profile = None
+        self.__owner_thread_id = None
+        self.__start_time = None
+        self.__start_rss = None
+        self.__start_snapshot = None
+        self.__is_tracemalloc_started = False
+        self.__last_report_path = None
+
+    def get_name(self):
+        return self.__name
+
+    def request(self, frame_count=DEFAULT_FRAME_COUNT, with_memory=True):
+        """
+        request profiling of the next frames. this function can be called from any thread.
+        :param frame_count: int
+        :param with_memory: bool
+            memory allocation is also traced by tracemalloc (it makes frames slower while profiling).
+        :return: bool
+            False if profiling is already running.
+        """
+        with self.__lock:
+            if self.is_active():
+                return False
+            self.__remaining_count = frame_count
+            self.__frame_count = frame_count
+            self.__with_memory = with_memory
+            return True
+
+    def is_active(self):
+        return self.__remaining_count > 0 or self.__profile is not None
+
+    def get_last_report_path(self):
+        return self.__last_report_path
+
+    def profile_frame(self):
+        """
+        profile "with" block as one frame if profiling is requested.
+        :return: context manager
+        """
+        if _signal_frame_count is not None:
+            _handle_signal_request()
+        if self.__remaining_count == 0:
+            return _NULL_CONTEXT
+        return _ProfiledFrame(self)
+
+    def tick(self):
+        """
+        mark boundary of frames in loop. everything between the first and the last tick is profiled.
+        use it instead of "profile_frame" if frame is not one block (ex. loop of face recognition).
+        """
+        if _signal_frame_count is not None:
+            _handle_signal_request()
+        if self.__remaining_count == 0:
+            return
+        if self.__profile is None:
+            self._begin_frame()
+        else:
+            self._end_frame(is_disabled=False)
+
+    def _begin_frame(self):
+        with self.__lock:
+            if self.__remaining_count == 0:
+                return False
+            if self.__profile is None:
+                self.__start()
+            elif self.__owner_thread_id != threading.get_ident():
+                # other threads are not profiled
+                return False
+
+            try:
+                self.__profile.enable()
+            except ValueError as e:
+                # only one profiler can be enabled at the same time in new python
+                print("profiling of {} is cancelled. {}".format(self.__name, e))
+                self.__cancel()
+                return False
+            return True
+
+    def _end_frame(self, is_disabled=True):
+        with self.__lock:
+            if self.__profile is None or self.__owner_thread_id != threading.get_ident():
+                return
+            if is_disabled:
+                self.__profile.disable()
+            self.__remaining_count -= 1
+            if self.__remaining_count > 0:
+                return
+            if not is_disabled:
+                self.__profile.disable()
+            self.__stop_and_write()
+
+    def __start(self):
+        import cProfile
+        import tracemalloc
+        self.__profile = cProfile.Profile()
+        self.__owner_thread_id = threading.get_ident()
+        self.__start_time = time.time()
+        self.__start_rss = util.get_mem_usage()
+        if self.__with_memory:
+            self.__is_tracemalloc_started = not tracemalloc.is_tracing()
+            if self.__is_tracemalloc_started:
+                tracemalloc.start()
+            self.__start_snapshot = tracemalloc.take_snapshot()
+
+    def __cancel(self):
+        import tracemalloc
+        if self.__with_memory and self.__is_tracemalloc_started:
+            tracemalloc.stop()
+        self.__start_snapshot = None
+        self.__profile = None
+        self.__owner_thread_id = None
+        self.__remaining_count = 0
+
+    def __stop_and_write(self):
+        import pstats
+        import tracemalloc
+        profile = self.__profile
+        process_time = time.time() - self.__start_time
+        end_rss = util.get_mem_usage()
+        memory_stats = None
+        if self.__with_memory:
+            end_snapshot = tracemalloc.take_snapshot()
+            memory_stats = end_snapshot.compare_to(self.__start_snapshot, "lineno")
+            if self.__is_tracemalloc_started:
+                tracemalloc.stop()
+            self.__start_snapshot = None
+
+        self.__profile = None
+        self.__owner_thread_id = None
+
+        # write raw profile for other tools (ex. snakeviz) and text report
+        os.makedirs(self.__output_dir, exist_ok=True)
+        base_path = os.path.join(self.__output_dir, "{}-{}".format(self.__name, time.strftime("%Y%m%d-%H%M%S")))
+        profile.dump_stats(base_path + ".prof")
+        with open(base_path + ".txt", "w") as f:
+            f.write("profile of {} : {} frames in {:.3f} sec\n".format(self.__name, self.__frame_count, process_time))
+            f.write("Memory RSS: {:,} -> {:,}\n\n".format(self.__start_rss, end_rss))
+            for sort_key in ("cumulative", "tottime"):
+                stream = io.StringIO()
+                pstats.Stats(profile, stream=stream).sort_stats(sort_key).print_stats(40)
+                f.write("==== sorted by {} ====\n".format(sort_key))
+                f.write(stream.getvalue())
+            if memory_stats is not None:
+                f.write("==== top memory allocations while profiling ====\n")
+                for stat in memory_stats[:30]:
+                    f.write("{}\n".format(stat))
+        self.__last_report_path = base_path + ".txt"
+        print("profile report of {} is written into {}".format(self.__name, self.__last_report_path))
+
+
+class _ProfiledFrame:
+    def __init__(self, profiler):
+        self.__profiler = profiler
+        self.__is_profiled = False
+
+    def __enter__(self):
+        self.__is_profiled = self.__profiler._begin_frame()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.__is_profiled:
+            self.__profiler._end_frame()
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_CONTEXT = _NullContext()
+
+# profilers which are toggled by signal or api
+_profilers = {}
+_profilers_lock = threading.Lock()
+
+# frame count which is requested by signal. it is applied by the next frame of any profiler
+_signal_frame_count = None
+
+
+def get_profiler(name):
+    """
+    get profiler of the name. it is created only once.
+    :param name: str
+    :return: FrameProfiler
+    """
+    with _profilers_lock:
+        profiler = _profilers.get(name)
+        if profiler is None:
+            profiler = FrameProfiler(name)
+            _profilers[name] = profiler
+        return profiler
+
+
+def get_profilers():
+    with _profilers_lock:
+        return list(_profilers.values())
+
+
+def request_profiling(frame_count=DEFAULT_FRAME_COUNT, with_memory=True):
+    """
+    request profiling of the next frames to all profilers.
+    :return: list
+        names of profilers which start profiling.
+    """
+    return [profiler.get_name() for profiler in get_profilers() if profiler.request(frame_count, with_memory)]
+
+
+def install_signal_handler(frame_count=DEFAULT_FRAME_COUNT, signal_number=None):
+    """
+    request profiling when signal is received (ex. "kill -USR1 <pid>").
+    request is applied to all profilers by the next frame of any profiler.
+    it must be called from main thread.
+    :param frame_count: int
+    :param signal_number: int
+        SIGUSR1 is used if it is None.
+    """
+    if signal_number is None:
+        if not hasattr(signal, "SIGUSR1"):
+            print("profiling signal is not supported on this platform.")
+            return
+        signal_number = signal.SIGUSR1
+
+    def handler(signum, frame):
+        # handler only sets request, because it may interrupt main thread while it has locks of profilers
+        global _signal_frame_count
+        _signal_frame_count = frame_count
+    signal.signal(signal_number, handler)
+
+
+def _handle_signal_request():
+    global _signal_frame_count
+    frame_count = _signal_frame_count
+    _signal_frame_count = None
+    if frame_count is None:
+        return
+    print("profiling is requested by signal. profilers : {}".format(request_profiling(frame_count)))
@@ -49,12 +49,14 @@ if __name__ == "__main__":
     frame_count_with_use_face_recog = st.sidebar.slider("frame count with use face recognition", min_value=2,
                                                         max_value=50, value=10)
     reduction_ratio = st.sidebar.selectbox("reduction ratio", (4, 2))
+    source = st.sidebar.text_input("source (camera index, video file, image directory or 'synthetic')", "0")
     st.sidebar.button("reload")
 
     # create VideoCaptureParams
     param = VideoCaptureParams()
     param.size = get_capture_size(display_mode_str)
     param.fps = fps
+    param.source = source
 
     # setup
     print("start to setup...")
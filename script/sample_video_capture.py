@@ -1,9 +1,16 @@
+import argparse
 import cv2
+from threaded_capture import ThreadedVideoCapture
+from frame_source import FrameSourceFactory
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="0", help="set frame source. default value is '0'(camera)")
+    args = parser.parse_args()
+
     # get video capture
-    video_capture = get_video_capture(fps=30)
+    video_capture = get_video_capture(fps=30, source=args.source)
 
     # set codec of video
     video_capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
@@ -14,21 +21,26 @@ def main():
         video_capture.get(cv2.CAP_PROP_FRAME_WIDTH),
         video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
     ))
+
+    # frames are read on capture thread not to be delayed by display
+    video_capture = ThreadedVideoCapture(video_capture)
+    video_capture.start()
     while True:
         ret, frame = video_capture.read()
+        if not ret:
+            break
         cv2.imshow('Video', frame)
         if cv2.waitKey(1) & 0xFF == ord('q'):
-            video_capture.release()
-            cv2.destroyAllWindows()
             break
 
+    print("captured frame count is {}, dropped frame count is {}".format(
+        video_capture.get_captured_count(), video_capture.get_dropped_count()))
+    video_capture.release()
+    cv2.destroyAllWindows()
+
 
-def get_video_capture(fps=30, frame_width=1920, frame_height=1080):
-    video_capture = cv2.VideoCapture(0)
-    video_capture.set(cv2.CAP_PROP_FPS, fps)
-    video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, frame_width)
-    video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_height)
-    return video_capture
+def get_video_capture(fps=30, frame_width=1920, frame_height=1080, source=0):
+    return FrameSourceFactory.create_from_argument(source, size=(frame_width, frame_height), fps=fps)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import sys
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SharedFrameBuffer:
+    def __init__(self, slot_count, slot_size, name=None):
+        """
+        initialize buffer which has fixed size frame slots on shared memory.
+        frames are written into slots and only slot index is sent to other processes.
+        :param slot_count: int
+        :param slot_size: int
+            byte size of one slot.
+        :param name: str
+            name of shared memory. new shared memory is created if it is None.
+        """
+        self._slot_count = slot_count
+        self._slot_size = slot_size
+        self._is_owner = name is None
+        if self._is_owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=self._get_total_size())
+        else:
+            self._shm = _attach_shared_memory(name)
+        self._slots = np.ndarray((slot_count, slot_size), dtype=np.uint8, buffer=self._shm.buf,
+                                 offset=self._get_slots_offset())
+
+    @classmethod
+    def attach(cls, attach_info):
+        """
+        attach buffer which is created by other process.
+        :param attach_info: tuple
+            value of "get_attach_info" function.
+        :return: SharedFrameBuffer
+        """
+        name, slot_count, slot_size = attach_info
+        return cls(slot_count, slot_size, name=name)
+
+    def get_attach_info(self):
+        return self._shm.name, self._slot_count, self._slot_size
+
+    def get_slot_count(self):
+        return self._slot_count
+
+    def write(self, index, frame):
+        """
+        copy frame into slot.
+        :param index: int
+        :param frame: numpy.ndarray
+            uint8 array.
+        :return: tuple
+            shape of frame which is needed to read it.
+        """
+        if frame.nbytes > self._slot_size:
+            raise FrameSizeException("frame size({}) is bigger than slot size({})!".format(
+                frame.nbytes, self._slot_size))
+        self.get_frame(index, frame.shape)[...] = frame
+        return frame.shape
+
+    def get_frame(self, index, shape):
+        """
+        get frame in slot without copy.
+        :param index: int
+        :param shape: tuple
+        :return: numpy.ndarray
+            view of shared memory. it is changed when slot is overwritten.
+        """
+        count = int(np.prod(shape))
+        return self._slots[index, :count].reshape(shape)
+
+    def close(self):
+        # views must be released before shared memory is closed
+        self._slots = None
+        self._shm.close()
+        if self._is_owner:
+            self._shm.unlink()
+
+    def _get_slots_offset(self):
+        return 0
+
+    def _get_total_size(self):
+        return self._get_slots_offset() + self._slot_count * self._slot_size
+
+
+class SharedFrameRingBuffer(SharedFrameBuffer):
+    # header alignment of shared memory
+    __ALIGNMENT = 64
+
+    def __init__(self, slot_count, slot_size, name=None):
+        """
+        initialize ring buffer of frames on shared memory.
+        one producer writes frames in turn, and the oldest frame is overwritten when buffer is full.
+        sequence number of each slot is saved in shared memory to detect overwritten frames.
+        :param slot_count: int
+        :param slot_size: int
+            byte size of one slot.
+        :param name: str
+            name of shared memory. new shared memory is created if it is None.
+        """
+        super(SharedFrameRingBuffer, self).__init__(slot_count, slot_size, name)
+        self.__sequences = np.ndarray((slot_count,), dtype=np.int64, buffer=self._shm.buf)
+        if self._is_owner:
+            self.__sequences[:] = -1
+        self.__next_sequence = 0
+
+    def put(self, frame):
+        """
+        write frame into next slot. this function must be called by one producer.
+        :param frame: numpy.ndarray
+            uint8 array.
+        :return: tuple
+            (slot index, sequence number, shape) which is needed to read frame.
+        """
+        sequence = self.__next_sequence
+        self.__next_sequence += 1
+        slot = sequence % self._slot_count
+
+        # mark slot as writing while frame is copied
+        self.__sequences[slot] = -1
+        shape = self.write(slot, frame)
+        self.__sequences[slot] = sequence
+        return slot, sequence, shape
+
+    def get(self, slot, sequence, shape):
+        """
+        copy frame from slot.
+        :param slot: int
+        :param sequence: int
+        :param shape: tuple
+        :return: numpy.ndarray
+            copy of frame. None is returned if frame is already overwritten by producer.
+        """
+        if self.__sequences[slot] != sequence:
+            return None
+        frame = np.array(self.get_frame(slot, shape))
+
+        # check that slot was not overwritten while copying it
+        if self.__sequences[slot] != sequence:
+            return None
+        return frame
+
+    def close(self):
+        self.__sequences = None
+        super(SharedFrameRingBuffer, self).close()
+
+    def _get_slots_offset(self):
+        header_size = self._slot_count * np.dtype(np.int64).itemsize
+        return -(-header_size // self.__ALIGNMENT) * self.__ALIGNMENT
+
+
+class FrameSizeException(Exception):
+    pass
+
+
+def _attach_shared_memory(name):
+    # shared memory which is attached must not be unlinked by resource tracker of attaching process
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
@@ -0,0 +1,62 @@
+import time
+import numpy as np
+from model_loader import ModelLoaderType
+from coco import coco
+
+
+class StubDLRModel:
+    def __init__(self, model_define, detection_count=100, valid_detection_count=10, run_time_per_image=0.0,
+                 seed=0):
+        """
+        initialize stub which has the same "run" function as dlr.DLRModel.
+        it returns outputs of the same format as model of "model_define" without model data,
+        so wrapper can be benchmarked on any CPU-only machine without downloads.
+        :param model_define: dict
+            value of ModelDefine.
+        :param detection_count: int
+            count of detections of each image in output.
+        :param valid_detection_count: int
+            count of detections of each image whose score is over 0.5.
+        :param run_time_per_image: float
+            time[sec] to simulate inference of one image. only overhead of wrapper is measured if it is 0.
+        :param seed: int
+            outputs are the same for the same seed.
+        """
+        self.__model_define = model_define
+        self.__detection_count = detection_count
+        self.__valid_detection_count = valid_detection_count
+        self.__run_time_per_image = run_time_per_image
+        self.__seed = seed
+
+        # class ids which are defined in classes of model
+        classes = model_define["classes"] if "classes" in model_define else coco.IMAGE_CLASSES
+        self.__class_ids = np.array(list(classes.keys()) if isinstance(classes, dict) else range(len(classes)),
+                                    dtype=np.float32)
+
+    def run(self, input_data):
+        input_tensor = list(input_data.values())[0] if isinstance(input_data, dict) else input_data
+        batch_size = len(input_tensor)
+
+        # touch input tensor like real model
+        float(np.mean(input_tensor))
+        if self.__run_time_per_image > 0:
+            time.sleep(self.__run_time_per_image * batch_size)
+
+        rng = np.random.RandomState(self.__seed)
+        shape = (batch_size, self.__detection_count)
+        scores = np.sort(rng.uniform(0.0, 0.5, shape).astype(np.float32), axis=1)[:, ::-1]
+        scores[:, :self.__valid_detection_count] += 0.5
+        class_ids = self.__class_ids[rng.randint(0, len(self.__class_ids), shape)]
+
+        # (ymin, xmin, ymax, xmax) in [0, 1]
+        mins = rng.uniform(0.0, 0.7, shape + (2,)).astype(np.float32)
+        maxs = mins + rng.uniform(0.05, 0.3, shape + (2,)).astype(np.float32)
+
+        if self.__model_define["loader_type"] == ModelLoaderType.TF_ZOO_LOADER:
+            boxes = np.concatenate([mins, maxs], axis=2)
+            num_det = np.full(batch_size, self.__detection_count, dtype=np.float32)
+            return [boxes, class_ids, scores, num_det]
+        else:
+            # [class id, score, xmin, ymin, xmax, ymax]
+            boxes = np.concatenate([mins[..., ::-1], maxs[..., ::-1]], axis=2)
+            return [np.concatenate([class_ids[..., np.newaxis], scores[..., np.newaxis], boxes], axis=2)]
@@ -0,0 +1,133 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from download_manager import DownloadManager, DownloadArtifact, DownloadError, ChecksumError, PART_FILE_SUFFIX, \
+    is_downloaded
+
+
+# content of files on test server
+FILE_DATA = bytes(range(256)) * 64
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        if self.path != "/model.bin":
+            self.send_error(404)
+            return
+
+        # only "bytes=<offset>-" is supported like most model servers
+        offset = 0
+        range_header = self.headers.get("Range")
+        if range_header is not None:
+            offset = int(range_header[len("bytes="):].split("-")[0])
+            if offset >= len(FILE_DATA):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(offset, len(FILE_DATA) - 1, len(FILE_DATA)))
+        else:
+            self.send_response(200)
+        body = FILE_DATA[offset:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        # connection is closed in the middle of body to interrupt download
+        if server.interrupt_count > 0:
+            server.interrupt_count -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+        self.server.requests = []
+        self.server.interrupt_count = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.temp_dir = tempfile.mkdtemp()
+        self.manager = DownloadManager(retry_count=2, timeout=5, cache=None, debug_mode=False)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def create_artifact(self, name="model.bin", sha256=None):
+        return DownloadArtifact(self.url + "/" + name, os.path.join(self.temp_dir, name), len(FILE_DATA),
+                                sha256 if sha256 is not None else hashlib.sha256(FILE_DATA).hexdigest())
+
+    def read_file(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_download(self):
+        artifact = self.create_artifact()
+        self.manager.download(artifact)
+        self.assertEqual(self.read_file(artifact.path), FILE_DATA)
+        self.assertFalse(os.path.exists(artifact.path + PART_FILE_SUFFIX))
+
+    def test_existing_file_without_record(self):
+        # broken file which is left by old download function is not trusted
+        artifact = DownloadArtifact(self.url + "/model.bin", os.path.join(self.temp_dir, "model.bin"))
+        with open(artifact.path, "wb") as f:
+            f.write(FILE_DATA[:1000])
+        self.assertFalse(is_downloaded(artifact))
+
+        self.manager.download(artifact)
+        self.assertEqual(self.read_file(artifact.path), FILE_DATA)
+        self.assertTrue(is_downloaded(artifact))
+
+        # verified file is not downloaded again
+        self.manager.download(artifact)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_resume_part_file(self):
+        artifact = self.create_artifact()
+        with open(artifact.path + PART_FILE_SUFFIX, "wb") as f:
+            f.write(FILE_DATA[:1000])
+
+        self.manager.download(artifact)
+        self.assertEqual(self.read_file(artifact.path), FILE_DATA)
+        self.assertFalse(os.path.exists(artifact.path + PART_FILE_SUFFIX))
+        self.assertEqual(self.server.requests, [("/model.bin", "bytes=1000-")])
+
+    def test_resume_interrupted_download(self):
+        self.server.interrupt_count = 1
+        artifact = self.create_artifact()
+        self.manager.download(artifact)
+        self.assertEqual(self.read_file(artifact.path), FILE_DATA)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1][1], "bytes={}-".format(len(FILE_DATA) // 2))
+
+    def test_checksum_error(self):
+        artifact = self.create_artifact(sha256="0" * 64)
+        with self.assertRaises(ChecksumError):
+            self.manager.download(artifact)
+        self.assertFalse(os.path.exists(artifact.path))
+        self.assertFalse(os.path.exists(artifact.path + PART_FILE_SUFFIX))
+
+    def test_not_found_is_not_retried(self):
+        artifact = self.create_artifact(name="missing.bin")
+        with self.assertRaises(DownloadError):
+            self.manager.download(artifact)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse(os.path.exists(artifact.path + PART_FILE_SUFFIX))
+
+
+if __name__ == "__main__":
+    unittest.main()
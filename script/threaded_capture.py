@@ -0,0 +1,222 @@
+import threading
+import collections
+import time
+from enum import Enum
+from frame_source import FrameSourceFactory, AbstractFrameSource
+from metrics import REGISTRY
+
+
+class CaptureMode(Enum):
+    # consumer gets the newest frame. frames which are not read before next frame arrives are dropped
+    LATEST = 0
+    # consumer gets every frame in order. reader thread waits while ring buffer is full
+    EVERY = 1
+
+
+class CapturedFrame:
+    def __init__(self, frame, index, capture_time):
+        """
+        frame read by ThreadedVideoCapture.
+        :param frame: numpy.ndarray
+            BGR image.
+        :param index: int
+            index of frame in source (dropped frames are also counted).
+        :param capture_time: float
+            time.monotonic() when frame is read from source.
+        """
+        self.frame = frame
+        self.index = index
+        self.capture_time = capture_time
+
+    def get_age(self):
+        """
+        :return: float
+            time[sec] from capture to now.
+        """
+        return time.monotonic() - self.capture_time
+
+
+class ThreadedVideoCapture:
+    def __init__(self, source, mode=None, buffer_size=2, max_read_failure_count=30):
+        """
+        initialize capture which reads frames on dedicated thread into small ring buffer,
+        so slow processing doesn't back up the driver buffer and frames are not stale.
+        :param source: int, str or object
+            "--source" argument of FrameSourceFactory, AbstractFrameSource,
+            or object which has "read" and "release" like cv2.VideoCapture.
+        :param mode: CaptureMode
+            if it is None, LATEST is used for live source and EVERY is used for other source (ex. video file).
+        :param buffer_size: int
+            size of ring buffer.
+        :param max_read_failure_count: int
+            source is regarded as ended if reading fails continuously this count (ex. end of video file).
+        """
+        if isinstance(source, (int, str)):
+            source = FrameSourceFactory.create_from_argument(source)
+        if mode is None:
+            is_live = source.is_live() if isinstance(source, AbstractFrameSource) else True
+            mode = CaptureMode.LATEST if is_live else CaptureMode.EVERY
+        self.__source = source
+        self.__mode = mode
+        self.__max_read_failure_count = max_read_failure_count
+
+        self.__buffer = collections.deque(maxlen=buffer_size)
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__is_stopped = False
+        self.__is_ended = False
+        self.__is_released = False
+
+        # statistics
+        self.__captured_count = 0
+        self.__dropped_count = 0
+        self.__captured_counter = REGISTRY.counter("capture_frames_total", "count of frames read from source")
+        self.__dropped_counter = REGISTRY.counter("capture_dropped_frames_total",
+                                                  "count of frames dropped before they are read")
+        self.__age_histogram = REGISTRY.histogram("capture_frame_age_seconds",
+                                                  "time[sec] from capture to read of frame")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def start(self):
+        """
+        start reader thread. capture which is stopped can be started again, but released one can't.
+        """
+        if self.__thread is not None:
+            return
+        if self.__is_released:
+            raise CaptureReleasedError("video capture is already released!")
+
+        with self.__condition:
+            self.__buffer.clear()
+            self.__is_stopped = False
+            self.__is_ended = False
+        self.__thread = threading.Thread(target=self.__run_loop)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """
+        stop reader thread. frames in ring buffer are discarded.
+        """
+        if self.__thread is None:
+            return
+
+        with self.__condition:
+            self.__is_stopped = True
+            self.__condition.notify_all()
+        self.__thread.join()
+        self.__thread = None
+
+    def release(self):
+        """
+        stop reader thread and release source.
+        """
+        self.stop()
+        self.__source.release()
+        self.__is_released = True
+
+    def get(self, prop_id):
+        """
+        get property of source (ex. cv2.CAP_PROP_FPS).
+        """
+        return self.__source.get(prop_id)
+
+    def set(self, prop_id, value):
+        """
+        set property of source. it should be called before "start".
+        """
+        return self.__source.set(prop_id, value)
+
+    def get_mode(self):
+        return self.__mode
+
+    def get_captured_count(self):
+        return self.__captured_count
+
+    def get_dropped_count(self):
+        return self.__dropped_count
+
+    def read(self, timeout=None):
+        """
+        read frame. same interface as cv2.VideoCapture.read.
+        :param timeout: float
+        :return: tuple
+            (ret, frame). ret is False if source is ended or timeout is over.
+        """
+        captured_frame = self.read_frame(timeout)
+        if captured_frame is None:
+            return False, None
+        return True, captured_frame.frame
+
+    def read_frame(self, timeout=None):
+        """
+        wait frame which is not read yet.
+        :param timeout: float
+        :return: CapturedFrame
+            None is returned if source is ended or timeout is over.
+        """
+        if self.__thread is None:
+            self.start()
+
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.__buffer or self.__is_ended or self.__is_stopped, timeout):
+                return None
+            if not self.__buffer:
+                return None
+
+            if self.__mode == CaptureMode.LATEST:
+                # frames older than the newest one are dropped
+                captured_frame = self.__buffer.pop()
+                self.__dropped_count += len(self.__buffer)
+                self.__dropped_counter.inc(len(self.__buffer))
+                self.__buffer.clear()
+            else:
+                captured_frame = self.__buffer.popleft()
+                self.__condition.notify_all()
+        self.__age_histogram.observe(captured_frame.get_age())
+        return captured_frame
+
+    def __run_loop(self):
+        failure_count = 0
+        index = 0
+        while not self.__is_stopped:
+            ret, frame = self.__source.read()
+            capture_time = time.monotonic()
+            if not ret:
+                failure_count += 1
+                if failure_count >= self.__max_read_failure_count:
+                    break
+                continue
+            failure_count = 0
+
+            with self.__condition:
+                if self.__mode == CaptureMode.EVERY:
+                    # wait consumer not to drop frame
+                    self.__condition.wait_for(lambda: len(self.__buffer) < self.__buffer.maxlen or self.__is_stopped)
+                    if self.__is_stopped:
+                        break
+                elif len(self.__buffer) == self.__buffer.maxlen:
+                    # the oldest frame is overwritten
+                    self.__dropped_count += 1
+                    self.__dropped_counter.inc()
+
+                self.__buffer.append(CapturedFrame(frame, index, capture_time))
+                self.__captured_count += 1
+                self.__captured_counter.inc()
+                self.__condition.notify_all()
+            index += 1
+
+        with self.__condition:
+            self.__is_ended = True
+            self.__condition.notify_all()
+
+
+class CaptureReleasedError(Exception):
+    pass
+
@@ -1,12 +1,9 @@
 import os
-import urllib.request as urllib
-import tarfile
 import numpy as np
-from object_detection.utils import visualization_utils
-from PIL import Image
 from coco import coco
-import psutil
-import cv2
+
+# heavy modules (cv2, PIL, psutil, urllib and tarfile) are imported only in functions which use them,
+# so scripts which import util for small helpers start fast
 
 
 def download(url, path, overwrite=False):
@@ -14,21 +11,42 @@ def download(url, path, overwrite=False):
         print('File {} existed, skip.'.format(path))
         return
     print('Downloading from url {} to {}'.format(url, path))
-    try:
-        urllib.request.urlretrieve(url, path)
-    except:
-        urllib.urlretrieve(url, path)
+    import urllib.request
+    urllib.request.urlretrieve(url, path)
 
 
 def extract_all(archive_path, extract_root_path):
     # extract all files from archive
+    import tarfile
     with tarfile.open(archive_path) as tar:
-        tar.extractall(path=extract_root_path)
+        members = []
+        for member in tar.getmembers():
+            if not is_safe_tar_member(member):
+                print("{} in archive is skipped because it may be written outside of extract directory.".format(
+                    member.name))
+                continue
+            members.append(member)
+        tar.extractall(path=extract_root_path, members=members)
 
     # return extract root directory path
     return get_extract_dir_path(archive_path, extract_root_path)
 
 
+def is_safe_tar_member(member):
+    """
+    check whether member of tar archive is written into extract directory.
+    absolute path, parent directory and links (which can point outside) are rejected.
+    :param member: tarfile.TarInfo
+    :return: bool
+    """
+    if not (member.isfile() or member.isdir()):
+        return False
+    name = member.name.replace("\\", "/")
+    if name.startswith("/") or os.path.isabs(name):
+        return False
+    return ".." not in name.split("/")
+
+
 def get_extract_dir_path(archive_path, extract_root_path):
     zip_file_name = os.path.basename(archive_path)
     name_pair = os.path.splitext(zip_file_name)
@@ -85,6 +103,10 @@ def draw_image(source, image, x, y):
 
 
 def recreate_images_with_bounding_boxes(inp_files, input_tensor, res):
+    # object detection api is imported only when it is used
+    from object_detection.utils import visualization_utils
+    from PIL import Image
+
     boxes, classes, scores, num_det = res
 
     for i, fname in enumerate(inp_files):
@@ -113,8 +135,13 @@ def recreate_images_with_bounding_boxes(inp_files, input_tensor, res):
 
 
 def print_mem_usage():
+    print("Memory RSS: {:,}".format(get_mem_usage()))
+
+
+def get_mem_usage():
+    import psutil
     process = psutil.Process(os.getpid())
-    print("Memory RSS: {:,}".format(process.memory_info().rss))
+    return process.memory_info().rss
 
 
 def get_ndarray_from_imagefiles(img_files, out_size, transpose_tuple=None):
@@ -131,6 +158,7 @@ def get_ndarray_from_imagefiles(img_files, out_size, transpose_tuple=None):
     :return: numpy.array
     """
 
+    from PIL import Image
     res = []
     for f in img_files:
         img = np.array(Image.open(f).resize(out_size))
@@ -163,6 +191,7 @@ def open_and_norm_images(cv2_images, input_size, transpose_tuple=None):
 
 
 def __resize_and_norm_image(cv2_img, input_size, transpose_tuple=None):
+    import cv2
     img = cv2.resize(cv2_img, input_size)
     img = img[:, :, (2, 1, 0)].astype(np.float32)
     img -= np.array([123, 117, 104])
@@ -1,52 +1,66 @@
-from flask import Flask, jsonify
+from flask import Flask, Request, Response, jsonify, request
 from flask_cors import CORS
+import argparse
 import platform
-from multiprocessing import set_start_method
-from face_recognition_util import FaceRecognitionMode, VideoCaptureParams, RealTimeFaceRecognition, DisplayType
-from enum import Enum
 import time
+from io import BytesIO
+import numpy as np
+import cv2
+from multiprocessing import set_start_method
+from face_recognition_service import FaceRecognitionService
+from metrics import REGISTRY, MetricsLogger
+from profiler import get_profilers, request_profiling, install_signal_handler, DEFAULT_FRAME_COUNT
+from api_result import RESULT_CODE_NAME, RESULT_DETAIL_NAME, RESULT_TIME_NAME, RESULT_FACE_NAME, \
+    RESULT_DETECTIONS_NAME, ResultCode
 
 
-# global instance
-app = Flask(__name__)
-CORS(app)
-#face_recognition_module = None
+# max size of request body (uploaded images are kept in memory)
+MAX_CONTENT_LENGTH = 32 * 1024 * 1024
 
+# form field name of uploaded images
+DETECT_IMAGE_FIELD_NAME = "image"
 
-# static value
-RESULT_CODE_NAME = "result_code"
-RESULT_DETAIL_NAME = "result_detail"
-RESULT_TIME_NAME = "result_time"
-RESULT_FACE_NAME = "result_face_name"
+# content type of Prometheus text format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
 
 
-# result code
-class ResultCode(Enum):
-    OK = 0
-    NotInitialized = 1
-    UnknownError = 99
+class InMemoryRequest(Request):
+    # uploaded files are not written into temporary files
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
+
+
+# global instance
+app = Flask(__name__)
+app.request_class = InMemoryRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+CORS(app)
+face_recognition_service = None
+detection_scheduler = None
 
 
 @app.route("/face", methods=["GET"])
 def face_recognition():
-    # initialize (TODO : need to do this function in other function)
-    face_recognition_module = initialize_module()
-
     # check the whether face module is initialized
-    if face_recognition_module is None:
+    # (module is initialized only once when server is started)
+    if face_recognition_service is None or not face_recognition_service.is_started():
         res = {
             RESULT_CODE_NAME: ResultCode.NotInitialized.value,
             RESULT_DETAIL_NAME: "module is not initialized!"
         }
         return jsonify(res)
 
-    # run inference
-    run_start_time = time.time()
-    face_recognition_module.run()
-    run_process_time = time.time() - run_start_time
+    # run inference on warm module
+    try:
+        face_result, run_process_time = face_recognition_service.recognize()
+    except Exception as e:
+        res = {
+            RESULT_CODE_NAME: ResultCode.UnknownError.value,
+            RESULT_DETAIL_NAME: "{}: {}".format(type(e).__name__, e)
+        }
+        return jsonify(res)
 
     # get result and response
-    face_result = face_recognition_module.get_result()
     res = {
         RESULT_CODE_NAME: ResultCode.OK.value,
         RESULT_TIME_NAME: run_process_time,
@@ -55,6 +69,141 @@ def face_recognition():
     return jsonify(res)
 
 
+@app.route("/detect", methods=["POST"])
+def detect():
+    """
+    detect objects in uploaded JPEG/PNG images.
+    images are sent as multipart form files of "image" field (several files are allowed)
+    or as raw request body with image content type.
+    detections are returned as json, or as bytes of NeoDetections.to_structured_array if "format=binary" is set.
+    """
+    # check the whether detection module is initialized
+    if detection_scheduler is None:
+        res = {
+            RESULT_CODE_NAME: ResultCode.NotInitialized.value,
+            RESULT_DETAIL_NAME: "detection module is not initialized!"
+        }
+        return jsonify(res)
+
+    # decode images in memory
+    try:
+        images = decode_request_images(request)
+    except InvalidImageError as e:
+        res = {
+            RESULT_CODE_NAME: ResultCode.InvalidRequest.value,
+            RESULT_DETAIL_NAME: str(e)
+        }
+        return jsonify(res)
+
+    # each image is submitted to shared scheduler, so images of concurrent requests are run as one batch
+    try:
+        run_start_time = time.time()
+        futures = [detection_scheduler.submit(image, (image.shape[1], image.shape[0])) for image in images]
+        results = [future.result() for future in futures]
+        run_process_time = time.time() - run_start_time
+    except Exception as e:
+        res = {
+            RESULT_CODE_NAME: ResultCode.UnknownError.value,
+            RESULT_DETAIL_NAME: "{}: {}".format(type(e).__name__, e)
+        }
+        return jsonify(res)
+
+    detections_list = [result.get_detections() for result in results]
+    if request.args.get("format") == "binary":
+        return create_binary_detections_response(detections_list, run_process_time)
+
+    # get result and response
+    res = {
+        RESULT_CODE_NAME: ResultCode.OK.value,
+        RESULT_TIME_NAME: run_process_time,
+        RESULT_DETECTIONS_NAME: [convert_detections_to_json(detections) for detections in detections_list]
+    }
+    return jsonify(res)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # export histograms of each stage, queue depth and dropped frames for Prometheus
+    return Response(REGISTRY.export_prometheus_text(), mimetype=METRICS_CONTENT_TYPE)
+
+
+@app.route("/profile", methods=["GET", "POST"])
+def profile():
+    """
+    POST : request profiling of the next frames ("frames" and "memory" query parameters are optional).
+    GET : get state of profilers and path of the last reports.
+    """
+    profiled_names = []
+    if request.method == "POST":
+        frame_count = request.args.get("frames", DEFAULT_FRAME_COUNT, type=int)
+        with_memory = request.args.get("memory", "1") != "0"
+        profiled_names = request_profiling(frame_count, with_memory)
+
+    res = {
+        RESULT_CODE_NAME: ResultCode.OK.value,
+        "requested_profilers": profiled_names,
+        "profilers": [{"name": profiler.get_name(), "active": profiler.is_active(),
+                       "last_report": profiler.get_last_report_path()} for profiler in get_profilers()]
+    }
+    return jsonify(res)
+
+
+def decode_request_images(req):
+    """
+    decode uploaded images without temporary files.
+    :param req: flask.Request
+    :return: list
+        list of BGR images.
+    """
+    if req.files:
+        data_list = [file.read() for file in req.files.getlist(DETECT_IMAGE_FIELD_NAME)]
+    elif req.mimetype.startswith("image/") or req.mimetype == "application/octet-stream":
+        data_list = [req.get_data()]
+    else:
+        data_list = []
+    if not data_list:
+        raise InvalidImageError("image is not found! Please send it as '{}' form field or request body.".format(
+            DETECT_IMAGE_FIELD_NAME))
+
+    images = []
+    for i, data in enumerate(data_list):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise InvalidImageError("{}th image can't be decoded!".format(i))
+        images.append(image)
+    return images
+
+
+def convert_detections_to_json(detections):
+    # columnar format is more compact than list of each detection
+    return {
+        "class_id": detections.class_ids.tolist(),
+        "score": np.round(detections.scores, 4).tolist(),
+        "box": np.round(detections.boxes, 1).tolist()
+    }
+
+
+def create_binary_detections_response(detections_list, run_process_time):
+    # image index of structured array is index in request
+    arrays = []
+    for i, detections in enumerate(detections_list):
+        array = detections.to_structured_array()
+        array["image_index"] = i
+        arrays.append(array)
+    array = np.concatenate(arrays)
+
+    response = Response(array.tobytes(), mimetype="application/octet-stream")
+    response.headers["X-Result-Code"] = str(ResultCode.OK.value)
+    response.headers["X-Result-Time"] = str(run_process_time)
+    response.headers["X-Image-Count"] = str(len(detections_list))
+    response.headers["X-Detection-Dtype"] = str(array.dtype.descr)
+    return response
+
+
+class InvalidImageError(Exception):
+    pass
+
+
 def set_server_method():
     # fix bug of macOS
     if platform.system() == 'Darwin':
@@ -66,28 +215,102 @@ def set_server_method():
 
 
 def get_recognition_module(param, frame_count_with_use_face_recog, reduction_ratio):
+    from face_recognition_util import FaceRecognitionMode, RealTimeFaceRecognition
     recognition = RealTimeFaceRecognition(debug_mode=True,
                                           video_capture_params=param,
                                           face_recognition_mode=FaceRecognitionMode.OneFaceRecognitionMode,
                                           frame_count_with_use_face_recog=frame_count_with_use_face_recog,
                                           reduction_ratio=reduction_ratio
                                           )
-    recognition.setup()
     return recognition
 
 
-def initialize_module():
+def initialize_module(source=0):
+    # face recognition modules (face_recognition and dlib) are imported only when face api is enabled
+    from face_recognition_util import VideoCaptureParams
+
     set_server_method()
     param = VideoCaptureParams()
-    return get_recognition_module(param, 50, 4)
+    param.source = source
+
+    # video capture, face encodings and worker processes are kept by service
+    service = FaceRecognitionService(get_recognition_module(param, 50, 4))
+    service.start()
+    return service
+
+
+def initialize_detection_module(model_type, model_root_path, target_device, max_batch_size, max_batch_wait_time,
+                                warm_up_count):
+    # object detection modules are imported only when detection api is enabled
+    from neo_wrapper import SageMakerNeoWrapper, NeoParameters
+    from neo_batch_scheduler import NeoBatchScheduler
+    from argument_parser_util import convert_model_define
+
+    # boxes are returned as values, so they are not drawn into images
+    param = NeoParameters(model_define=convert_model_define(model_type),
+                          model_root_path=model_root_path,
+                          target_device=target_device,
+                          is_draw_box=False,
+                          max_batch_size=max_batch_size,
+                          max_batch_wait_time=max_batch_wait_time,
+                          warm_up_count=warm_up_count)
+
+    # runtime is warmed up in "load" not to make the first request slow
+    wrapper = SageMakerNeoWrapper(param)
+    wrapper.load()
+
+    scheduler = NeoBatchScheduler(wrapper)
+    scheduler.start()
+    return scheduler
+
+
+def create_argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--disable_face", action="store_true", help="disable face recognition api.")
+    parser.add_argument("--source", default="0",
+                        help="set frame source of face recognition. default value is '0'(camera)")
+    parser.add_argument(
+        "--detect_model_type",
+        default=None,
+        help="enable object detection api with model type. you can select it from 'tf_ssd', 'mx_ssd'."
+    )
+    parser.add_argument("--model_root_path", default="model", help="set model root path.")
+    parser.add_argument("--target_device", default="cpu", help="set target device.")
+    parser.add_argument("--max_batch_size", type=int, default=8, help="set max batch size of detection.")
+    parser.add_argument("--max_batch_wait_time", type=float, default=0.005,
+                        help="set time[sec] to wait other detection requests.")
+    parser.add_argument("--warm_up_count", type=int, default=3,
+                        help="set count of warm up inferences before server starts. warm up is disabled if it is 0.")
+    parser.add_argument("--metrics_log_interval", type=float, default=60.0,
+                        help="set interval[sec] of metrics log line. log is disabled if it is 0.")
+    parser.add_argument("--debug", action="store_true",
+                        help="enable debug mode of flask. don't use it on public network because debugger is exposed.")
+    return parser
 
 
 if __name__ == "__main__":
+    args = create_argument_parser().parse_args()
+
     # initialize
-    initialize_module()
+    if not args.disable_face:
+        face_recognition_service = initialize_module(args.source)
+    if args.detect_model_type is not None:
+        detection_scheduler = initialize_detection_module(args.detect_model_type, args.model_root_path,
+                                                          args.target_device, args.max_batch_size,
+                                                          args.max_batch_wait_time, args.warm_up_count)
+
+    # profiling is also requested by signal (ex. "kill -USR1 <pid>")
+    install_signal_handler()
+
+    # write summary of metrics periodically
+    if args.metrics_log_interval > 0:
+        MetricsLogger(REGISTRY, args.metrics_log_interval).start()
 
-    # debug mode
-    app.debug = True
+    # debug mode (it is disabled as default not to expose debugger)
+    app.debug = args.debug
 
     # enable to access from each place
-    app.run(host='0.0.0.0')
+    # (reloader is disabled not to initialize module twice)
+    # (threaded server is needed to batch concurrent detection requests)
+    app.run(host='0.0.0.0', port=args.port, use_reloader=False, threaded=True)
@@ -0,0 +1,235 @@
+import asyncio
+import argparse
+import json
+import os
+import platform
+from multiprocessing import set_start_method
+from face_recognition_service import FaceRecognitionService, FakeFaceRecognitionService
+from metrics import REGISTRY
+from api_result import RESULT_CODE_NAME, RESULT_DETAIL_NAME, RESULT_TIME_NAME, RESULT_FACE_NAME, ResultCode
+
+
+# environment variable to use fake service (ex. "FACE_API_FAKE=1 uvicorn web_api_async:app")
+FAKE_SERVICE_ENV_NAME = "FACE_API_FAKE"
+
+# content type of Prometheus text format
+METRICS_CONTENT_TYPE = b"text/plain; version=0.0.4; charset=utf-8"
+
+
+class RecognitionCoalescer:
+    def __init__(self, service, coalesce_window=0.05, max_waiters=64):
+        """
+        initialize coalescer which shares one recognition run with concurrent requests.
+        requests which arrive within "coalesce_window" or while a run is in flight receive its result.
+        :param service: FaceRecognitionService
+            service which is already started.
+        :param coalesce_window: float
+            time[sec] to wait other requests before run is started.
+        :param max_waiters: int
+            max count of requests which wait result. ServerBusyError is raised if it is exceeded.
+        """
+        self.__service = service
+        self.__coalesce_window = coalesce_window
+        self.__max_waiters = max_waiters
+        self.__shared_run = None
+        self.__waiter_count = 0
+
+    def get_waiter_count(self):
+        return self.__waiter_count
+
+    async def recognize(self):
+        """
+        wait result of shared recognition run.
+        :return: tuple
+            (FaceRecognitionResult, process time[sec])
+        """
+        # back-pressure
+        if self.__waiter_count >= self.__max_waiters:
+            raise ServerBusyError("{} requests are already waiting!".format(self.__waiter_count))
+
+        self.__waiter_count += 1
+        try:
+            if self.__shared_run is None:
+                self.__shared_run = asyncio.ensure_future(self.__run_shared())
+
+            # cancellation of one request must not cancel shared run
+            return await asyncio.shield(self.__shared_run)
+        finally:
+            self.__waiter_count -= 1
+
+    async def __run_shared(self):
+        try:
+            await asyncio.sleep(self.__coalesce_window)
+            return await asyncio.wrap_future(self.__service.submit())
+        finally:
+            # next request starts new run
+            self.__shared_run = None
+
+
+class ServerBusyError(Exception):
+    pass
+
+
+def create_app(service_factory, coalesce_window=0.05, max_waiters=64):
+    """
+    create ASGI application of face recognition api.
+    service is started at lifespan startup event, or at the first request if server doesn't send lifespan events.
+    :param service_factory: function
+        function which returns FaceRecognitionService (or FakeFaceRecognitionService).
+    :param coalesce_window: float
+    :param max_waiters: int
+    :return: function
+        ASGI application.
+    """
+    state = {"startup": None, "service": None, "coalescer": None}
+
+    async def start_service():
+        # setup opens camera and loads face data, so it is done on other thread
+        service = service_factory()
+        await asyncio.get_running_loop().run_in_executor(None, service.start)
+        state["service"] = service
+        state["coalescer"] = RecognitionCoalescer(service, coalesce_window, max_waiters)
+
+    async def startup():
+        # service is started only once even if many requests arrive before it is started
+        if state["startup"] is None:
+            state["startup"] = asyncio.ensure_future(start_service())
+        startup_future = state["startup"]
+        try:
+            await startup_future
+        except Exception:
+            # failed startup is not reused, so it is retried by next request
+            if state["startup"] is startup_future:
+                state["startup"] = None
+            raise
+
+    async def shutdown():
+        if state["service"] is not None:
+            await asyncio.get_running_loop().run_in_executor(None, state["service"].stop)
+            state["startup"] = None
+            state["service"] = None
+            state["coalescer"] = None
+
+    async def handle_face():
+        try:
+            if state["coalescer"] is None:
+                await startup()
+            face_result, run_process_time = await state["coalescer"].recognize()
+        except ServerBusyError as e:
+            return 503, {RESULT_CODE_NAME: ResultCode.ServerBusy.value, RESULT_DETAIL_NAME: str(e)}
+        except Exception as e:
+            return 200, {
+                RESULT_CODE_NAME: ResultCode.UnknownError.value,
+                RESULT_DETAIL_NAME: "{}: {}".format(type(e).__name__, e)
+            }
+
+        return 200, {
+            RESULT_CODE_NAME: ResultCode.OK.value,
+            RESULT_TIME_NAME: run_process_time,
+            RESULT_FACE_NAME: face_result.FaceName
+        }
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    try:
+                        await startup()
+                    except Exception as e:
+                        # server exits when startup is failed
+                        await send({"type": "lifespan.startup.failed", "message": "{}: {}".format(type(e).__name__, e)})
+                        return
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        elif scope["type"] == "http":
+            if scope["path"] == "/metrics" and scope["method"] == "GET":
+                await send_text(send, 200, REGISTRY.export_prometheus_text(), METRICS_CONTENT_TYPE)
+                return
+            if scope["path"] == "/face" and scope["method"] == "GET":
+                status, res = await handle_face()
+            else:
+                status, res = 404, {RESULT_CODE_NAME: ResultCode.UnknownError.value, RESULT_DETAIL_NAME: "not found"}
+            await send_json(send, status, res)
+        else:
+            raise NotImplementedError("{} scope is not supported!".format(scope["type"]))
+
+    return app
+
+
+async def send_json(send, status, res):
+    await send_text(send, status, json.dumps(res), b"application/json")
+
+
+async def send_text(send, status, text, content_type):
+    body = text.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def set_server_method():
+    # fix bug of macOS
+    if platform.system() == 'Darwin':
+        try:
+            set_start_method('forkserver')
+        except RuntimeError:
+            print("RuntimeError: context has already been set")
+            pass
+
+
+def create_face_recognition_service():
+    # face recognition modules are imported only when real service is used
+    from face_recognition_util import FaceRecognitionMode, VideoCaptureParams, RealTimeFaceRecognition
+
+    set_server_method()
+    recognition = RealTimeFaceRecognition(debug_mode=True,
+                                          video_capture_params=VideoCaptureParams(),
+                                          face_recognition_mode=FaceRecognitionMode.OneFaceRecognitionMode,
+                                          frame_count_with_use_face_recog=50,
+                                          reduction_ratio=4
+                                          )
+    return FaceRecognitionService(recognition)
+
+
+def create_service_from_env():
+    if os.environ.get(FAKE_SERVICE_ENV_NAME, "0") == "1":
+        return FakeFaceRecognitionService()
+    return create_face_recognition_service()
+
+
+# ASGI application (ex. "uvicorn web_api_async:app --host 0.0.0.0 --port 5000")
+app = create_app(create_service_from_env)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--fake", action="store_true", help="use fake service instead of camera.")
+    parser.add_argument("--coalesce_window", type=float, default=0.05)
+    parser.add_argument("--max_waiters", type=int, default=64)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("uvicorn is needed to start async api server. please install it with 'pip3 install uvicorn'.")
+        return
+
+    service_factory = FakeFaceRecognitionService if args.fake else create_face_recognition_service
+    uvicorn.run(create_app(service_factory, args.coalesce_window, args.max_waiters), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()